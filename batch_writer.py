@@ -0,0 +1,210 @@
+"""
+One background writer per process for every intake session.
+
+Each session used to read the whole sheet, change its own copy and write the
+full frame back, so two terminals submitting at once both waited on a large
+upload and the later one silently dropped the other's row. Sessions now hand
+their insert or edit to BatchWriter and wait for the acknowledgement. A
+single thread drains the queue, checks every write against the replica and
+sends whatever piled up as one append plus one batch of keyed edits.
+
+Checks are keyed on (ID, Date) and run in one replica.transaction() with the
+writes; the rows an edit targets are re-read from the store first:
+  - an insert is refused if that visit already exists (unless unique=False);
+  - an import (insert_many) is refused as a whole if any of its visits does;
+  - an edit carries the values the session loaded (`expected`) and is
+    refused if the stored visit no longer has them, i.e. someone else
+    changed it in the meantime.
+Refused writes fail with ConflictError; the others are acknowledged once
+the backend call that stored them has returned.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from visit_index import date_key, id_key
+
+
+class ConflictError(Exception):
+    """A write was refused by the (ID, Date) concurrency check."""
+
+
+def _comparable(value):
+    """Normalizes a cell so "101", 101 and 101.0 compare equal and "" / None / NaN are all missing."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _changed(current, expected):
+    """Columns whose stored value differs from what the session loaded."""
+    return [col for col, value in expected.items() if _comparable(current.get(col)) != _comparable(value)]
+
+
+class PendingWrite:
+    """One queued insert or edit. result() blocks until it is stored or refused."""
+
+    def __init__(self, kind, patient_id, date, values, expected=None, unique=True):
+        self.kind = kind
+        self.key = (id_key(patient_id), date_key(date))
+        self.values = values
+        self.expected = expected
+        self.unique = unique
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def result(self, timeout=None):
+        """Waits for the writer; raises ConflictError (or the backend error) if the write did not go through."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("The write was not acknowledged in time")
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class BatchWriter:
+    """
+    Serializes all writes of a process through one thread.
+
+    The thread waits for a write, then keeps collecting for `linger` seconds
+    (or until `max_batch` writes) so concurrent submits share one round trip.
+    Edits to the same visit within a batch are merged into one keyed write.
+    """
+
+    def __init__(self, replica, max_batch=500, linger=0.02):
+        self.replica = replica
+        self.max_batch = max_batch
+        self.linger = linger
+        self.stats = Counter()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def insert(self, row, unique=True):
+        """Queues a new visit (dict in sheet layout)."""
+        return self.submit(PendingWrite("insert", row.get("ID"), row.get("Date"), dict(row), unique=unique))
+
+    def edit(self, patient_id, date, values, expected=None):
+        """Queues changes to the visit (patient_id, date); `expected` is {column: value as loaded}."""
+        return self.submit(PendingWrite("edit", patient_id, date, dict(values), expected=expected))
+
+    def insert_many(self, rows):
+        """
+        Queues a frame of new visits (sheet layout, e.g. from visit_import) as
+        one write: all of them are appended together, or none if any of their
+        (ID, Date) keys is taken by then.
+        """
+        return self.submit(PendingWrite("import", None, None, rows.reset_index(drop=True)))
+
+    def submit(self, write):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(write)
+        return write
+
+    # ----------------- Writer Thread -----------------
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._apply(batch)
+            except Exception as error:
+                for write in batch:
+                    if not write._done.is_set():
+                        write.finish(error)
+
+    def _apply(self, batch):
+        with self.replica.transaction():
+            accepted = self._check_and_write(batch)
+        # Acknowledged only once the transaction committed.
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(accepted)
+        for write in accepted:
+            write.finish()
+
+    def _check_and_write(self, batch):
+        """Refuses the writes that fail their check and sends the others; returns those."""
+        replica = self.replica
+        frame = replica.sync()
+        index = replica.index
+        targets = {index.position(*write.key) for write in batch if write.kind == "edit"} - {None}
+        if targets:
+            # Another process may have edited them without the marker showing it yet.
+            frame = replica.refresh_rows(sorted(targets))
+            index = replica.index
+
+        rows, imports, new_visits, imported, edits, accepted = [], [], {}, set(), {}, []
+        for write in batch:
+            if write.kind == "import":
+                keys = list(zip(map(id_key, write.values["ID"]), map(date_key, write.values["Date"])))
+                taken = sum(index.position(*key) is not None or key in new_visits or key in imported for key in keys)
+                taken += len(keys) - len(set(keys))
+                if taken:
+                    write.finish(ConflictError(f"{taken} of the visits already exist, check the file again"))
+                    self.stats["conflicts"] += 1
+                    continue
+                imports.append(write.values)
+                imported.update(keys)
+            elif write.kind == "insert":
+                if write.unique and (index.position(*write.key) is not None or write.key in new_visits
+                                     or write.key in imported):
+                    write.finish(ConflictError(f"patient {write.key[0]} already has a visit on {write.key[1]}, use Edit Patient"))
+                    self.stats["conflicts"] += 1
+                    continue
+                rows.append(write.values)
+                new_visits.setdefault(write.key, write.values)
+            else:
+                target = new_visits.get(write.key)
+                if target is None:
+                    position = index.position(*write.key)
+                    if position is None:
+                        write.finish(ConflictError(f"patient {write.key[0]} has no visit on {write.key[1]}"))
+                        self.stats["conflicts"] += 1
+                        continue
+                    target = edits.setdefault(position, {})
+                    current = {**frame.iloc[position].to_dict(), **target}
+                else:
+                    current = target
+                stale = _changed(current, write.expected or {})
+                if stale:
+                    write.finish(ConflictError(
+                        f"the visit of patient {write.key[0]} on {write.key[1]} was changed at another terminal "
+                        f"({', '.join(stale)}), reload it and try again"
+                    ))
+                    self.stats["conflicts"] += 1
+                    continue
+                target.update(write.values)
+            accepted.append(write)
+
+        if rows or imports:
+            replica.append(pd.concat(([pd.DataFrame(rows)] if rows else []) + imports, ignore_index=True))
+        edits = {position: values for position, values in edits.items() if values}
+        if edits:
+            replica.update_rows(edits)
+        return accepted
@@ -0,0 +1,1144 @@
+"""
+Offline benchmarks for the clinic apps.
+
+Everything runs against LocalSheetConnection, the in-memory stand-in for the
+Google Sheets connection, so no credentials or network are needed. These
+only time things; whether the results are right is checked by the tests
+(python -m pytest tests).
+
+    python benchmark.py            # run everything
+    python benchmark.py append     # run one benchmark
+    python benchmark.py suite --sizes 10000,1000000 --json after.json --compare before.json
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+from datetime import time as datetime_time
+
+import numpy as np
+import pandas as pd
+
+from clinic_metrics import ClinicMetrics
+from storage import LocalSheetConnection, SheetReplica, SQLiteBackend
+from synthetic import sheet_visits, write_cleaned_csv
+from visit_index import RecentVisits, VisitIndex
+from visit_schema import TIME_COLUMNS, format_dates, to_sheet, to_typed
+
+
+def _timed(fn, repeats):
+    """Median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+# ----------------- Benchmarks -----------------
+def bench_append(sizes=(1_000, 10_000, 100_000), repeats=5, row_latency=5e-6):
+    """Insert latency of one visit: row append vs. the old full-sheet rewrite."""
+    print(f"{'rows':>8} {'append ms':>10} {'rewrite ms':>11} {'rows sent (append/rewrite)':>28}")
+    new_row = sheet_visits(1, seed=1)
+    for n in sizes:
+        conn = LocalSheetConnection(sheet_visits(n), row_latency=row_latency)
+        replica = SheetReplica(conn)
+        replica.sync()
+
+        written = conn.rows_written
+        append_ms = _timed(lambda: replica.append(new_row), repeats)
+        append_rows = (conn.rows_written - written) // repeats
+
+        written = conn.rows_written
+        rewrite_ms = _timed(lambda: replica.write(pd.concat([replica.sync(), new_row], ignore_index=True)), repeats)
+        rewrite_rows = (conn.rows_written - written) // repeats
+        print(f"{n:>8} {append_ms:>10.2f} {rewrite_ms:>11.2f} {append_rows:>13} / {rewrite_rows}")
+
+
+def bench_lookup(sizes=(10_000, 100_000, 1_000_000), repeats=50):
+    """Edit Patient lookup: the old three mask scans vs. the ID / (ID, Date) index."""
+    print(f"{'visits':>9} {'scan ms':>9} {'index ms':>9} {'index build ms':>15}")
+    for n in sizes:
+        data = sheet_visits(n)
+        probe = data.iloc[n // 2]
+        patient_id, date = probe["ID"], probe["Date"]
+
+        def scan():
+            if patient_id in data["ID"].values:
+                data.loc[data["ID"] == patient_id].to_dict(orient="records")
+            data[(data["ID"] == patient_id) & (data["Date"] == date)]
+            data.loc[(data["ID"] == patient_id) & (data["Date"] == date)]
+
+        start = time.perf_counter()
+        index = VisitIndex.build(data)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def lookup():
+            [data.iloc[pos].to_dict() for pos in index.visits(patient_id)]
+            index.position(patient_id, date)
+
+        print(f"{n:>9} {_timed(scan, repeats):>9.3f} {_timed(lookup, repeats):>9.3f} {build_ms:>15.1f}")
+
+
+def bench_schema(n=1_000_000):
+    """Memory per row and parse time of the typed schema vs. the raw "HH:MM" string frame."""
+    raw = sheet_visits(n)
+    raw_bytes = raw.memory_usage(deep=True).sum()
+
+    start = time.perf_counter()
+    typed = to_typed(raw)
+    parse_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pd.to_datetime(raw["Date"], format="%m/%d/%Y")
+    for col in TIME_COLUMNS:
+        pd.to_timedelta(raw[col] + ":00")
+    old_parse_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    back = to_sheet(typed)
+    write_s = time.perf_counter() - start
+
+    typed_bytes = typed.memory_usage(deep=True).sum()
+    lossless = all(back[col].astype(object).equals(raw[col].astype(object)) for col in raw.columns)
+    print(f"rows {n}: raw {raw_bytes / n:.0f} B/row, typed {typed_bytes / n:.0f} B/row")
+    print(f"to_typed {parse_s:.2f}s (old per-column to_datetime/to_timedelta {old_parse_s:.2f}s), "
+          f"to_sheet {write_s:.2f}s, round trip lossless: {lossless}")
+
+
+def bench_recent(n=100_000, repeats=20):
+    """"Last 20 Entries": the old parse + full sort vs. the maintained RecentVisits ordering."""
+    data = sheet_visits(n)
+
+    def full_sort():
+        existing_data = data.copy()
+        existing_data["Date_dt"] = pd.to_datetime(existing_data["Date"], format="%m/%d/%Y", errors="coerce")
+        existing_data["Registration_Start_td"] = pd.to_timedelta(existing_data["Registration Start"] + ":00")
+        sorted_data = existing_data.sort_values(by=["Date_dt", "Registration_Start_td"], ascending=[True, False])
+        sorted_data.drop(columns=["Date_dt", "Registration_Start_td"]).head(20)
+
+    typed = to_typed(data)
+    start = time.perf_counter()
+    recent = RecentVisits.build(typed)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    new_rows = to_typed(sheet_visits(1, seed=2))
+    size = [n]
+
+    def append_and_page():
+        recent.extend(new_rows, size[0])
+        size[0] += 1
+        data.iloc[[pos for pos in recent.page(0, 20) if pos < n]]
+
+    print(f"rows {n}: full sort {_timed(full_sort, repeats):.1f} ms, "
+          f"page 0 {_timed(lambda: data.iloc[recent.page(0, 20)], repeats):.3f} ms, "
+          f"page 50 {_timed(lambda: data.iloc[recent.page(50, 20)], repeats):.3f} ms, "
+          f"append + page {_timed(append_and_page, repeats):.3f} ms (one-time build {build_ms:.1f} ms)")
+
+
+def bench_metrics(sizes=(10_000, 1_000_000), repeats=20):
+    """Clinic Metrics reads: the old full-frame scans vs. the maintained ClinicMetrics counters."""
+    print(f"{'visits':>9} {'scan ms':>9} {'counters ms':>12} {'insert ms':>10} {'reconcile':>10}")
+    for n in sizes:
+        typed = to_typed(sheet_visits(n))
+        day = typed["Date"].iloc[-1]
+
+        def scan():
+            len(typed)
+            (typed["Date"] == day).sum()
+            typed["Appointment Type"].mode()[0]
+            typed.loc[typed["Date"] == day, "Staff"].value_counts()
+
+        metrics = ClinicMetrics.build(typed)
+
+        def read():
+            metrics.total
+            metrics.patients_on(day)
+            metrics.most_common_appointment()
+            metrics.patients_per_doctor(day)
+
+        new_rows = to_typed(sheet_visits(1, seed=3))
+        insert_ms = _timed(lambda: metrics.add_rows(new_rows), repeats)
+        for _ in range(repeats):
+            metrics.remove_rows(new_rows)
+        drift = metrics.reconcile(typed)
+        print(f"{n:>9} {_timed(scan, repeats):>9.2f} {_timed(read, repeats):>12.3f} {insert_ms:>10.3f} "
+              f"{'ok' if not drift else len(drift):>10}")
+
+
+def bench_backends(n=100_000, repeats=5, latency=0.3, row_latency=5e-6):
+    """
+    The replica on the simulated Google Sheet (round-trip latency per call)
+    vs. on a local SQLite file: insert, edit, tail sync and a full read.
+    """
+    import os
+    import tempfile
+
+    data = sheet_visits(n)
+    new_row = sheet_visits(1, seed=1)
+    other_row = sheet_visits(1, seed=2)
+    print(f"{'backend':>8} {'append ms':>10} {'edit ms':>8} {'tail sync ms':>13} {'full read ms':>13}")
+    with tempfile.TemporaryDirectory() as folder:
+        sqlite_path = os.path.join(folder, "clinic.db")
+        SQLiteBackend(sqlite_path).update(data)
+        backends = {
+            "gsheets": LocalSheetConnection(data, latency=latency, row_latency=row_latency),
+            "sqlite": SQLiteBackend(sqlite_path),
+        }
+        for name, backend in backends.items():
+            replica = SheetReplica(backend)
+            replica.sync()
+            append_ms = _timed(lambda: replica.append(new_row), repeats)
+            edit_ms = _timed(lambda: replica.update_row(n // 2, {"Registration Start": "08:15"}), repeats)
+            # Another writer appends a row; the next sync fetches just that tail.
+            tail_ms = _timed(lambda: (backend.append_rows(other_row), replica.sync()), repeats)
+            full_ms = _timed(backend.read_all, 1)
+            print(f"{name:>8} {append_ms:>10.2f} {edit_ms:>8.2f} {tail_ms:>13.2f} {full_ms:>13.1f}")
+
+
+def bench_writer(sessions=8, visits_per_session=25, increments_per_session=10, latency=0.05, row_latency=5e-6,
+                 rows=5_000):
+    """
+    Load test: `sessions` front-desk terminals submitting at once.
+
+    Each session first adds its own visits, then repeatedly bumps the Room
+    number of one shared visit (read, +1, edit with the value it read as
+    `expected`, retry on conflict). With no lost updates every visit is
+    stored exactly once and the shared Room ends at start + sessions *
+    increments. The sessions share one replica and writer, then are split
+    over two (two processes on one sheet); the old read-modify-rewrite path
+    is run the same way.
+    """
+    import threading
+
+    from batch_writer import BatchWriter, ConflictError
+
+    data = sheet_visits(rows)
+    data.loc[0, "Room"] = "100"  # a numbered room, so it can be counted up
+    shared_id, shared_date = int(data.at[0, "ID"]), data.at[0, "Date"]
+    start_room = int(data.at[0, "Room"])
+
+    new_visits = sheet_visits(sessions * visits_per_session, seed=1)
+    new_visits["ID"] = range(2_000_000, 2_000_000 + len(new_visits))  # outside sheet_visits' ID range
+
+    def visit(session, number):
+        return new_visits.iloc[session * visits_per_session + number].to_dict()
+
+    expected_ids = [visit(session, number)["ID"] for session in range(sessions) for number in range(visits_per_session)]
+
+    def run_sessions(work):
+        """Runs work(session) on one thread per session; returns the wall time in seconds."""
+        threads = [threading.Thread(target=work, args=(session,)) for session in range(sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def report(name, conn, insert_s, increment_s, extra=""):
+        final = conn.read_all()
+        stored_ids = final["ID"].value_counts()
+        lost_visits = sum(stored_ids.get(visit_id, 0) != 1 for visit_id in expected_ids)
+        lost_increments = start_room + sessions * increments_per_session - int(final.at[0, "Room"])
+        print(f"{name:<18} inserts {len(expected_ids) / insert_s:6.1f}/s, "
+              f"increments {sessions * increments_per_session / increment_s:5.1f}/s, "
+              f"lost visits {lost_visits}, lost increments {lost_increments}{extra}")
+
+    def run_batched(name, processes):
+        """The sessions spread over `processes` replicas, each with its own writer, on one sheet."""
+        conn = LocalSheetConnection(data, latency=latency, row_latency=row_latency)
+        replicas = [SheetReplica(conn) for _ in range(processes)]
+        writers = [BatchWriter(replica) for replica in replicas]
+        retries = []
+
+        def add_visits(session):
+            writer = writers[session % processes]
+            for write in [writer.insert(visit(session, number)) for number in range(visits_per_session)]:
+                write.result()
+
+        def increment(session):
+            replica, writer = replicas[session % processes], writers[session % processes]
+            for _ in range(increments_per_session):
+                while True:
+                    frame = replica.sync()
+                    room = frame.at[replica.index.position(shared_id, shared_date), "Room"]
+                    try:
+                        writer.edit(shared_id, shared_date, {"Room": int(room) + 1}, expected={"Room": room}).result()
+                        break
+                    except ConflictError:
+                        retries.append(session)
+
+        insert_s = run_sessions(add_visits)
+        increment_s = run_sessions(increment)
+        calls = {name: count for name, count in conn.calls.items() if name in ("append_rows", "update_by_key", "update")}
+        batches = sum(writer.stats["batches"] for writer in writers)
+        report(name, conn, insert_s, increment_s,
+               f", conflicts retried {len(retries)}, {batches} batches, backend writes {calls}")
+
+    run_batched("batched writer", 1)
+    run_batched("two replicas", 2)
+
+    # The old path: every session reads the whole sheet, edits its copy and rewrites it.
+    conn = LocalSheetConnection(data, latency=latency, row_latency=row_latency)
+
+    def add_visits_rewrite(session):
+        for number in range(visits_per_session):
+            sheet = conn.read()
+            conn.update(data=pd.concat([sheet, pd.DataFrame([visit(session, number)])], ignore_index=True))
+
+    def increment_rewrite(session):
+        for _ in range(increments_per_session):
+            sheet = conn.read()
+            sheet.at[0, "Room"] = str(int(sheet.at[0, "Room"]) + 1)
+            conn.update(data=sheet)
+
+    insert_s = run_sessions(add_visits_rewrite)
+    increment_s = run_sessions(increment_rewrite)
+    report("read-modify-write", conn, insert_s, increment_s, f", backend writes {{'update': {conn.calls['update']}}}")
+
+
+def _load_in_subprocess(code):
+    """Runs `code` in a fresh interpreter; returns (seconds, peak RSS in MB) it reports."""
+    import subprocess
+
+    # VmHWM is this process's own peak; ru_maxrss would carry over the parent's after fork.
+    script = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"{code}\n"
+        "elapsed = time.perf_counter() - start\n"
+        "peak = [line for line in open('/proc/self/status') if line.startswith('VmHWM')][0]\n"
+        "print(elapsed, int(peak.split()[1]) / 1024)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    seconds, megabytes = output.split()[-2:]
+    return float(seconds), float(megabytes)
+
+
+def bench_dashboard_load(n=1_000_000):
+    """
+    Dashboard cold start on a synthetic multi-year CSV: parsing the CSV vs.
+    building the Arrow cache once vs. loading from the cache. Each path runs
+    in a fresh interpreter so time and peak memory are those of a restart.
+    """
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "visits.csv")
+        write_cleaned_csv(path, n)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"{n} visits, CSV {size_mb:.0f} MB")
+        baseline = _load_in_subprocess("import pandas")
+        runs = {
+            "csv parse": f"from dashboard_data import build_visits; build_visits({path!r})",
+            "cache build": f"from dashboard_data import load_visits; load_visits({path!r})",
+            "cache load": f"from dashboard_data import load_visits; load_visits({path!r})",
+        }
+        for name, code in runs.items():
+            seconds, megabytes = _load_in_subprocess(code)
+            print(f"{name:>12}: {seconds:6.2f} s, peak RSS {megabytes:6.0f} MB "
+                  f"({megabytes - baseline[1]:.0f} MB over a bare pandas import)")
+        cache_mb = os.path.getsize(os.path.join(folder, ".visits.csv.arrow")) / 2**20
+        print(f"cache file {cache_mb:.0f} MB")
+
+
+def bench_derive(n=1_000_000):
+    """
+    Dashboard derivations at n visits: the old panel code (four to_datetime
+    calls, three filtered copies, Week/Month via a per-row lambda) vs. the
+    one-pass derive() from dashboard_data, followed by the panel reads.
+    """
+    from dashboard_data import derive
+
+    rng = np.random.default_rng(0)
+    categories = ["Lab Work", "Follow-up", "Other", "Hypertension", "Diabetes", "Physical", "Rx Refill"]
+    frame = pd.DataFrame({
+        "Date": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365, n), unit="D"),
+        "Visit Category": rng.choice(categories, n),
+    })
+    excluded = ["other", "hypertension", "diabetes"]
+
+    def old_panels():
+        df = frame.copy()  # st.cache_data handed each run its own copy
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df["Visit Category"].loc[~df["Visit Category"].str.lower().isin(excluded)].value_counts()
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        filtered_df = df[df["Visit Category"].str.lower() != "other"].copy()
+        filtered_df["Week"] = filtered_df["Date"].dt.to_period("W").apply(lambda r: r.start_time)
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df[df["Visit Category"].str.lower() != "other"]
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        filtered_df = df[~df["Visit Category"].str.lower().isin(excluded)].copy()
+        filtered_df["Month"] = filtered_df["Date"].dt.to_period("M").apply(lambda r: r.start_time)
+        return filtered_df.groupby(["Month", "Visit Category"]).size().unstack().fillna(0)
+
+    derived = derive(frame.copy())
+
+    def new_panels():
+        derived["Visit Category"].loc[~derived["Is Excluded Category"]].value_counts()
+        return derived[~derived["Is Excluded Category"]].groupby(["Month", "Visit Category"]).size().unstack().fillna(0)
+
+    start = time.perf_counter()
+    old_mix = old_panels()
+    old_s = time.perf_counter() - start
+    derive_ms = _timed(lambda: derive(frame.copy()), 3)
+    panels_ms = _timed(new_panels, 3)
+    same = old_mix.equals(new_panels().rename_axis(old_mix.index.name).astype(old_mix.dtypes.iloc[0]))
+    print(f"{n} visits: old panel code {old_s:.2f} s per run; derive() {derive_ms:.0f} ms once at load, "
+          f"panel reads {panels_ms:.0f} ms per run; same monthly mix: {same}")
+
+
+def _cube_panels(cube):
+    """Every rollup clinic_dashboard.py reads on a rerun."""
+    excluded = ~cube.cells["Is Excluded Category"]
+    cube.mean("Total Visit Duration"), cube.mean("Doctor Time"), cube.total("Flagged")
+    cube.mean("Doctor Time", by="Staff").dropna(), cube.rollup("Staff", "IDs")
+    cube.mean("Triage Duration"), cube.mean("Lab Duration"), cube.mean("SW Duration")
+    cube.total("Triage Recorded"), cube.mean("Arrival to Room")
+    cube.value_counts("Visit Type", normalize=True)
+    cube.mean("Total Visit Duration", by="Visit Category")
+    cube.value_counts("Visit Category", where=excluded)
+    return cube.rollup(["Month", "Visit Category"], where=excluded).unstack().fillna(0)
+
+
+def bench_cube(n=1_000_000, repeats=3):
+    """
+    Dashboard panels at n visits: raw-row groupbys on every rerun vs. rollups
+    of the MetricsCube (tests/test_metrics_cube.py checks that they agree).
+    """
+    import os
+    import tempfile
+
+    from dashboard_data import build_dashboard_frame
+    from metrics_cube import MetricsCube
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "visits.csv")
+        write_cleaned_csv(path, n)
+        df = build_dashboard_frame(path)
+
+    def raw_panels():
+        df["Total Visit Duration"].mean(), df["Doctor Time"].mean()
+        df[df["Doctor Time"].notna() & df["Staff"].notna()].groupby("Staff")["Doctor Time"].mean()
+        df[df["Staff"].notna()].groupby("Staff")["ID"].count()
+        df["Triage Duration"].mean(), df["Lab Duration"].mean(), df["SW Duration"].mean()
+        df[["Triage Start", "Triage End"]].dropna().shape[0], df["Arrival to Room"].mean()
+        df["Visit Type"].value_counts(normalize=True)
+        df.groupby("Visit Category")["Total Visit Duration"].mean()
+        df["Visit Category"].loc[~df["Is Excluded Category"]].value_counts()
+        df[~df["Is Excluded Category"]].groupby(["Month", "Visit Category"]).size().unstack().fillna(0)
+
+    start = time.perf_counter()
+    cube = MetricsCube.build(df)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"{n} visits -> {len(cube.cells)} cells (built once in {build_ms:.0f} ms)")
+    print(f"all panels per rerun: raw rows {_timed(raw_panels, repeats):.0f} ms, "
+          f"cube {_timed(lambda: _cube_panels(cube), repeats):.0f} ms")
+
+
+def bench_etl(years=(1, 5, 20), visits_per_day=60, repeats=5):
+    """
+    Incremental ETL: full initial sync vs. re-cleaning one day's visits after
+    an edit, for growing histories. The one-day cost should stay flat.
+    """
+    import tempfile
+
+    from etl import CleanedStore
+
+    print(f"{'years':>6} {'visits':>8} {'initial sync s':>15} {'day, unchanged ms':>18} {'day, 1 edit ms':>15}")
+    for span in years:
+        days = span * 365
+        raw = sheet_visits(days * visits_per_day)
+        day_numbers = np.repeat(np.arange(days), visits_per_day)
+        raw["Date"] = format_dates(pd.Series(pd.Timestamp("2005-01-01") + pd.to_timedelta(day_numbers, unit="D"))).to_numpy()
+        source = LocalSheetConnection(raw)
+
+        with tempfile.TemporaryDirectory() as folder:
+            store = CleanedStore(folder)
+            start = time.perf_counter()
+            store.sync(source)
+            sync_s = time.perf_counter() - start
+
+            last_day = raw.iloc[-visits_per_day:]
+            unchanged_ms = _timed(lambda: store.reprocess(last_day), repeats)
+            minutes = iter(range(10_000))
+
+            def edit_one():
+                edited = last_day.copy()
+                minute = next(minutes) % 600
+                edited.iloc[0, edited.columns.get_loc("Time Out")] = f"{16 + minute // 60 % 8:02d}:{minute % 60:02d}"
+                store.reprocess(edited)
+
+            edit_ms = _timed(edit_one, repeats)
+        print(f"{span:>6} {len(raw):>8} {sync_s:>15.2f} {unchanged_ms:>18.2f} {edit_ms:>15.2f}")
+
+
+def bench_validation(n=1_000_000, repeats=5, sample=20_000):
+    """
+    Timeline validation of n visits: validation.check() over the whole typed
+    frame vs. checking one row at a time in Python (timed on `sample` rows
+    and scaled up). Some rows get reversed stages, "00:00" defaults or a
+    missing end time so every rule fires.
+    """
+    from validation import BLOCKING, HOURS_BITS, MISSING_BITS, ORDER_BITS, check
+
+    rng = np.random.default_rng(1)
+    sheet = sheet_visits(n)
+    picks = rng.random((3, n)) < 0.02
+    sheet.loc[picks[0], "Time Roomed"] = "06:30"
+    sheet.loc[picks[1], "Lab Start"] = "00:00"
+    sheet.loc[picks[2], "Doctor Out"] = None
+    typed = to_typed(sheet)
+
+    def row_by_row(rows):
+        flagged = 0
+        for row in rows.itertuples(index=False):
+            values = dict(zip(rows.columns, row))
+            recorded = [values[col] for col in TIME_COLUMNS if not pd.isna(values[col])]
+            flagged += any(t < 360 or t > 1320 for t in recorded) or recorded != sorted(recorded)
+        return flagged
+
+    loop_ms = _timed(lambda: row_by_row(typed[TIME_COLUMNS].iloc[:sample]), 1) * n / sample
+    check_ms = _timed(lambda: check(typed), repeats)
+    violations = check(typed)
+    counts = {name: int(((violations & bits) != 0).sum())
+              for name, bits in [("order", ORDER_BITS), ("hours", HOURS_BITS), ("missing", MISSING_BITS)]}
+    print(f"{n} visits: row-by-row ~{loop_ms / 1000:.1f} s, check() {check_ms:.0f} ms; "
+          f"rows flagged {counts}, refused at submit {int(((violations & BLOCKING) != 0).sum())}")
+
+
+def bench_quantiles(n=1_000_000, repeats=5, seed=0):
+    """
+    Duration percentiles of n generated visits (see synthetic.py): exact
+    np.quantile over the selected rows vs. merging the per-day, per-staff
+    sketches, for everything and for one doctor over one quarter.
+    """
+    import os
+    import tempfile
+
+    from dashboard_data import DURATIONS, build_dashboard_frame
+    from quantiles import QUANTILES, DurationSketches
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "visits.csv")
+        write_cleaned_csv(path, n, seed)
+        df = build_dashboard_frame(path)
+
+    start = time.perf_counter()
+    sketches = DurationSketches.build(df)
+    build_ms = (time.perf_counter() - start) * 1000
+    staff = df["Staff"].value_counts().index[0]
+    first = df["Day"].min()
+    quarter = (first, first + pd.Timedelta(days=90))
+
+    def exact(rows):
+        return [np.quantile(df.loc[rows, name].dropna().to_numpy(), QUANTILES, method="lower") for name in DURATIONS]
+
+    def sketched(**selection):
+        return [sketches.quantiles(name, **selection) for name in DURATIONS]
+
+    one = (df["Staff"] == staff).to_numpy() & df["Day"].between(*quarter).to_numpy()
+    print(f"{n} visits -> {len(sketches.counts)} sketch rows (built once in {build_ms:.0f} ms)")
+    print(f"all visits:       exact {_timed(lambda: exact(slice(None)), repeats):.1f} ms, "
+          f"sketches {_timed(sketched, repeats):.1f} ms")
+    print(f"{staff}, 90 days: exact {_timed(lambda: exact(one), repeats):.1f} ms, "
+          f"sketches {_timed(lambda: sketched(days=quarter, staff=[staff]), repeats):.1f} ms")
+
+
+def bench_occupancy(n=1_000_000, years=1, seed=0):
+    """
+    Occupancy of n generated visits over `years` (several clinics' worth in
+    one year by default): every stage overall, exam rooms per Room and doctor
+    time per Staff, and the busiest hour waiting for a room.
+    """
+    import os
+    import tempfile
+
+    from dashboard_data import build_dashboard_frame
+    from occupancy import STAGES, Occupancy
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "visits.csv")
+        write_cleaned_csv(path, n, seed, years=years)
+        df = build_dashboard_frame(path)
+
+    builds = [(stage, None) for stage in STAGES] + [("Exam", "Room"), ("Doctor", "Staff")]
+    start = time.perf_counter()
+    results = {(stage, by): Occupancy.build(df, stage, by=by) for stage, by in builds}
+    build_s = time.perf_counter() - start
+    grid = sum(result.counts.size for result in results.values())
+    print(f"{n} visits over {df['Day'].nunique()} days: {len(builds)} occupancy grids "
+          f"({grid / 1e6:.0f}M minute cells) in {build_s:.2f} s")
+
+    waiting = results[("Waiting for Room", None)].by_hour()["All"]
+    print(f"busiest hour waiting for a room: {waiting.idxmax()} ({waiting.max():.1f} patients on average)")
+
+
+def bench_partitions(n=1_000_000, years=5, repeats=5, seed=0):
+    """
+    Dashboard data for one doctor's week in `years` of n generated visits:
+    the full-history load (Arrow cache + cube) vs. reading only the matching
+    month partitions and panel columns (visit_partitions) and building the
+    cube of that view, and the view served again from a bounded LRU.
+    """
+    import functools
+    import os
+    import tempfile
+
+    from dashboard_data import PANEL_COLUMNS, load_visits
+    from metrics_cube import MetricsCube
+    from visit_partitions import VisitFilter, VisitPartitions, _mask
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "visits.csv")
+        write_cleaned_csv(path, n, seed, years=years)
+        full = load_visits(path)  # writes the Arrow cache
+        start = time.perf_counter()
+        partitions = VisitPartitions(path)
+        write_s = time.perf_counter() - start
+
+        doctor = full["Staff"].value_counts().index[0]
+        monday = full["Day"].iloc[len(full) // 2] - pd.Timedelta(days=full["Day"].iloc[len(full) // 2].weekday())
+        week = VisitFilter(first=monday, last=monday + pd.Timedelta(days=6), staff=(doctor,))
+
+        def full_history():
+            return MetricsCube.build(load_visits(path))
+
+        def one_week():
+            return MetricsCube.build(VisitPartitions(path).read(week, PANEL_COLUMNS))
+
+        full_ms = _timed(full_history, repeats)
+        week_ms = _timed(one_week, repeats)
+        view = functools.lru_cache(maxsize=16)(lambda filters: MetricsCube.build(partitions.read(filters, PANEL_COLUMNS)))
+        view(week)
+        cached_ms = _timed(lambda: view(week), repeats)
+
+        months = partitions.partitions(week)
+    print(f"{n} visits over {years} years -> {len(partitions.manifest['partitions'])} month partitions "
+          f"(written once in {write_s:.1f} s)")
+    print(f"full history {full_ms:.0f} ms; {doctor}, week of {monday:%Y-%m-%d} ({len(months)} partition(s) read, "
+          f"{int(_mask(full, week).sum())} visits) {week_ms:.1f} ms ({week_ms / full_ms:.1%}); "
+          f"LRU hit {cached_ms:.3f} ms")
+
+
+def bench_shards(clinics=8, rows=50_000, latency=(0.05, 0.4), row_latency=2e-6, max_workers=8):
+    """
+    Multi-clinic sync (see clinics.py) over LocalSheetConnection shards with
+    different round-trip latencies: the first full sync on the thread pool
+    vs. one shard at a time, then a sync after another terminal added a
+    visit at one clinic (only that shard fetches, and only its new row) and
+    one with nothing changed (no shard fetches, the merged frame is reused).
+    """
+    from clinics import Clinic, ClinicShards
+
+    sites = [Clinic(f"site{i}", f"Clinic {i}", [], [], {}) for i in range(clinics)]
+    delays = np.linspace(*latency, clinics)
+    sheets = [sheet_visits(rows, seed=i) for i in range(clinics)]
+
+    def open_shards(workers):
+        replicas = {
+            (site.key, None): SheetReplica(LocalSheetConnection(sheet, latency=delay, row_latency=row_latency))
+            for site, sheet, delay in zip(sites, sheets, delays)
+        }
+        return ClinicShards(sites, replicas, max_workers=workers)
+
+    def timed_sync(shards):
+        start = time.perf_counter()
+        merged = shards.sync()
+        return merged, time.perf_counter() - start
+
+    _, serial_s = timed_sync(open_shards(1))
+    shards = open_shards(max_workers)
+    merged, pooled_s = timed_sync(shards)
+    print(f"{clinics} clinics x {rows} visits, latency {latency[0]:.2f}-{latency[1]:.2f} s: "
+          f"first sync {pooled_s:.2f} s on {max_workers} threads (slowest shard {max(shards.fetch_seconds.values()):.2f} s, "
+          f"shards summed {sum(shards.fetch_seconds.values()):.2f} s), one at a time {serial_s:.2f} s")
+
+    def fetches():
+        return sum((replica.fetches for replica in shards.replicas.values()), Counter())
+
+    before = fetches()
+    changed = shards.replicas[(sites[1].key, None)].source
+    changed.append_rows(sheet_visits(1, seed=99))
+    grown, changed_s = timed_sync(shards)
+    after = fetches()
+    print(f"one visit added at one clinic: {changed_s:.2f} s, fetches {dict(after - before)}, "
+          f"{changed.rows_read - rows} rows read")
+
+    same, unchanged_s = timed_sync(shards)
+    print(f"nothing changed: {unchanged_s * 1000:.1f} ms, fetches {dict(fetches() - after)}, "
+          f"merged frame reused: {same is grown}")
+
+
+def bench_import(n=10_000, existing=100_000, latency=0.3, row_latency=5e-6, sample=50):
+    """
+    Typing up a paper log of n visits: one CSV through visit_import and one
+    BatchWriter.insert_many() vs. n New Patient submits (check_rows() and a
+    waited writer.insert() each, timed over `sample` submits), against a
+    sheet of `existing` visits with the given round-trip latency.
+    """
+    from batch_writer import BatchWriter
+    from synthetic import APPOINTMENTS, ROOMS, STAFF
+    from validation import check_rows
+    from visit_import import check_import, read_upload
+
+    staff, rooms = [name for name in STAFF if name], list(ROOMS)
+    appointment_types = sorted({appointment for appointment, _ in APPOINTMENTS})
+
+    def new_visits(count, seed, first_id):
+        """Visits without entry errors, for IDs above those of the stored visits."""
+        visits = sheet_visits(count, seed=seed, error_rate=0).astype(object)
+        visits["Staff"] = visits["Staff"].fillna(staff[0])
+        visits["ID"] = range(first_id, first_id + count)
+        return visits
+
+    upload = new_visits(n, 7, 900_000)
+    upload.loc[::100, "Staff"] = "Dr. Nobody"  # 1% rejected, besides visits running past clinic hours
+    data = upload.to_csv(index=False).encode()
+
+    conn = LocalSheetConnection(sheet_visits(existing), latency=latency, row_latency=row_latency)
+    replica = SheetReplica(conn)
+    replica.sync()
+    writer = BatchWriter(replica)
+
+    start = time.perf_counter()
+    accepted, rejects = check_import(read_upload(data, "log.csv"), replica.index, staff, rooms, appointment_types)
+    check_s = time.perf_counter() - start
+    calls = sum(conn.calls.values())
+    start = time.perf_counter()
+    writer.insert_many(accepted).result(timeout=600)
+    write_s = time.perf_counter() - start
+    print(f"{n} rows: checked in {check_s:.2f} s ({len(rejects)} rejected), stored in {write_s:.2f} s "
+          f"with {sum(conn.calls.values()) - calls} backend calls, {conn.calls['append_rows']} append")
+
+    rows = new_visits(sample, 8, 950_000).to_dict("records")
+    start = time.perf_counter()
+    for row in rows:
+        check_rows([row])
+        writer.insert(row).result(timeout=60)
+    per_submit = (time.perf_counter() - start) / sample
+    print(f"one submit at a time: {per_submit * 1000:.0f} ms each, {per_submit * n / 60:.0f} min for {n} "
+          f"(plus the typing)")
+
+
+def bench_reports(n=1_000_000, years=5, workers=(1, 2, 4, 8), seed=0):
+    """
+    Monthly packets for every doctor in `years` of n generated visits
+    (reports.py): reports per second with 1, 2, 4, ... worker processes
+    reading the shared partition files, then a run with nothing changed and
+    one after a visit was added to one month (only that doctor's packets for
+    the month and the next are rendered).
+    """
+    import os
+    import shutil
+    import tempfile
+
+    from reports import build_reports
+    from visit_partitions import VisitPartitions
+
+    with tempfile.TemporaryDirectory() as folder:
+        path, out = os.path.join(folder, "visits.csv"), os.path.join(folder, "reports")
+        write_cleaned_csv(path, n, seed, years=years)
+        start = time.perf_counter()
+        partitions = VisitPartitions(path)
+        print(f"{n} visits over {years} years: partitions written in {time.perf_counter() - start:.1f} s; "
+              f"{os.cpu_count()} CPU(s)")
+
+        single = None
+        for count in workers:
+            shutil.rmtree(out, ignore_errors=True)
+            run = build_reports(path, out, workers=count)
+            single = single or run.seconds
+            print(f"{count} worker(s): {run.rendered} reports over {run.months} months in {run.seconds:.2f} s, "
+                  f"{run.rendered / run.seconds:.0f} reports/s ({single / run.seconds:.1f}x)")
+
+        run = build_reports(path, out, workers=workers[-1])
+        print(f"nothing changed: {run.seconds * 1000:.0f} ms, {run.rendered} rendered, {run.unchanged} unchanged, "
+              f"{run.months_read} months read")
+
+        month = sorted(partitions.manifest["partitions"])[len(partitions.manifest["partitions"]) // 2]
+        chunks = pd.read_csv(path, chunksize=100_000)
+        visit = next(chunk for chunk in chunks if chunk["Date"].str.startswith(month).any())
+        visit = visit[visit["Date"].str.startswith(month)].head(1).assign(ID=999_999)
+        visit.to_csv(path, mode="a", header=False, index=False)
+        run = build_reports(path, out, workers=workers[-1])
+        print(f"one visit added to {month} ({visit['Staff'].iloc[0]}): {run.seconds:.2f} s including the partition "
+              f"rebuild, {run.rendered} rendered, {run.unchanged} unchanged, {run.months_read} months read")
+
+
+def bench_simulator(days=2000, sample_days=100, workers=None, path=None):
+    """
+    Staffing what-ifs (simulator.py) fitted to the bundled CSV: one scenario
+    of `days` clinic days vectorized across the days vs. one day at a time
+    (timed over `sample_days`), a 48-scenario grid inline and in a process
+    pool, and the baseline's simulated waits next to the recorded ones.
+    """
+    import os
+
+    from dashboard_data import DATA_FILE, load_visits
+    from simulator import baseline, fit_profile, run_scenarios, scenario_grid, simulate
+
+    frame = load_visits(path or DATA_FILE)
+    profile = fit_profile(frame)
+    scenario = baseline(profile)
+
+    start = time.perf_counter()
+    simulate(profile, scenario, days)
+    vectorized_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for seed in range(sample_days):
+        simulate(profile, scenario, 1, seed)
+    one_by_one_s = (time.perf_counter() - start) / sample_days * days
+    print(f"{scenario}: {days} days in {vectorized_s * 1000:.0f} ms vectorized vs. {one_by_one_s:.1f} s "
+          f"one day at a time ({one_by_one_s / vectorized_s:.0f}x)")
+
+    grid = scenario_grid(range(3, 7), (1, 2), (1, 2, 3), (1.0, 1.2))
+    timings = {}
+    for count in sorted({1, workers or os.cpu_count() or 1}):
+        start = time.perf_counter()
+        results = run_scenarios(profile, grid, days, workers=count)
+        timings[count] = time.perf_counter() - start
+    print(f"{len(grid)} scenarios x {days} days: " + ", ".join(
+        f"{count} worker(s) {seconds:.2f} s" for count, seconds in timings.items()))
+
+    simulated = results.loc[tuple(scenario)]
+    for name in ["Arrival to Room", "Total Visit Duration"]:
+        recorded = frame[name].quantile([0.5, 0.9]).to_numpy()
+        print(f"{name} p50 / p90: simulated {simulated[f'{name} p50']:.0f} / {simulated[f'{name} p90']:.0f} min, "
+              f"recorded {recorded[0]:.0f} / {recorded[1]:.0f} min")
+
+
+def bench_reruns(rows=5_000, edits=10):
+    """
+    What reruns when a time field in the Edit form changes, and how long it
+    takes. Drives streamlit_app.py with AppTest against a local SQLite store
+    of `rows` visits, configured through the app's secrets like a deployment,
+    reruns only the edit fragment as the browser does (see fragment_reruns)
+    and counts the sections that ran from the app's profiler spans.
+    """
+    import os
+    import tempfile
+
+    from streamlit.testing.v1 import AppTest
+
+    from fragment_reruns import rerun_fragment, span_counts
+
+    data = sheet_visits(rows)
+    with tempfile.TemporaryDirectory() as folder:
+        SQLiteBackend(os.path.join(folder, "clinic.db")).update(data)
+        app_test = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py"),
+                                     default_timeout=60)
+        app_test.secrets["storage"] = {"backend": "sqlite", "path": os.path.join(folder, "clinic.db")}
+        app_test.secrets["profiler"] = {"enabled": True, "panel": False}
+        app_test.run()
+        app_test.radio[0].set_value("Edit Patient").run()
+        app_test.number_input[0].set_value(int(data["ID"].iloc[0])).run()
+
+        before = span_counts("intake")
+        seconds = []
+        for minute in range(edits):
+            app_test.time_input[0].set_value(datetime_time(9, minute))
+            start = time.perf_counter()
+            rerun_fragment(app_test, "edit_patient_section")
+            seconds.append(time.perf_counter() - start)
+        ran = span_counts("intake") - before
+
+    print(f"{rows} visits, {edits} time-field edits: edit form runs {ran['section.edit_patient']}, "
+          f"metrics runs {ran['section.metrics']}, insights runs {ran['section.insights']}, "
+          f"store syncs {ran['fetch']}; rerun p50 {np.median(seconds) * 1000:.1f} ms")
+
+
+def bench_profiler(spans=1_000_000):
+    """Cost of one timing span when the profiler is disabled (the default) and enabled, vs. an empty block."""
+    from profiler import Profiler
+
+    profiler = Profiler()
+
+    def loop(with_span):
+        start = time.perf_counter()
+        for _ in range(spans):
+            if with_span:
+                with profiler.span("fetch"):
+                    pass
+            else:
+                pass
+        return (time.perf_counter() - start) / spans * 1e9
+
+    bare = loop(False)
+    disabled = loop(True)
+    profiler.configure(enabled=True)
+    profiler.start_run("bench")
+    enabled = loop(True)
+    profiler.finish_run()
+    print(f"per span: empty block {bare:.0f} ns, disabled {disabled:.0f} ns, enabled {enabled:.0f} ns; "
+          f"a rerun with 30 spans costs {(disabled - bare) * 30 / 1000:.1f} us disabled, "
+          f"{(enabled - bare) * 30 / 1000:.1f} us enabled")
+
+
+def _startup_in_subprocess(code_folder, data_folder, script, prewarm):
+    """
+    Time to first render of `script` in a fresh server process: the Streamlit
+    import, then two new sessions (or, with `prewarm`, warmup.prewarm() first).
+    """
+    import json
+    import os
+    import subprocess
+
+    code = f"""
+import json, sys, time
+sys.path.insert(0, {code_folder!r})
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+times = {{"import": time.perf_counter() - start}}
+script = {os.path.join(code_folder, script)!r}
+if {prewarm!r}:
+    import warmup
+    times["prewarm"] = warmup.prewarm(script)
+for session in ("first", "second"):
+    start = time.perf_counter()
+    app_test = AppTest.from_file(script, default_timeout=120)
+    app_test.secrets["storage"] = {{"backend": "sqlite", "path": "clinic.db"}}
+    app_test.run()
+    assert not app_test.exception, app_test.exception
+    times[session] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+    output = subprocess.run([sys.executable, "-c", code], cwd=data_folder, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def bench_startup(rows=100_000, folder=None):
+    """
+    Time to first render of a new session after a server start, for both
+    apps: the first session (paying for imports and st.cache_resource
+    singletons), a second one, and the first after warmup.prewarm(). The
+    intake app reads a SQLite store of `rows` visits, the dashboard a CSV of
+    `rows` cleaned visits. `folder` runs the apps of another checkout
+    instead, e.g. a `git worktree` of an earlier commit for the numbers
+    before a change (its trees have no warmup.py).
+    """
+    import os
+    import tempfile
+
+    from dashboard_data import DATA_FILE
+
+    code_folder = os.path.abspath(folder or os.path.dirname(__file__))
+    with tempfile.TemporaryDirectory() as data_folder:
+        write_cleaned_csv(os.path.join(data_folder, DATA_FILE), rows)
+        SQLiteBackend(os.path.join(data_folder, "clinic.db")).update(sheet_visits(rows))
+        os.makedirs(os.path.join(data_folder, ".streamlit"))
+        with open(os.path.join(data_folder, ".streamlit", "secrets.toml"), "w") as secrets:
+            secrets.write('[storage]\nbackend = "sqlite"\npath = "clinic.db"\n')  # read by the prewarm run
+        can_prewarm = os.path.exists(os.path.join(code_folder, "warmup.py"))
+        print(f"{rows} visits, apps from {code_folder}")
+        for script in ("streamlit_app.py", "clinic_dashboard.py"):
+            # The first run builds the dashboard's Arrow caches, as the first start after a CSV change does.
+            _startup_in_subprocess(code_folder, data_folder, script, prewarm=False)
+            cold = _startup_in_subprocess(code_folder, data_folder, script, prewarm=False)
+            line = (f"{script:>20}: streamlit import {cold['import']:.2f} s, first session {cold['first']:.2f} s, "
+                    f"second {cold['second']:.2f} s")
+            if can_prewarm:
+                warm = _startup_in_subprocess(code_folder, data_folder, script, prewarm=True)
+                line += f", after a {warm['prewarm']:.2f} s prewarm {warm['first']:.2f} s"
+            print(line)
+
+
+# ----------------- Suite -----------------
+# Slower than this many times the compared run counts as a regression.
+REGRESSION_RATIO = 1.25
+
+
+def _measure(fn, repeats):
+    """Median wall time of fn() and the peak memory traced during one more call (Arrow buffers are not traced)."""
+    import tracemalloc
+
+    ms = _timed(fn, repeats)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"ms": round(ms, 3), "peak_mb": round(peak / 2 ** 20, 2), "repeats": repeats}
+
+
+def _intake_operations(sheet):
+    """(operation, fn, repeats) driving what streamlit_app.py does with the replica at this sheet size."""
+    from validation import check_rows
+
+    def load():
+        replica = SheetReplica(LocalSheetConnection(sheet))
+        replica.sync()
+        return replica.index, replica.recent, replica.metrics
+
+    replica = SheetReplica(LocalSheetConnection(sheet))
+    frame = replica.sync()
+    replica.index, replica.recent, replica.metrics
+    ids = iter(np.resize(sheet["ID"].to_numpy()[:1000], 1_000_000))
+    last_day = replica.typed["Date"].max()
+    new_row = sheet.iloc[[0]].reset_index(drop=True)
+    entry = new_row.iloc[0].to_dict()
+    times = iter(np.resize([f"{16 + minute // 60:02d}:{minute % 60:02d}" for minute in range(300)], 1_000_000))
+
+    def get_patient_data():
+        positions = replica.index.visits(next(ids))[::-1]
+        return replica.typed.iloc[positions[0]].to_dict()
+
+    def metrics_block():
+        metrics = replica.metrics
+        return (metrics.total, metrics.patients_on(last_day), metrics.most_common_appointment(),
+                metrics.patients_per_doctor(last_day))
+
+    return [
+        ("load", load, 3),
+        ("get_patient_data", get_patient_data, 50),
+        ("last_20_entries", lambda: frame.iloc[replica.recent.page(0, 20)], 50),
+        ("metrics", metrics_block, 50),
+        ("validate_submit", lambda: check_rows([entry]), 20),
+        ("insert", lambda: replica.append(new_row), 10),
+        ("edit", lambda: replica.update_rows({0: {"Time Out": next(times)}}), 10),
+    ]
+
+
+def _dashboard_operations(path):
+    """(operation, fn, repeats) for clinic_dashboard.py: loading the CSV, building the cube and sketches, the panel rollups."""
+    import os
+
+    from columnar_cache import cache_path_for
+    from dashboard_data import load_visits
+    from metrics_cube import MetricsCube
+    from quantiles import DurationSketches
+
+    def load_cold():
+        if os.path.exists(cache_path_for(path)):
+            os.remove(cache_path_for(path))
+        return load_visits(path)
+
+    frame = load_visits(path)
+    cube = MetricsCube.build(frame)
+    return [
+        ("load_cold", load_cold, 1),
+        ("load_warm", lambda: load_visits(path), 3),
+        ("cube_build", lambda: MetricsCube.build(frame), 3),
+        ("sketches_build", lambda: DurationSketches.build(frame), 3),
+        ("panels", lambda: _cube_panels(cube), 10),
+    ]
+
+
+def _environment():
+    import datetime
+    import platform
+    import subprocess
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+    }
+
+
+def _compare(results, path):
+    """Prints each operation's time against the same operation and size in an earlier JSON run."""
+    import json
+
+    with open(path) as old_file:
+        old = {(r["app"], r["operation"], r["rows"]): r for r in json.load(old_file)["results"]}
+    print(f"vs. {path}:")
+    for result in results:
+        before = old.get((result["app"], result["operation"], result["rows"]))
+        if before is None or not before["ms"]:
+            continue
+        ratio = result["ms"] / before["ms"]
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+        print(f"  {result['app']}.{result['operation']:<18} {result['rows']:>9} {before['ms']:>10.2f} -> "
+              f"{result['ms']:>10.2f} ms ({ratio:.2f}x){flag}")
+
+
+def bench_suite(sizes=(10_000, 100_000, 1_000_000), output=None, compare=None, seed=0):
+    """
+    Time and peak memory of both apps' data operations on synthetic visits
+    (see synthetic.py) at each size, against LocalSheetConnection and a
+    cleaned CSV in a temporary folder. `output` writes the results as JSON;
+    `compare` prints the change against an earlier JSON file.
+    """
+    import json
+    import os
+    import tempfile
+
+
+    results = []
+    print(f"{'operation':<28} {'rows':>9} {'ms':>10} {'peak MB':>9}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "visits.csv")
+            write_cleaned_csv(path, n, seed)
+            suites = [("intake", _intake_operations(sheet_visits(n, seed))), ("dashboard", _dashboard_operations(path))]
+            for app, operations in suites:
+                for operation, fn, repeats in operations:
+                    result = {"app": app, "operation": operation, "rows": n, **_measure(fn, repeats)}
+                    results.append(result)
+                    print(f"{app + '.' + operation:<28} {n:>9} {result['ms']:>10.2f} {result['peak_mb']:>9.1f}")
+
+    if output:
+        with open(output, "w") as out:
+            json.dump({"environment": _environment(), "seed": seed, "results": results}, out, indent=1)
+        print(f"wrote {output}")
+    if compare:
+        _compare(results, compare)
+    return results
+
+
+BENCHMARKS = {
+    "append": bench_append,
+    "lookup": bench_lookup,
+    "reruns": bench_reruns,
+    "schema": bench_schema,
+    "recent": bench_recent,
+    "metrics": bench_metrics,
+    "backends": bench_backends,
+    "writer": bench_writer,
+    "import": bench_import,
+    "dashboard_load": bench_dashboard_load,
+    "derive": bench_derive,
+    "cube": bench_cube,
+    "etl": bench_etl,
+    "validation": bench_validation,
+    "quantiles": bench_quantiles,
+    "occupancy": bench_occupancy,
+    "partitions": bench_partitions,
+    "shards": bench_shards,
+    "reports": bench_reports,
+    "simulator": bench_simulator,
+    "profiler": bench_profiler,
+    "startup": bench_startup,
+    "suite": bench_suite,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the clinic apps.")
+    parser.add_argument("names", nargs="*", choices=[[]] + list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--sizes", help="suite: comma-separated row counts, e.g. 10000,100000,10000000")
+    parser.add_argument("--json", help="suite: write the results to this JSON file")
+    parser.add_argument("--compare", help="suite: compare with the results in this earlier JSON file")
+    args = parser.parse_args()
+
+    for name in args.names or list(BENCHMARKS):
+        print(f"== {name} ==")
+        if name == "suite":
+            sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else None
+            bench_suite(**({"sizes": sizes} if sizes else {}), output=args.json, compare=args.compare)
+        else:
+            BENCHMARKS[name]()
@@ -0,0 +1,133 @@
+"""
+Incrementally maintained aggregates behind the intake app's Clinic Metrics.
+
+The metrics block used to rescan the whole sheet on every rerun (row count,
+a string match for today's visits, Appointment Type mode, and another
+filter + value_counts for patients per doctor). ClinicMetrics keeps those
+counts in counters that are adjusted by the handful of rows an insert or
+edit touches, so reading them does not depend on how long the history is.
+reconcile() rebuilds everything from a typed frame and reports any drift.
+"""
+import threading
+from collections import Counter
+
+import pandas as pd
+
+
+def _day(value):
+    """Typed Date value (Timestamp / NaT / date) to a datetime.date key, or None."""
+    if value is None or pd.isna(value):
+        return None
+    return value.date() if hasattr(value, "date") else value
+
+
+def _counts(values):
+    """value_counts() as a plain Counter (missing values and empty categories dropped)."""
+    return Counter({key: int(count) for key, count in values.value_counts().items() if count})
+
+
+def _fold(counter, delta, sign):
+    """Adds (sign=1) or subtracts (sign=-1) `delta` and drops keys that reach zero."""
+    for key, count in delta.items():
+        counter[key] += sign * count
+        if counter[key] <= 0:
+            del counter[key]
+
+
+def _flat(counts):
+    """per_day_staff as {(date, staff): count}; other counters unchanged."""
+    if counts and isinstance(next(iter(counts.values())), Counter):
+        return {(day, staff): count for day, staff_counts in counts.items() for staff, count in staff_counts.items()}
+    return counts
+
+
+class ClinicMetrics:
+    """
+    total:              number of visits
+    per_day:            date -> visits that day
+    per_day_staff:      date -> Counter(staff -> visits that day)
+    appointment_types:  appointment type -> visits
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.per_day = Counter()
+        self.per_day_staff = {}
+        self.appointment_types = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, typed):
+        metrics = cls()
+        metrics.add_rows(typed)
+        return metrics
+
+    def _apply(self, typed_rows, sign):
+        # Count with pandas first (one pass over the rows), then fold the
+        # small result into the counters under the lock.
+        per_day, per_day_staff, appointment_types = Counter(), Counter(), Counter()
+        if "Date" in typed_rows.columns:
+            per_day = Counter({_day(day): count for day, count in _counts(typed_rows["Date"]).items()})
+            if "Staff" in typed_rows.columns:
+                pairs = pd.DataFrame({"day": typed_rows["Date"], "staff": typed_rows["Staff"]})
+                per_day_staff = Counter({(_day(day), staff): count for (day, staff), count in _counts(pairs).items()})
+        if "Appointment Type" in typed_rows.columns:
+            appointment_types = _counts(typed_rows["Appointment Type"])
+
+        with self._lock:
+            self.total += sign * len(typed_rows)
+            _fold(self.per_day, per_day, sign)
+            _fold(self.appointment_types, appointment_types, sign)
+            for (day, staff), count in per_day_staff.items():
+                staff_counts = self.per_day_staff.setdefault(day, Counter())
+                _fold(staff_counts, {staff: count}, sign)
+                if not staff_counts:
+                    del self.per_day_staff[day]
+
+    def add_rows(self, typed_rows):
+        """Counts new visits (typed rows)."""
+        self._apply(typed_rows, 1)
+        return self
+
+    def remove_rows(self, typed_rows):
+        """Un-counts visits, e.g. the old version of an edited row."""
+        self._apply(typed_rows, -1)
+        return self
+
+    # ----------------- Reads -----------------
+    def patients_on(self, day):
+        with self._lock:
+            return self.per_day.get(_day(day), 0)
+
+    def most_common_appointment(self):
+        """Same answer as Series.mode()[0]: highest count, smallest value among ties."""
+        with self._lock:
+            if not self.appointment_types:
+                return "N/A"
+            best = max(self.appointment_types.values())
+            return min(key for key, count in self.appointment_types.items() if count == best)
+
+    def patients_per_doctor(self, day):
+        """Visits per staff member on `day`, most first, like value_counts()."""
+        with self._lock:
+            counts = dict(self.per_day_staff.get(_day(day), {}))
+        return pd.Series(counts, dtype="int64").sort_values(ascending=False)
+
+    # ----------------- Reconciliation -----------------
+    def reconcile(self, typed):
+        """
+        Rebuilds the aggregates from `typed` and compares them with the
+        maintained ones. Returns a list of human-readable differences (empty
+        when they agree).
+        """
+        fresh = ClinicMetrics.build(typed)
+        differences = []
+        with self._lock:
+            if fresh.total != self.total:
+                differences.append(f"total: maintained {self.total}, rebuilt {fresh.total}")
+            for name in ("per_day", "per_day_staff", "appointment_types"):
+                maintained, rebuilt = _flat(getattr(self, name)), _flat(getattr(fresh, name))
+                for key in set(maintained) | set(rebuilt):
+                    if maintained.get(key, 0) != rebuilt.get(key, 0):
+                        differences.append(f"{name}[{key!r}]: maintained {maintained.get(key, 0)}, rebuilt {rebuilt.get(key, 0)}")
+        return differences
@@ -0,0 +1,210 @@
+"""
+Several clinic sites behind the same apps.
+
+Each clinic has a section in secrets.toml with its own staff and room lists
+and its own store, described like [storage] (see storage.open_backend):
+
+    [clinics.north]
+    name = "North Clinic"
+    staff = ["Dr. Jon Pierson", "Dr. Eric Cox"]
+    rooms = ["100", "101"]
+    storage = { backend = "gsheets", spreadsheet = "https://docs.google.com/...", worksheet = "Visits" }
+
+    [clinics.south]
+    name = "South Clinic"
+    staff = ["Dr. Omer Usman"]
+    rooms = ["200", "201", "202"]
+    storage = { backend = "sqlite", path = "south-{month}.db" }   # one file per month
+
+Without a [clinics] section there is a single clinic using [storage] and
+the staff and rooms the intake app has always listed.
+
+Every store, and every month of a per-month store, is a shard with its own
+SheetReplica, so a shard whose modified marker did not move costs one marker
+call and is not fetched again. (Drive keeps that marker per spreadsheet:
+give each clinic its own spreadsheet, not a tab of a shared one, or a write
+at one clinic makes the others re-read.) ClinicShards.sync() syncs every
+shard on a bounded thread pool; the calls wait on the network or on SQLite,
+so a sync takes about as long as the slowest shard, not the sum of them. The
+typed frames are merged into one with a Clinic column, and re-merged only
+when a shard's frame changed.
+
+A store split by month is read-only in the intake app: its visits are written
+to the month files by something else (an import, an export per month) and
+the app only reads them for the cross-clinic views. Visits are entered for
+clinics with a single store (intake_clinics()).
+
+    shards = ClinicShards.open(clinics_from(st.secrets), connect_sheet, today)
+    visits = shards.sync()                                  # every clinic, typed
+    replica = shards.replicas[shards.shard_for("north", today)]
+"""
+import glob
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from storage import SheetReplica, open_backend
+from visit_schema import concat_typed
+
+MONTH = "{month}"
+MONTH_PATTERN = re.compile(r"\d{4}-\d{2}")
+
+DEFAULT_STAFF = [
+    "Dr. Jon Pierson", "Dr. Javier De La Torre", "Dr. John Borrego", "Dr. Omer Usman",
+    "Dr. Abhinav Vulisha", "Dr. Muhammad Tahir", "Dr. Richard McCallum",
+    "Dr. Eric Cox", "Dr. Sandra Vexler", "Dr. Abdel Vexler"
+]
+DEFAULT_ROOMS = ["100", "101", "102", "103"]
+
+# `storage` is the clinic's [storage]-style section; its sqlite path may contain {month}.
+Clinic = namedtuple("Clinic", ["key", "name", "staff", "rooms", "storage"])
+
+
+def clinics_from(config):
+    """
+    The clinics of a secrets mapping, one per [clinics.<key>] section in file
+    order, or a single one using [storage] when there are none. Raises
+    ValueError when two clinics have the same name, which labels their
+    visits in the merged frame.
+    """
+    sections = dict(config.get("clinics", {}))
+    if not sections:
+        return [Clinic("main", "Clinic", DEFAULT_STAFF, DEFAULT_ROOMS, dict(config.get("storage", {})))]
+    clinics = [
+        Clinic(key, section.get("name", key), list(section.get("staff", DEFAULT_STAFF)),
+               [str(room) for room in section.get("rooms", DEFAULT_ROOMS)], dict(section.get("storage", {})))
+        for key, section in sections.items()
+    ]
+    names = Counter(clinic.name for clinic in clinics)
+    for name, count in names.items():
+        if count > 1:
+            keys = [clinic.key for clinic in clinics if clinic.name == name]
+            raise ValueError(f"[clinics] {', '.join(keys)} are all named {name!r}; give each clinic its own name")
+    return clinics
+
+
+def intake_clinics(clinics, pinned=None):
+    """
+    The clinics the intake app enters visits for: the one `pinned` by
+    [intake] clinic, else every clinic whose store is not split by month.
+    Raises ValueError for an unknown or a per-month pinned clinic.
+    """
+    if pinned is None:
+        return [clinic for clinic in clinics if not is_monthly(clinic.storage)]
+    for clinic in clinics:
+        if clinic.key == pinned:
+            if is_monthly(clinic.storage):
+                raise ValueError(f"[intake] clinic = {pinned!r} has a store split by month, which the intake "
+                                 f"app only reads; pin a clinic with a single store")
+            return [clinic]
+    raise ValueError(f"[intake] clinic = {pinned!r} is not a configured clinic; "
+                     f"use one of: {', '.join(clinic.key for clinic in clinics)}")
+
+
+def month_of(day):
+    return f"{pd.Timestamp(day):%Y-%m}"
+
+
+def is_monthly(storage):
+    if MONTH not in storage.get("path", ""):
+        return False
+    if storage.get("backend") != "sqlite" or storage.get("mirror", False):
+        raise ValueError("one store per month is only supported for sqlite without a mirror")
+    return True
+
+
+def shard_months(storage, today):
+    """
+    Months with a file of a per-month store, plus the month of `today` (where
+    new visits go); [None] for a store that is not split by month.
+    """
+    if not is_monthly(storage):
+        return [None]
+    prefix, suffix = storage["path"].split(MONTH, 1)
+    names = glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix))
+    months = {name[len(prefix):len(name) - len(suffix)] for name in names}
+    return sorted({month for month in months if MONTH_PATTERN.fullmatch(month)} | {month_of(today)})
+
+
+def open_shard(storage, month, connect_sheet):
+    """The backend of one shard: the clinic's store, or its file for `month`."""
+    if month is not None:
+        storage = {**storage, "path": storage["path"].replace(MONTH, month)}
+    return open_backend(storage, connect_sheet)
+
+
+class ClinicShards:
+    """
+    replicas: {(clinic key, month or None): SheetReplica}, one per shard.
+    fetch_seconds: how long each shard took in the last sync().
+    """
+
+    def __init__(self, clinics, replicas, connect_sheet=None, max_workers=8, full_sync_every=300):
+        self.clinics = {clinic.key: clinic for clinic in clinics}
+        self.replicas = dict(replicas)
+        self.connect_sheet = connect_sheet
+        self.full_sync_every = full_sync_every
+        self.fetch_seconds = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-sync")
+        self._parts = {}  # shard -> the typed frame it had at the last merge
+        self._merged = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, clinics, connect_sheet, today, max_workers=8, full_sync_every=300):
+        """Opens a replica for every shard of every clinic (nothing is fetched yet)."""
+        replicas = {
+            (clinic.key, month): SheetReplica(open_shard(clinic.storage, month, connect_sheet), full_sync_every)
+            for clinic in clinics for month in shard_months(clinic.storage, today)
+        }
+        return cls(clinics, replicas, connect_sheet, max_workers, full_sync_every)
+
+    def shard_for(self, clinic_key, day):
+        """
+        The shard a visit of this clinic on `day` is written to, opened if its
+        month has no store yet (a new month started since open()).
+        """
+        clinic = self.clinics[clinic_key]
+        shard = (clinic_key, month_of(day) if is_monthly(clinic.storage) else None)
+        with self._lock:
+            if shard not in self.replicas:
+                backend = open_shard(clinic.storage, shard[1], self.connect_sheet)
+                self.replicas[shard] = SheetReplica(backend, self.full_sync_every)
+        return shard
+
+    # ----------------- Sync -----------------
+    def _fetch(self, shard):
+        start = time.perf_counter()
+        replica = self.replicas[shard]
+        replica.sync()
+        typed = replica.typed  # converted here too, so shards are parsed in parallel as well
+        self.fetch_seconds[shard] = time.perf_counter() - start
+        return typed
+
+    def sync(self):
+        """Every clinic's visits as one typed frame (see visit_schema) with a Clinic column."""
+        with self._lock:
+            shards = list(self.replicas)
+            parts = dict(zip(shards, self._pool.map(self._fetch, shards)))
+            if self._merged is None or any(parts[shard] is not self._parts.get(shard) for shard in shards):
+                self._merged = self._merge(parts)
+                self._parts = parts
+            return self._merged
+
+    def _merge(self, parts):
+        keys = list(self.clinics)
+        names = [clinic.name for clinic in self.clinics.values()]
+        frames = []
+        for (clinic_key, _month), typed in parts.items():
+            if not len(typed.columns):
+                continue  # a shard nobody has written to yet
+            frame = typed.copy(deep=False)
+            codes = np.full(len(frame), keys.index(clinic_key))
+            frame.insert(0, "Clinic", pd.Categorical.from_codes(codes, categories=names))
+            frames.append(frame)
+        return concat_typed(frames)
@@ -0,0 +1,101 @@
+"""
+Columnar cache for frames derived from a CSV file.
+
+The dashboard parses the cleaned CSV (timestamps, categoricals) and derives
+the duration columns on every cold start. cached_frame() stores the result
+once as an uncompressed Arrow IPC file next to the CSV, which loads through
+a memory map without any parsing, and rebuilds it only when the CSV changes.
+
+The cache key is the CSV's size and modification time, backed by a SHA-256
+of its content: a touched but unchanged file costs one hash, not a rebuild.
+A `tag` naming the build (e.g. a pipeline version) is part of the key too.
+The key lives in the Arrow schema metadata, so checking it reads only the
+file footer. Without pyarrow the frame is simply rebuilt from the CSV.
+"""
+import hashlib
+import os
+
+try:
+    import pyarrow as pa
+except ImportError:  # the cache is an optimization; fall back to parsing the CSV
+    pa = None
+
+KEY_FIELD = b"source_key"
+
+
+def source_stat(path):
+    """(size, mtime in ns) of the source file, cheap enough to pass as an st.cache_data argument."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_digest(path):
+    """SHA-256 of the file's content (hex), read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.arrow")
+
+
+def _stored_key(cache_path):
+    """The (size, mtime, digest, tag) the cache file was built for, or None if there is no readable cache."""
+    try:
+        with pa.memory_map(cache_path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    key = metadata.get(KEY_FIELD)
+    if key is None:
+        return None
+    parts = key.decode().split(":", 3)
+    if len(parts) != 4:  # written by an older version
+        return None
+    size, mtime, digest, tag = parts
+    return int(size), int(mtime), digest, tag
+
+
+def _write(frame, cache_path, key):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), KEY_FIELD: ":".join(map(str, key)).encode()})
+    partial = f"{cache_path}.{os.getpid()}.tmp"
+    with pa.OSFile(partial, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(partial, cache_path)  # readers never see a half-written file
+
+
+def _read(cache_path):
+    with pa.memory_map(cache_path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def cached_frame(path, build, cache_path=None, tag=""):
+    """
+    Returns build(path), reusing the Arrow cache when the CSV and `tag` are unchanged.
+    `build` must return a frame Arrow can store (the pandas dtypes, including
+    categoricals and nullable integers, come back as they were).
+    """
+    if pa is None:
+        return build(path)
+    cache_path = cache_path or cache_path_for(path)
+
+    size, mtime = source_stat(path)
+    stored = _stored_key(cache_path)
+    if stored is not None and stored[3] == tag and stored[:2] == (size, mtime):
+        return _read(cache_path)
+
+    digest = file_digest(path)
+    if stored is not None and stored[3] == tag and stored[2] == digest:
+        frame = _read(cache_path)
+    else:
+        frame = build(path)
+    try:
+        _write(frame, cache_path, (size, mtime, digest, tag))
+    except OSError:
+        pass  # read-only deployment: serve the frame, rebuild next time
+    return frame
@@ -0,0 +1,111 @@
+"""
+Data loading for the operational dashboard (clinic_dashboard.py).
+
+build_visits() turns the cleaned CSV into the typed frame the dashboard
+works on: durations included, with the timeline violations of every row
+(see validation) and no durations between flagged times. derive() then adds every column the panels
+group or filter by, declared once in DERIVED_COLUMNS: calendar buckets
+(Day, ISO Week, Month) and category masks. load_visits() serves the result
+through the Arrow cache in columnar_cache, so only the first start after
+the CSV changes pays for parsing and deriving.
+
+Panels only read the frame: they select with the precomputed masks and
+group by the bucket columns instead of converting dates or adding columns.
+"""
+import numpy as np
+import pandas as pd
+
+from columnar_cache import cached_frame
+from validation import check, duration_mask
+from visit_schema import TIME_COLUMNS, to_typed
+
+DATA_FILE = "Cleaned_Clinic_Data_with_Valid_Durations.csv"
+
+# Visit categories left out of the category distribution and monthly mix.
+EXCLUDED_CATEGORIES = ["other", "hypertension", "diabetes"]
+
+
+# Duration column (minutes) -> (start, end) time columns
+DURATIONS = {
+    'Total Visit Duration': ('Registration Start', 'Time Out'),
+    'Doctor Time': ('Doctor In', 'Doctor Out'),
+    'Triage Duration': ('Triage Start', 'Triage End'),
+    'Lab Duration': ('Lab Start', 'Lab End'),
+    'SW Duration': ('SW Start', 'SW End'),
+    'Arrival to Room': ('Registration Start', 'Time Roomed'),
+}
+
+
+def duration_seconds(df, name):
+    """
+    Exact duration in seconds (Int32, <NA> if either end is missing or, once
+    the Violations column is there, if either end failed a timeline check).
+    """
+    start, end = DURATIONS[name]
+    seconds = df[end] - df[start]
+    if "Violations" in df.columns:
+        seconds = seconds.mask((df["Violations"].to_numpy() & duration_mask(start, end)) != 0)
+    return seconds
+
+
+def build_visits(path):
+    # One vectorized pass to typed columns; times become seconds since midnight
+    # (the cleaned CSV keeps seconds), so durations are plain integer differences.
+    df = to_typed(pd.read_csv(path), unit="second")
+    # Out-of-order or out-of-hours times would give negative or huge durations.
+    df["Violations"] = check(df, unit="second")
+    for name in DURATIONS:
+        df[name] = (duration_seconds(df, name) / 60).astype("float64")
+    return df
+
+
+# ----------------- Derived Columns -----------------
+def _month_start(dates):
+    return pd.Series(dates.to_numpy().astype("datetime64[M]").astype(dates.dtype), index=dates.index)
+
+
+def _week_start(dates):
+    # ISO weeks start on Monday, like to_period("W").start_time.
+    return dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+
+
+def _category_in(names):
+    """Mask builder: Visit Category (case-insensitive) is one of `names`, evaluated per distinct category."""
+    def mask(frame):
+        codes, uniques = pd.factorize(frame["Visit Category"])
+        hits = np.append(pd.Series(uniques).str.lower().isin(names).to_numpy(), False)
+        return pd.Series(hits[codes], index=frame.index)
+    return mask
+
+
+# name -> function(frame) returning the column, computed in this order
+DERIVED_COLUMNS = {
+    "Day": lambda frame: frame["Date"].dt.normalize(),
+    "Week": lambda frame: _week_start(frame["Date"].dt.normalize()),
+    "Month": lambda frame: _month_start(frame["Date"]),
+    "Is Other Category": _category_in(["other"]),
+    "Is Excluded Category": _category_in(EXCLUDED_CATEGORIES),
+}
+# Columns some panel reads (MetricsCube, quantiles, occupancy); a filtered
+# view loads only these (see visit_partitions).
+PANEL_COLUMNS = [
+    "Day", "Staff", "Room", "ID", "Visit Type", "Visit Category", "Is Excluded Category", "Violations",
+] + TIME_COLUMNS
+# Bump when build_visits() or DERIVED_COLUMNS changes so cached frames are rebuilt.
+PIPELINE_VERSION = "2"
+
+
+def derive(frame):
+    """Adds every DERIVED_COLUMNS column to `frame` in one vectorized pass per column."""
+    for name, column in DERIVED_COLUMNS.items():
+        frame[name] = column(frame)
+    return frame
+
+
+def build_dashboard_frame(path):
+    return derive(build_visits(path))
+
+
+def load_visits(path=DATA_FILE):
+    """The derived dashboard frame, from the Arrow cache when the CSV has not changed."""
+    return cached_frame(path, build_dashboard_frame, tag=f"dashboard-{PIPELINE_VERSION}")
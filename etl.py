@@ -0,0 +1,292 @@
+"""
+Incremental ETL from the raw intake rows to the cleaned analytics dataset.
+
+The intake app stores each visit as "MM/DD/YYYY" plus "HH:MM" strings. The
+dashboard wants full timestamps, Visit Type / Visit Category and durations.
+clean() derives all of that from raw rows. The time columns are combined
+with the row's own Date, so a 2024-08-10 visit gets 2024-08-10 timestamps.
+
+CleanedStore keeps the result as one CSV per month (cleaned/2024-08.csv,
+...) and a state file with the high-water mark: how many raw rows have been
+consumed. sync() cleans only the rows after the mark. reprocess() re-cleans
+given raw rows (e.g. one day's entries after an edit) and rewrites only the
+month files whose rows actually changed, so the cost depends on the size of
+a month, not of the history. Each cleaned row keeps its raw position
+("Source Row") and a hash of the raw values ("Source Hash") to find changes.
+
+    python etl.py clinic.db cleaned/                   # catch up from the high-water mark
+    python etl.py clinic.db cleaned/ --day 2024-08-10  # re-clean one day
+    python etl.py clinic.db cleaned/ --export clinic.csv
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from dashboard_data import DURATIONS
+from visit_schema import SHEET_COLUMNS, TIME_COLUMNS, format_clock, parse_clock, parse_dates
+
+STATE_FILE = "_state.json"
+MONTH_PATTERN = re.compile(r"\d{4}-\d{2}|undated")
+SOURCE_COLUMNS = SHEET_COLUMNS
+
+# Appointment types that mean a new patient; every other visit is "FP" (follow-up patient).
+NEW_PATIENT_TYPES = ["new patient", "new"]
+
+# (Visit Category, keywords) checked in order against the description, or
+# against the appointment type when there is no description. First match wins.
+CATEGORY_RULES = [
+    ("Ophthalmology", ["opthalmolog", "ophthalmolog", "eye"]),
+    ("Psychiatry", ["psychiatr"]),
+    ("Gynecology", ["gynecolog", "gyn "]),
+    ("New/Physical", ["physical"]),
+    ("Dermatology", ["rash", "dermatolog"]),
+    ("Respiratory", ["covid", "cough", "cold", "sore throat", "strep"]),
+    ("GI", ["abdominal", "digestive", "ibs", "colonoscopy", "pylori"]),
+    ("Musculoskeletal", ["back pain", "knee", "leg pain", "hip", "joint"]),
+    ("Diabetes", ["diabet", "glucose", "neuropathy"]),
+    ("Hypertension", ["hypertension", "htn"]),
+    ("Lab Work", ["lab", "cmp", "a1c", "cbc", "lipid", "tsh", "/ua", " ua"]),
+    ("Rx Refill", ["rx refill"]),
+    ("Referral", ["referral"]),
+    ("Clearance", ["clearance"]),
+    ("Follow-up", ["follow-up", "follow up"]),
+]
+
+
+# ----------------- Transform -----------------
+def _per_text(values, convert):
+    """Applies `convert` to each distinct lowercased text once (descriptions repeat a lot)."""
+    codes, uniques = pd.factorize(values.fillna("").astype(str).str.strip().str.lower())
+    return np.asarray([convert(text) for text in uniques], dtype=object)[codes]
+
+
+def visit_category(text):
+    for category, keywords in CATEGORY_RULES:
+        if any(keyword in text for keyword in keywords):
+            return category
+    return "Other"
+
+
+def source_hash(raw):
+    """Stable per-row hash of the raw intake values (missing cells count as ""), used to spot edited rows."""
+    rows = raw.reindex(columns=SOURCE_COLUMNS).to_numpy(dtype=object)
+    text = pd.Series(["\x1f".join("" if value is None or value != value else str(value) for value in row) for row in rows])
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+def clean(raw, hashes=None):
+    """
+    Raw intake rows (sheet layout; the index is their row position) to
+    cleaned rows: ISO dates, full timestamps on the visit's own date, Visit
+    Type, Visit Category and durations in minutes. `hashes` are the rows'
+    source_hash() values if already computed.
+    """
+    missing = pd.Series(None, index=raw.index, dtype=object)
+    dates = parse_dates(raw["Date"]) if "Date" in raw.columns else pd.Series(pd.NaT, index=raw.index)
+    day = dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
+    columns = {"Date": day.to_numpy()}
+    for col in SOURCE_COLUMNS[1:6]:
+        columns[col] = raw.get(col, missing).to_numpy()
+
+    # All 13 time columns parsed and formatted in one pass over a stacked column.
+    times = raw.reindex(columns=TIME_COLUMNS).to_numpy(dtype=object).ravel()
+    seconds = parse_clock(times, unit="second")
+    labels = format_clock(seconds, unit="second").to_numpy().reshape(len(raw), len(TIME_COLUMNS))
+    seconds = seconds.to_numpy(dtype="float64", na_value=np.nan).reshape(len(raw), len(TIME_COLUMNS))
+    day_prefix = (day.fillna("") + " ").to_numpy()[:, None]
+    absent = pd.isna(labels) | day.isna().to_numpy()[:, None]
+    stamps = np.where(absent, None, day_prefix + np.where(absent, "", labels).astype(object))
+    for i, col in enumerate(TIME_COLUMNS):
+        columns[col] = stamps[:, i]
+
+    appointment = raw.get("Appointment Type", missing)
+    description = raw.get("Describe Appointment Type If Applicable", missing)
+    columns["Visit Type"] = np.where(
+        appointment.fillna("").astype(str).str.strip().str.lower().isin(NEW_PATIENT_TYPES), "New", "FP"
+    )
+    text = description.where(description.fillna("").astype(str).str.strip() != "", appointment)
+    columns["Visit Category"] = _per_text(text, visit_category)
+
+    position = {col: i for i, col in enumerate(TIME_COLUMNS)}
+    for name, (start, end) in DURATIONS.items():
+        columns[name] = (seconds[:, position[end]] - seconds[:, position[start]]) / 60
+
+    columns["Source Row"] = raw.index.to_numpy()
+    columns["Source Hash"] = (source_hash(raw) if hashes is None else np.asarray(hashes)).astype(str)
+    return pd.DataFrame(columns, index=raw.index)
+
+
+# ----------------- Store -----------------
+class CleanedStore:
+    """Month-partitioned cleaned dataset in `folder`, with its high-water mark."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.state = self._load_state()
+        self._hashes = {}  # month -> Source Hash by Source Row, filled as files are read or written
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.folder, STATE_FILE)) as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return {"high_water": 0}
+
+    def _save_state(self):
+        partial = os.path.join(self.folder, STATE_FILE + ".tmp")
+        with open(partial, "w") as handle:
+            json.dump(self.state, handle)
+        os.replace(partial, os.path.join(self.folder, STATE_FILE))
+
+    @property
+    def high_water(self):
+        """Number of raw rows (from the top of the sheet) already cleaned."""
+        return self.state["high_water"]
+
+    def months(self):
+        names = (name[:-4] for name in os.listdir(self.folder) if name.endswith(".csv"))
+        return sorted(name for name in names if MONTH_PATTERN.fullmatch(name))
+
+    def _path(self, month):
+        return os.path.join(self.folder, f"{month}.csv")
+
+    def read_month(self, month):
+        try:
+            rows = pd.read_csv(self._path(month), dtype={"Source Hash": str})
+        except FileNotFoundError:
+            return None
+        self._hashes[month] = rows.set_index("Source Row")["Source Hash"]
+        return rows
+
+    def _month_hashes(self, month):
+        if month not in self._hashes:
+            try:
+                rows = pd.read_csv(self._path(month), usecols=["Source Row", "Source Hash"], dtype={"Source Hash": str})
+            except FileNotFoundError:
+                return pd.Series(dtype=str)
+            self._hashes[month] = rows.set_index("Source Row")["Source Hash"]
+        return self._hashes[month]
+
+    def _write_month(self, month, rows):
+        partial = self._path(month) + ".tmp"
+        rows = rows.sort_values("Source Row", kind="stable")
+        rows.to_csv(partial, index=False)
+        os.replace(partial, self._path(month))
+        self._hashes[month] = rows.set_index("Source Row")["Source Hash"]
+
+    def _upsert(self, cleaned, new_rows=False):
+        """
+        Replaces rows by Source Row, month file by month file, skipping rows
+        whose hash is unchanged. Returns the number of rows written.
+        """
+        written = 0
+        month_of = cleaned["Date"].str[:7].fillna("undated")
+        for month, rows in cleaned.groupby(month_of, sort=False):
+            existing = self.read_month(month)
+            if existing is None:
+                arrived = rows
+                self._write_month(month, rows)
+            else:
+                current = existing.set_index("Source Row")["Source Hash"]
+                known = rows["Source Row"].map(current)
+                rows = rows[known.ne(rows["Source Hash"])]
+                if rows.empty:
+                    continue
+                arrived = rows[known[rows.index].isna()]
+                existing = existing[~existing["Source Row"].isin(rows["Source Row"])]
+                self._write_month(month, pd.concat([existing, rows], ignore_index=True))
+            if not new_rows and not arrived.empty:
+                self._drop_elsewhere(arrived["Source Row"], keep=month)
+            written += len(rows)
+        return written
+
+    def _drop_elsewhere(self, source_rows, keep):
+        """Removes older copies of rows whose Date moved to another month (rare; scans the other files)."""
+        for month in self.months():
+            if month == keep:
+                continue
+            existing = self.read_month(month)
+            stale = existing["Source Row"].isin(source_rows)
+            if stale.any():
+                self._write_month(month, existing[~stale])
+
+    def sync(self, source):
+        """Cleans the raw rows added since the high-water mark. `source` is a StorageBackend."""
+        start = self.high_water
+        tail = source.read_rows(start, SOURCE_COLUMNS)
+        if tail.empty:
+            return 0
+        tail.index = pd.RangeIndex(start, start + len(tail))
+        written = self._upsert(clean(tail), new_rows=True)
+        self.state["high_water"] = start + len(tail)
+        self._save_state()
+        return written
+
+    def reprocess(self, raw):
+        """
+        Re-cleans raw rows whose index is their row position (e.g. one day's
+        visits after an edit). Unchanged rows are skipped, so only months
+        with real changes are rewritten. Returns the number of rows written.
+        """
+        raw = raw[raw.index < self.high_water]
+        if raw.empty:
+            return 0
+        # Compare hashes first so unchanged rows are never re-cleaned or rewritten.
+        hashes = pd.Series(source_hash(raw).astype(str), index=raw.index)
+        months = parse_dates(raw["Date"]).dt.strftime("%Y-%m").fillna("undated")
+        changed = pd.Series(False, index=raw.index)
+        for month, rows in hashes.groupby(months.to_numpy(), sort=False):
+            changed[rows.index] = rows.index.map(self._month_hashes(month)) != rows.to_numpy()
+        if not changed.any():
+            return 0
+        return self._upsert(clean(raw[changed.to_numpy()], hashes[changed]))
+
+    def read(self, months=None):
+        """The cleaned rows of `months` (all by default) in raw row order."""
+        frames = [self.read_month(month) for month in (months or self.months())]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values("Source Row", kind="stable", ignore_index=True)
+
+    def export_csv(self, path):
+        """Writes the whole cleaned dataset as one CSV in the dashboard's layout."""
+        self.read().drop(columns=["Source Row", "Source Hash"]).to_csv(path, index=False)
+
+
+# ----------------- CLI -----------------
+def _open_source(path):
+    from storage import LocalSheetConnection, SQLiteBackend
+
+    if path.endswith(".csv"):
+        return LocalSheetConnection(pd.read_csv(path))
+    return SQLiteBackend(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="raw intake rows: a SQLite file (storage.SQLiteBackend) or a CSV export of the sheet")
+    parser.add_argument("folder", help="folder of the month-partitioned cleaned dataset")
+    parser.add_argument("--day", help="re-clean the visits of this day (YYYY-MM-DD)")
+    parser.add_argument("--export", help="also write the whole cleaned dataset to this CSV")
+    args = parser.parse_args(argv)
+
+    source = _open_source(args.source)
+    store = CleanedStore(args.folder)
+    written = store.sync(source)
+    print(f"synced: {written} rows written, high-water mark {store.high_water}")
+    if args.day:
+        raw = source.read_day(pd.Timestamp(args.day), SOURCE_COLUMNS)  # only that day's rows, by position
+        print(f"{args.day}: {store.reprocess(raw)} of {len(raw)} rows rewritten")
+    if args.export:
+        store.export_csv(args.export)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
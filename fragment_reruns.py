@@ -0,0 +1,49 @@
+"""
+Fragment-scoped reruns of an app under AppTest, and counts of what they ran.
+
+In the browser, a widget change inside an st.fragment reruns only that
+fragment. AppTest.run() always reruns the whole script, so rerun_fragment()
+sends the script runner the request the browser sends: a rerun with the
+fragment's id in its queue. Streamlit has no public API for finding that id
+or for queueing it, so both are kept to this module.
+
+What ran is counted from the app's profiler spans (see profiler.py), which
+needs [profiler] enabled in the app's secrets:
+
+    app_test = AppTest.from_file("streamlit_app.py")
+    app_test.secrets["profiler"] = {"enabled": True, "panel": False}
+    app_test.run()
+    before = span_counts("intake")
+    rerun_fragment(app_test, "edit_patient_section")
+    span_counts("intake") - before      # Counter({"section.edit_patient": 1, "lookup": 2})
+"""
+import functools
+from collections import Counter
+from unittest import mock
+
+from profiler import PROFILER
+
+
+def fragment_id(app_test, name):
+    """The id Streamlit registered for the fragment function `name` in the last run."""
+    for registered, wrapped in app_test._fragment_storage._fragments.items():
+        for cell in wrapped.__closure__ or ():
+            if getattr(cell.cell_contents, "__name__", None) == name:
+                return registered
+    raise KeyError(f"No fragment {name!r} ran; fragments run only when the script reaches them")
+
+
+def rerun_fragment(app_test, name):
+    """Reruns only the fragment function `name`, as after a widget change inside it. Returns app_test."""
+    from streamlit.testing.v1 import local_script_runner
+
+    queued = functools.partial(local_script_runner.RerunData, fragment_id_queue=[fragment_id(app_test, name)])
+    with mock.patch.object(local_script_runner, "RerunData", queued):
+        return app_test.run()
+
+
+def span_counts(app, profiler=PROFILER):
+    """How often each span of `app` has been recorded so far, as a Counter."""
+    summary = profiler.summary()
+    summary = summary[summary["App"] == app]
+    return Counter(dict(zip(summary["Span"], summary["Count"])))
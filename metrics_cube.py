@@ -0,0 +1,129 @@
+"""
+Pre-aggregated cube behind the dashboard panels.
+
+Each dashboard panel used to group the raw visit rows on every rerun.
+MetricsCube groups them once by (Day, Staff, Visit Type, Visit Category,
+excluded flag) and keeps, per cell, the visit count, the number of known
+IDs, the first row number (so value counts break ties like pandas does),
+the visits with out-of-order or out-of-hours times, the visits with both
+triage times and for every duration the sum in exact integer seconds and its non-null
+count. A panel then rolls the cells up: a group-reduce over thousands of
+cells instead of millions of rows.
+
+Means are sum / count over whole seconds, so they equal the raw-row means
+up to float rounding of the minute values (never visible at one decimal);
+tests/test_metrics_cube.py compares every rollup with the raw computation.
+"""
+import numpy as np
+import pandas as pd
+
+from dashboard_data import DURATIONS, duration_seconds
+from validation import BLOCKING
+
+CUBE_KEYS = ["Day", "Staff", "Visit Type", "Visit Category", "Is Excluded Category"]
+# Stage name -> the duration behind it, for the bottleneck panel
+BOTTLENECK_STAGES = {"Triage": "Triage Duration", "Lab": "Lab Duration", "SW": "SW Duration"}
+
+
+class MetricsCube:
+    """
+    cells: one row per observed key combination (missing keys included) with
+    the CUBE_KEYS, Week and Month, and the measures Visits, IDs, First Row,
+    Flagged, Triage Recorded, "<duration> Sum" (seconds) and "<duration> Count"
+    (durations between flagged times are not counted).
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    @classmethod
+    def build(cls, frame):
+        measures = pd.DataFrame({key: frame[key] for key in CUBE_KEYS})
+        measures["Visits"] = 1
+        measures["IDs"] = frame["ID"].notna()
+        measures["First Row"] = np.arange(len(frame))
+        measures["Flagged"] = (frame["Violations"].to_numpy() & BLOCKING) != 0
+        measures["Triage Recorded"] = frame["Triage Start"].notna() & frame["Triage End"].notna()
+        for name in DURATIONS:
+            seconds = duration_seconds(frame, name)
+            measures[f"{name} Sum"] = seconds.fillna(0).astype("int64")
+            measures[f"{name} Count"] = seconds.notna()
+
+        how = {col: "sum" for col in measures.columns if col not in CUBE_KEYS}
+        how["First Row"] = "min"
+        cells = measures.groupby(CUBE_KEYS, dropna=False, observed=True, sort=False).agg(how).reset_index()
+        cells["Week"] = cells["Day"] - pd.to_timedelta(cells["Day"].dt.weekday, unit="D")
+        cells["Month"] = pd.Series(cells["Day"].to_numpy().astype("datetime64[M]").astype(cells["Day"].dtype))
+        return cls(cells)
+
+    def _cells(self, where):
+        return self.cells if where is None else self.cells[where]
+
+    # ----------------- Rollups -----------------
+    def total(self, measure="Visits", where=None):
+        return int(self._cells(where)[measure].sum())
+
+    def rollup(self, by, measure="Visits", where=None):
+        """Sum of `measure` per `by` group (missing keys dropped, groups sorted), like groupby().size()."""
+        return self._cells(where).groupby(by, observed=True)[measure].sum()
+
+    def mean(self, duration, by=None, where=None):
+        """Mean of a duration in minutes, overall or per `by` group (NaN where it was never recorded)."""
+        cells = self._cells(where)
+        if by is None:
+            count = cells[f"{duration} Count"].sum()
+            return cells[f"{duration} Sum"].sum() / count / 60 if count else np.nan
+        groups = cells.groupby(by, observed=True)
+        sums, counts = groups[f"{duration} Sum"].sum(), groups[f"{duration} Count"].sum()
+        means = (sums / counts.where(counts > 0)) / 60
+        return means.rename(duration)
+
+    def value_counts(self, key, where=None, normalize=False):
+        """Series.value_counts() of a key column: most frequent first, ties in order of first appearance."""
+        groups = self._cells(where).groupby(key, observed=True)
+        counts = groups["Visits"].sum()
+        counts = counts[groups["First Row"].min().sort_values(kind="stable").index]
+        counts = counts.sort_values(ascending=False, kind="stable")
+        if normalize:
+            return (counts / counts.sum()).rename("proportion")
+        return counts.rename("count")
+
+    def bottlenecks(self, where=None):
+        """Mean minutes of each BOTTLENECK_STAGES stage (NaN where it was never recorded)."""
+        return {stage: self.mean(duration, where=where) for stage, duration in BOTTLENECK_STAGES.items()}
+
+    def monthly_mix(self, where=None):
+        """Visits per Month (rows) and Visit Category (columns), excluded categories left out."""
+        keep = ~self.cells["Is Excluded Category"]
+        if where is not None:
+            keep &= where
+        return self.rollup(["Month", "Visit Category"], where=keep).unstack().fillna(0)
+
+    def date_range(self):
+        return self.cells["Day"].min(), self.cells["Day"].max()
+
+
+def mix_change(monthly_mix):
+    """
+    Month-over-month change of the last two months of a monthly_mix() table:
+    both months' counts and the % change per category with activity in
+    either. None with fewer than two months.
+    """
+    if len(monthly_mix) < 2:
+        return None
+    last_month = monthly_mix.iloc[-1]
+    prev_month = monthly_mix.iloc[-2]
+
+    # Only keep categories with activity in both months
+    mask = (prev_month > 0) | (last_month > 0)
+    last_month = last_month[mask]
+    prev_month = prev_month[mask]
+
+    # Compute % change with divide-by-zero handling
+    delta = ((last_month - prev_month) / prev_month.replace(0, 1))
+
+    return pd.DataFrame({
+        prev_month.name.strftime("%B %Y"): prev_month.astype(int),  # e.g., "February 2025"
+        last_month.name.strftime("%B %Y"): last_month.astype(int),  # e.g., "March 2025"
+        '% Change': delta.apply(lambda x: f"{x:+.1%}")
+    }).sort_values(by='% Change', ascending=False)
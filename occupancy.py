@@ -0,0 +1,151 @@
+"""
+Per-minute occupancy of the clinic's stages, rooms and doctors.
+
+Each recorded stage interval (see STAGES) becomes a +1 event at its start
+and a -1 event at its end on a minute grid covering clinic hours, one grid
+row per (group, day). Counting the events per minute (np.bincount) and
+summing them along the day (np.cumsum) gives, for every minute, how many
+patients were in the stage at that minute's start: a sweep over all
+intervals at once, linear in visits plus grid minutes.
+
+    waiting = Occupancy.build(frame, "Waiting for Room")
+    rooms = Occupancy.build(frame, "Exam", by="Room")
+    rooms.peaks()        # highest occupancy per room and when it happened
+    waiting.by_hour()    # average patients waiting per hour of the day
+    waiting.littles_law()
+
+littles_law() applies L = lambda * W per hour of the day: the average
+number of patients in a stage (L) over the rate they enter it (lambda)
+estimates the time they spend there (W), also for hours where few end
+times were recorded. Over a whole day it equals the mean recorded duration.
+
+Intervals with a missing end, or an end point flagged by validation (when
+the frame has a Violations column), are left out, as for the durations.
+"""
+import numpy as np
+import pandas as pd
+
+from validation import CLINIC_HOURS, duration_mask
+from visit_schema import TIME_UNITS
+
+# Stage -> (start, end) time columns; the patient is in the stage from start until end.
+STAGES = {
+    "In Clinic": ("Registration Start", "Time Out"),
+    "Waiting for Room": ("Registration Start", "Time Roomed"),
+    "Triage": ("Triage Start", "Triage End"),
+    "Exam": ("Time Roomed", "Exam End"),
+    "Doctor": ("Doctor In", "Doctor Out"),
+    "Lab": ("Lab Start", "Lab End"),
+    "SW": ("SW Start", "SW End"),
+}
+
+
+def _intervals(frame, stage, unit):
+    """Start and end in seconds since midnight (float) and the rows where both are usable."""
+    start, end = STAGES[stage]
+    per_unit = TIME_UNITS[unit][1]
+    begins = frame[start].to_numpy(dtype="float64", na_value=np.nan) * per_unit
+    ends = frame[end].to_numpy(dtype="float64", na_value=np.nan) * per_unit
+    usable = ~np.isnan(begins) & ~np.isnan(ends) & (ends >= begins)
+    if "Violations" in frame.columns:
+        usable &= (frame["Violations"].to_numpy() & duration_mask(start, end)) == 0
+    return begins, ends, usable
+
+
+class Occupancy:
+    """
+    counts[g, d, m]: patients in `stage` for groups[g] on days[d] at minute
+    first_minute + m; arrivals[g, d, h]: intervals that began in hour h.
+    """
+
+    def __init__(self, stage, groups, days, counts, arrivals, first_minute):
+        self.stage = stage
+        self.groups = groups
+        self.days = days
+        self.counts = counts
+        self.arrivals = arrivals
+        self.first_minute = first_minute
+
+    @classmethod
+    def build(cls, frame, stage, by=None, unit="second", hours=CLINIC_HOURS):
+        """
+        Occupancy of `stage` per minute of clinic `hours` for every day in the
+        frame, overall or per `by` column value (rows where it is missing are
+        left out). The frame is typed (see visit_schema.to_typed), its time
+        columns counting `unit`s since midnight.
+        """
+        begins, ends, usable = _intervals(frame, stage, unit)
+        dates = frame["Day"] if "Day" in frame.columns else frame["Date"].dt.normalize()
+        day_codes, days = pd.factorize(dates, sort=True)
+        if by is None:
+            group_codes, groups = np.zeros(len(frame), dtype=np.intp), pd.Index(["All"])
+        else:
+            group_codes, groups = pd.factorize(frame[by], sort=True)
+            groups = pd.Index(groups, name=by)
+        usable &= (day_codes >= 0) & (group_codes >= 0)
+
+        # A patient counts at minute m when start <= m:00 < end.
+        first_minute, last_minute = hours[0] // 60, hours[1] // 60
+        width = last_minute - first_minute + 1
+        first_in = np.clip(np.ceil(begins[usable] / 60) - first_minute, 0, width).astype(np.int64)
+        first_out = np.clip(np.ceil(ends[usable] / 60) - first_minute, 0, width).astype(np.int64)
+        rows = group_codes[usable].astype(np.int64) * len(days) + day_codes[usable]
+
+        # +1 / -1 events on a grid with one spare column for intervals still open at closing.
+        events = np.bincount(rows * (width + 1) + first_in, minlength=len(groups) * len(days) * (width + 1))
+        events -= np.bincount(rows * (width + 1) + first_out, minlength=len(events))
+        counts = np.cumsum(events.reshape(len(groups), len(days), width + 1), axis=2)[..., :width]
+        counts = counts.astype(np.int32)
+
+        hour = (begins[usable] // 3600).astype(np.int64)
+        arrivals = np.bincount(rows * 24 + hour, minlength=len(groups) * len(days) * 24)
+        return cls(stage, groups, days, counts, arrivals.reshape(len(groups), len(days), 24), first_minute)
+
+    # ----------------- Reads -----------------
+    def minutes(self):
+        """Minute of the day of each grid column."""
+        return self.first_minute + np.arange(self.counts.shape[2])
+
+    def timeline(self, day):
+        """Occupancy per minute of one day: a DataFrame indexed by time, one column per group."""
+        d = self.days.get_loc(pd.Timestamp(day))
+        index = pd.Timestamp(self.days[d]) + pd.to_timedelta(self.minutes(), unit="min")
+        return pd.DataFrame(self.counts[:, d, :].T, index=index, columns=self.groups)
+
+    def by_hour(self):
+        """Average occupancy per hour of the day (over every day in the data), one column per group."""
+        minutes = self.minutes()
+        hours = minutes // 60
+        sums = np.add.reduceat(self.counts.sum(axis=1), np.flatnonzero(np.diff(hours, prepend=-1)), axis=1)
+        per_hour = sums / (np.bincount(hours - hours[0]) * len(self.days))
+        index = pd.Index([f"{h:02d}:00" for h in np.unique(hours)], name="Hour")
+        return pd.DataFrame(per_hour.T, index=index, columns=self.groups)
+
+    def peaks(self):
+        """Per group: the highest occupancy, the first minute it was reached (NaT if never) and the average over clinic hours."""
+        flat = self.counts.reshape(len(self.groups), -1)
+        at = flat.argmax(axis=1)
+        days, minutes = np.divmod(at, self.counts.shape[2])
+        peak = flat.max(axis=1)
+        when = (self.days[days] + pd.to_timedelta(self.minutes()[minutes], unit="min")).where(peak > 0)
+        return pd.DataFrame({"Peak": peak, "Peak At": when, "Average": flat.mean(axis=1)}, index=self.groups)
+
+    def littles_law(self):
+        """
+        Per hour of the day, summed over groups: average patients in the
+        stage (L), arrivals per hour (lambda) and the minutes in the stage
+        that implies (W = L / lambda).
+        """
+        in_stage = self.by_hour().sum(axis=1)
+        hours = np.unique(self.minutes() // 60)
+        per_hour = self.arrivals.sum(axis=(0, 1))[hours] / len(self.days)
+        result = pd.DataFrame({"Average in Stage": in_stage.to_numpy(), "Arrivals per Hour": per_hour},
+                              index=in_stage.index)
+        result["Estimated Minutes"] = (result["Average in Stage"] / (result["Arrivals per Hour"] / 60)).where(
+            result["Arrivals per Hour"] > 0)
+        return result
+
+    def average_minutes(self):
+        """W = L / lambda over whole days: the mean time in the stage (equals the mean recorded duration)."""
+        entered = self.arrivals.sum()
+        return self.counts.sum() / entered if entered else np.nan
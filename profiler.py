@@ -0,0 +1,236 @@
+"""
+Timing spans for the hot paths of both apps.
+
+    from profiler import PROFILER
+
+    PROFILER.start_run("intake")          # top of the script
+    with PROFILER.span("fetch"):
+        frame = replica.sync()
+    PROFILER.checkpoint("panel.flow")     # time since the previous checkpoint
+    PROFILER.finish_run()                 # end of the script
+
+Every span is kept per (app, span) in a rolling window for p50/p95 and in
+running totals. Each finished run (a full rerun, or a fragment rerun via
+traced()) can be appended to a JSON lines file, and the aggregates written
+as a Prometheus text file for a node_exporter textfile collector.
+render_panel() shows the table inside the app.
+
+It is off unless the [profiler] section of secrets.toml says otherwise:
+
+    [profiler]
+    enabled = true
+    panel = true                    # show the admin panel
+    jsonl = "profile.jsonl"         # one line per run
+    prometheus = "clinic.prom"      # rewritten after every run
+    window = 500                    # samples kept per span for p50/p95
+
+When disabled, span() returns a shared no-op context manager and the other
+calls return after one attribute check.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_NULL_SPAN = contextlib.nullcontext()
+# The [profiler] keys configure() takes; any other key is ignored with a warning.
+SETTINGS = ("enabled", "panel", "window", "jsonl", "prometheus")
+
+
+class _Run:
+    def __init__(self, app):
+        self.app = app
+        self.started = time.time()
+        self.last = time.perf_counter()
+        self.spans = Counter()
+
+
+class Profiler:
+    """Process-wide collector; the current run is tracked per script thread."""
+
+    def __init__(self):
+        self.app = "-"  # the app this process serves, set by start_run()
+        self.enabled = False
+        self.panel = True
+        self.window = 500
+        self.jsonl = None
+        self.prometheus = None
+        self._samples = {}  # (app, span) -> deque of seconds
+        self._totals = {}   # (app, span) -> [count, seconds]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, enabled=False, panel=True, window=500, jsonl=None, prometheus=None):
+        self.enabled = bool(enabled)
+        self.panel = bool(panel)
+        self.jsonl = jsonl
+        self.prometheus = prometheus
+        if window != self.window:
+            with self._lock:
+                self.window = window
+                self._samples = {key: deque(samples, maxlen=window) for key, samples in self._samples.items()}
+
+    def configure_from(self, secrets):
+        """Applies the [profiler] section of st.secrets (disabled if there is none); unknown keys only warn."""
+        try:
+            section = dict(secrets.get("profiler", {}))
+        except FileNotFoundError:
+            section = {}
+        unknown = sorted(set(section) - set(SETTINGS))
+        if unknown:
+            logger.warning("Ignoring unknown [profiler] settings %s (known: %s)", ", ".join(unknown), ", ".join(SETTINGS))
+        self.configure(**{key: value for key, value in section.items() if key in SETTINGS})
+
+    # ----------------- Runs -----------------
+    def start_run(self, app):
+        if not self.enabled:
+            return
+        self.finish_run()  # a run in this thread cut short by st.rerun() or st.stop()
+        self.app = app
+        self._local.run = _Run(app)
+
+    def finish_run(self):
+        run = getattr(self._local, "run", None)
+        if run is None:
+            return
+        self._local.run = None
+        if run.spans:
+            self._export(run)
+
+    def traced(self, name):
+        """
+        Decorator for st.fragment functions: times the call as span `name`, and
+        when the fragment reruns on its own, records that rerun as a run.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                own_run = getattr(self._local, "run", None) is None
+                if own_run:
+                    self._local.run = _Run(self.app)
+                try:
+                    with self.span(name):
+                        return fn(*args, **kwargs)
+                finally:
+                    if own_run:
+                        self.finish_run()
+            return wrapper
+        return decorate
+
+    # ----------------- Spans -----------------
+    def span(self, name):
+        """Context manager timing its block as `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def checkpoint(self, name):
+        """Records the time since the previous checkpoint (or the start of the run) as `name`."""
+        if not self.enabled:
+            return
+        run = getattr(self._local, "run", None)
+        if run is None:
+            return
+        now = time.perf_counter()
+        self._record(name, now - run.last)
+        run.last = now
+
+    def _record(self, name, seconds):
+        run = getattr(self._local, "run", None)
+        key = (run.app if run is not None else self.app, name)
+        if run is not None:
+            run.spans[name] += seconds
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+                self._totals[key] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += seconds
+
+    # ----------------- Reports -----------------
+    def summary(self):
+        """One row per (app, span): samples seen and p50 / p95 / last over the rolling window, in ms."""
+        with self._lock:
+            rows = [
+                (app, span, self._totals[(app, span)][0], *(np.percentile(samples, [50, 95]) * 1000), samples[-1] * 1000)
+                for (app, span), samples in self._samples.items()
+            ]
+        frame = pd.DataFrame(rows, columns=["App", "Span", "Count", "p50 ms", "p95 ms", "Last ms"])
+        return frame.sort_values("p95 ms", ascending=False, ignore_index=True)
+
+    def prometheus_text(self):
+        """The aggregates in the Prometheus text exposition format (a summary per span)."""
+        lines = [
+            "# HELP clinic_span_seconds Wall time of instrumented app stages (quantiles over the rolling window).",
+            "# TYPE clinic_span_seconds summary",
+        ]
+        with self._lock:
+            for (app, span), samples in sorted(self._samples.items()):
+                labels = f'app="{app}",span="{span}"'
+                for quantile, value in zip(("0.5", "0.95"), np.percentile(samples, [50, 95])):
+                    lines.append(f'clinic_span_seconds{{{labels},quantile="{quantile}"}} {value:.6f}')
+                count, total = self._totals[(app, span)]
+                lines.append(f"clinic_span_seconds_sum{{{labels}}} {total:.6f}")
+                lines.append(f"clinic_span_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def _export(self, run):
+        try:
+            if self.jsonl:
+                record = {
+                    "app": run.app,
+                    "started": round(run.started, 3),
+                    "spans_ms": {name: round(seconds * 1000, 3) for name, seconds in run.spans.items()},
+                }
+                with open(self.jsonl, "a") as out:
+                    out.write(json.dumps(record) + "\n")
+            if self.prometheus:
+                partial = f"{self.prometheus}.{os.getpid()}.tmp"
+                with open(partial, "w") as out:
+                    out.write(self.prometheus_text())
+                os.replace(partial, self.prometheus)  # scrapers never see a half-written file
+        except OSError:
+            pass  # read-only deployment: the in-app panel still works
+
+
+PROFILER = Profiler()
+
+
+def render_panel(profiler=PROFILER):
+    """Admin panel: the rolling span table plus both exports as downloads."""
+    import streamlit as st
+
+    if not (profiler.enabled and profiler.panel):
+        return
+    with st.expander("Profiler (admin)"):
+        summary = profiler.summary()
+        if summary.empty:
+            st.info("No spans recorded yet.")
+            return
+        st.dataframe(summary.round(2), hide_index=True)
+        st.download_button("Prometheus text", profiler.prometheus_text(), file_name="clinic.prom")
+        if profiler.jsonl and os.path.exists(profiler.jsonl):
+            with open(profiler.jsonl) as runs:
+                st.download_button("Runs (JSON lines)", runs.read(), file_name=os.path.basename(profiler.jsonl))
@@ -0,0 +1,178 @@
+"""
+Mergeable quantile sketches of the visit durations.
+
+The dashboard means hide the long tail (the p90 wait is what patients
+notice), and exact percentiles would sort every visit in the selection on
+each rerun. DurationSketches keeps, per duration and per (Day, Staff), a
+log-bucketed histogram of the duration in seconds: bucket i > 0 holds the
+durations in (GAMMA^(i-2), GAMMA^(i-1)], bucket 0 the zero-length ones.
+Sketches merge by adding bucket counts, so any date range or staff
+selection is one bincount over its (day, staff, bucket) rows, and a
+quantile read from the merged histogram is within ALPHA (relative) of the
+exact value at the same rank (np.quantile(..., method="lower")), however
+many visits went in (tests/test_quantiles.py checks both on generated rows).
+
+The sketch table is stored as an Arrow file next to the CSV, like the
+dashboard frame (see columnar_cache), and rebuilt when the CSV changes.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import cached_frame
+from dashboard_data import DATA_FILE, DURATIONS, PIPELINE_VERSION, duration_seconds, load_visits
+
+ALPHA = 0.01  # relative accuracy of every quantile
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+QUANTILES = (0.5, 0.9, 0.99)
+# Bucket count covering durations up to a full day (longer ones share the last bucket).
+BUCKETS = int(np.ceil(np.log(24 * 3600) / np.log(GAMMA))) + 2
+
+
+def bucket_of(seconds):
+    """Histogram bucket of each duration in whole seconds (0 for zero or negative)."""
+    seconds = np.asarray(seconds, dtype="float64")
+    buckets = np.zeros(len(seconds), dtype=np.int16)
+    positive = seconds > 0
+    index = np.ceil(np.log(seconds[positive]) / np.log(GAMMA)) + 1
+    buckets[positive] = np.minimum(index, BUCKETS - 1)
+    return buckets
+
+
+def bucket_value(buckets):
+    """Seconds a bucket stands for: the point within ALPHA of every value in it."""
+    buckets = np.asarray(buckets)
+    return np.where(buckets > 0, 2 * GAMMA ** (buckets - 1.0) / (GAMMA + 1), 0.0)
+
+
+def _label(q):
+    return f"p{q * 100:g}"
+
+
+def _quantiles(histogram, qs):
+    """Seconds at each quantile of one histogram (NaN when it is empty)."""
+    total = histogram.sum()
+    if not total:
+        return np.full(len(qs), np.nan)
+    ranks = np.floor(np.asarray(qs) * (total - 1))
+    return bucket_value(np.searchsorted(np.cumsum(histogram), ranks, side="right"))
+
+
+class DurationSketches:
+    """
+    counts: one row per (Duration, Day, Staff, Bucket) with the number of
+    visits (Count) whose duration falls in that bucket; missing Staff kept.
+    """
+
+    def __init__(self, counts):
+        self.counts = counts
+        # Per duration, rows sorted by Day so a date range is a slice.
+        self._tables = {}
+        for name, table in counts.groupby("Duration", observed=True, sort=False):
+            table = table.sort_values("Day", kind="stable")
+            self._tables[name] = (
+                table["Day"].to_numpy(),
+                table["Staff"].cat.codes.to_numpy(dtype=np.intp),
+                table["Bucket"].to_numpy(dtype=np.intp),
+                table["Count"].to_numpy(dtype="float64"),
+            )
+        self.staff = counts["Staff"].cat.categories
+
+    @classmethod
+    def build(cls, frame):
+        """Sketches of every DURATIONS column of a dashboard frame (see dashboard_data.load_visits)."""
+        day_codes, days = pd.factorize(frame["Day"], sort=True)
+        staff = pd.Categorical(frame["Staff"])
+        staff_codes = staff.codes.astype(np.int64) + 1  # 0 = unknown staff
+        # One int64 key per (day, staff, bucket), so counting is a single np.unique.
+        cell = (day_codes.astype(np.int64) * (len(staff.categories) + 1) + staff_codes) * BUCKETS
+        parts = []
+        for name in DURATIONS:
+            seconds = duration_seconds(frame, name)
+            recorded = seconds.notna().to_numpy()
+            keys, counts = np.unique(cell[recorded] + bucket_of(seconds[recorded].to_numpy(dtype="float64")),
+                                     return_counts=True)
+            cells = keys // BUCKETS
+            parts.append(pd.DataFrame({
+                "Duration": name,
+                "Day": days[cells // (len(staff.categories) + 1)],
+                "Staff": pd.Categorical.from_codes(cells % (len(staff.categories) + 1) - 1, staff.categories),
+                "Bucket": keys % BUCKETS,
+                "Count": counts,
+            }))
+        return cls(cls._normalized(pd.concat(parts, ignore_index=True)))
+
+    @classmethod
+    def merge(cls, sketches):
+        """One set of sketches from several (e.g. one per clinic): bucket counts add up."""
+        counts = pd.concat([part.counts.astype({"Duration": str, "Staff": object}) for part in sketches],
+                           ignore_index=True)
+        keys = ["Duration", "Day", "Staff", "Bucket"]
+        counts = counts.groupby(keys, dropna=False, sort=False)["Count"].sum().reset_index()
+        return cls(cls._normalized(counts))
+
+    @staticmethod
+    def _normalized(counts):
+        counts["Duration"] = pd.Categorical(counts["Duration"], categories=list(DURATIONS))
+        counts["Staff"] = counts["Staff"].astype("category")
+        counts["Bucket"] = counts["Bucket"].astype(np.int16)
+        counts["Count"] = counts["Count"].astype("int64")
+        return counts[["Duration", "Day", "Staff", "Bucket", "Count"]]
+
+    def _rows(self, duration, days, staff):
+        if duration not in self._tables:
+            return np.array([], dtype=int), np.array([], dtype=np.intp), np.array([])
+        day, codes, buckets, counts = self._tables[duration]
+        if days is not None:
+            first, last = (pd.Timestamp(value).to_datetime64().astype(day.dtype) for value in days)
+            window = slice(day.searchsorted(first, "left"), day.searchsorted(last, "right"))
+            codes, buckets, counts = codes[window], buckets[window], counts[window]
+        if staff is not None:
+            picked = np.isin(codes, self.staff.get_indexer(list(staff)))
+            codes, buckets, counts = codes[picked], buckets[picked], counts[picked]
+        return codes, buckets, counts
+
+    # ----------------- Reads -----------------
+    def count(self, duration, days=None, staff=None):
+        """Visits with this duration recorded in the selection."""
+        return int(self._rows(duration, days, staff)[2].sum())
+
+    def quantiles(self, duration, qs=QUANTILES, by=None, days=None, staff=None):
+        """
+        Quantiles of a duration in minutes over the visits whose Day lies in
+        `days` (first, last; inclusive) and whose Staff is in `staff` (default:
+        all, unknown staff included). A Series labelled p50, p90, ..., or with
+        by="Staff" one row per staff member who has any.
+        """
+        codes, buckets, counts = self._rows(duration, days, staff)
+        labels = [_label(q) for q in qs]
+        if by is None:
+            histogram = np.bincount(buckets, weights=counts, minlength=BUCKETS)
+            return pd.Series(_quantiles(histogram, qs) / 60, index=labels, name=duration)
+        if by != "Staff":
+            raise ValueError(f"sketches are kept per Staff and Day, not per {by!r}")
+        known = codes >= 0
+        histograms = np.bincount(codes[known] * BUCKETS + buckets[known], weights=counts[known],
+                                 minlength=len(self.staff) * BUCKETS).reshape(len(self.staff), BUCKETS)
+        present = histograms.sum(axis=1) > 0
+        rows = [_quantiles(histogram, qs) / 60 for histogram in histograms[present]]
+        return pd.DataFrame(rows, index=pd.Index(self.staff[present], name="Staff"), columns=labels)
+
+
+def sketch_cache_path(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.sketches.arrow")
+
+
+def load_sketches(path=DATA_FILE, frame=None):
+    """
+    The sketches of the CSV at `path`, from their Arrow file when the CSV has
+    not changed; otherwise built from `frame` (or the loaded dashboard frame).
+    """
+    def build(source):
+        return DurationSketches.build(load_visits(source) if frame is None else frame).counts
+
+    counts = cached_frame(path, build, cache_path=sketch_cache_path(path),
+                          tag=f"sketches-{PIPELINE_VERSION}-{ALPHA}")
+    return DurationSketches(counts)
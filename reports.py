@@ -0,0 +1,274 @@
+"""
+Monthly report packets, one per doctor and month, rendered without the dashboard.
+
+    python reports.py                                   # every doctor and month of DATA_FILE
+    python reports.py visits.csv packets/ --workers 8
+    python reports.py --months 2025-02 2025-03 --force
+
+Each packet (reports/2025-03/dr-jon-pierson.html) holds the doctor's visits,
+patients, average doctor time and visit duration next to the previous
+month's, the bottleneck stage, the visit mix and the month-over-month visit
+category change. The numbers are MetricsCube rollups, the code behind the
+dashboard panels, with the cells narrowed to the doctor and month.
+
+Months are rendered in a process pool, one task per month. The workers get
+no copy of the frame: each opens the month-partitioned Arrow store (see
+visit_partitions) and memory-maps the month and the one before it, so the
+files sit once in the OS page cache however many workers read them, and a
+worker only converts the rows it reports on.
+
+A report whose inputs did not change is skipped. _reports.json in the output
+folder keeps, per month, the digests of the two partitions it read and of
+each doctor's rows in them: a month whose partitions did not change is not
+read at all, and in a month that did only the doctors whose rows changed
+are rendered again.
+"""
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from dashboard_data import DATA_FILE, PANEL_COLUMNS
+from metrics_cube import MetricsCube, mix_change
+from visit_partitions import UNDATED, VisitFilter, VisitPartitions, rows_digest
+
+# Bump when the packet layout changes so every report is rendered again.
+REPORT_VERSION = "1"
+STATE = "_reports.json"
+OUTPUT_FOLDER = "reports"
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 1em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{sections}
+</body>
+</html>
+"""
+
+# rendered: reports written; unchanged: reports skipped; months_read: months a worker loaded
+ReportRun = namedtuple("ReportRun", ["rendered", "unchanged", "months_read", "months", "seconds"])
+
+_partitions = None  # a worker's VisitPartitions, opened once per process
+
+
+def report_file(doctor):
+    """File name of a doctor's packet: "Dr. Jon Pierson" -> "dr-jon-pierson.html"."""
+    return re.sub(r"[^a-z0-9]+", "-", doctor.lower()).strip("-") + ".html"
+
+
+def previous_month(month):
+    return str(pd.Period(month, "M") - 1)
+
+
+# ----------------- Packets -----------------
+def _change(now, before):
+    if pd.isna(now) or pd.isna(before) or not before:
+        return ""
+    return f"{(now - before) / before:+.1%}"
+
+
+def _cell(value):
+    """Counts as integers, minutes with one decimal, blank when never recorded."""
+    if pd.isna(value):
+        return ""
+    return f"{value:.1f}" if isinstance(value, float) else str(value)
+
+
+def _section(heading, content):
+    return f"<h2>{html.escape(heading)}</h2>\n{content}"
+
+
+def render(cube, doctor, month):
+    """The HTML packet of `doctor` for `month` ("YYYY-MM") from a cube holding that month and the one before."""
+    this_start = pd.Timestamp(f"{month}-01")
+    prev_start = pd.Timestamp(f"{previous_month(month)}-01")
+    # Narrowed once: every rollup below then runs on a handful of cells, unfiltered.
+    doctor_cube = MetricsCube(cube.cells[(cube.cells["Staff"] == doctor).to_numpy()])
+    months = doctor_cube.cells["Month"]
+    this = MetricsCube(doctor_cube.cells[(months == this_start).to_numpy()])
+    prev = MetricsCube(doctor_cube.cells[(months == prev_start).to_numpy()])
+    this_label, prev_label = this_start.strftime("%B %Y"), prev_start.strftime("%B %Y")
+
+    rows = {
+        "Visits": (prev.total(), this.total()),
+        "Patients (known IDs)": (prev.total("IDs"), this.total("IDs")),
+        "Avg Doctor Time (min)": (prev.mean("Doctor Time"), this.mean("Doctor Time")),
+        "Avg Total Visit Duration (min)": (prev.mean("Total Visit Duration"), this.mean("Total Visit Duration")),
+        "Avg Time from Arrival to Room (min)": (prev.mean("Arrival to Room"), this.mean("Arrival to Room")),
+        "Visits with flagged times": (prev.total("Flagged"), this.total("Flagged")),
+    }
+    summary = pd.DataFrame({
+        prev_label: [_cell(before) for before, _ in rows.values()],
+        this_label: [_cell(now) for _, now in rows.values()],
+        "Change": [_change(now, before) for before, now in rows.values()],
+    }, index=list(rows))
+    sections = [_section("Visit Metrics", summary.to_html())]
+
+    bottlenecks = pd.Series(this.bottlenecks()).dropna()
+    if bottlenecks.empty:
+        text = "No triage, lab or SW times recorded."
+    else:
+        biggest = bottlenecks.idxmax()
+        text = f"<b>Biggest Bottleneck:</b> {biggest} ({bottlenecks[biggest]:.1f} min average)"
+    sections.append(_section("Bottleneck Analysis", f"<p>{text}</p>\n"
+                             + bottlenecks.round(1).rename("Avg (min)").to_frame().to_html()))
+
+    visit_mix = (this.value_counts("Visit Type", normalize=True) * 100).round(1)
+    sections.append(_section("Visit Mix %", visit_mix.rename("%").to_frame().to_html()))
+
+    delta = mix_change(doctor_cube.monthly_mix())
+    if delta is None or this_label not in delta.columns:
+        text = f"<p>No visits in {prev_label} to compare with.</p>"
+    else:
+        text = delta.to_html() + "\n<p>Month-over-month change in visit category mix.</p>"
+    sections.append(_section("Monthly Visit Mix Change", text))
+
+    title = html.escape(f"{doctor}: {this_label}")
+    return PAGE.format(title=title, sections="\n".join(sections))
+
+
+# ----------------- Workers -----------------
+def _open_partitions(path, folder):
+    global _partitions
+    _partitions = VisitPartitions(path, folder)
+
+
+def render_month(month, known, out):
+    """
+    Renders the packets of `month` whose doctor's rows differ from `known`
+    ({doctor: digest} of the last run) and removes those of doctors without
+    visits that month any more. Returns ({doctor: digest}, reports written).
+    """
+    first = pd.Period(previous_month(month), "M").start_time
+    last = pd.Period(month, "M").end_time.normalize()
+    frame = _partitions.read(VisitFilter(first=first, last=last), PANEL_COLUMNS)
+    cube = MetricsCube.build(frame)
+
+    this = cube.cells["Month"] == pd.Timestamp(f"{month}-01")
+    doctors = sorted(map(str, cube.cells.loc[this, "Staff"].dropna().unique()))
+    folder = os.path.join(out, month)
+    os.makedirs(folder, exist_ok=True)
+    digests, written = {}, 0
+    for doctor, rows in frame.groupby("Staff", observed=True):
+        if doctor not in doctors:
+            continue
+        digests[doctor] = rows_digest(rows)
+        target = os.path.join(folder, report_file(doctor))
+        if known.get(doctor) == digests[doctor] and os.path.exists(target):
+            continue
+        with open(f"{target}.tmp", "w", encoding="utf-8") as handle:
+            handle.write(render(cube, doctor, month))
+        os.replace(f"{target}.tmp", target)
+        written += 1
+    for doctor in set(known) - set(digests):
+        try:
+            os.remove(os.path.join(folder, report_file(doctor)))
+        except FileNotFoundError:
+            pass
+    return digests, written
+
+
+# ----------------- Runs -----------------
+def _read_state(out):
+    try:
+        with open(os.path.join(out, STATE)) as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return state["months"] if state.get("version") == REPORT_VERSION else {}
+
+
+def _write_state(out, months):
+    partial = os.path.join(out, f"{STATE}.{os.getpid()}.tmp")
+    with open(partial, "w") as handle:
+        json.dump({"version": REPORT_VERSION, "months": months}, handle)
+    os.replace(partial, os.path.join(out, STATE))
+
+
+def build_reports(path=DATA_FILE, out=OUTPUT_FOLDER, workers=None, months=None, force=False):
+    """
+    Renders the packets of every doctor in every month of the CSV at `path`
+    (or only in `months`) into `out`, skipping those whose inputs did not
+    change since the last run unless `force`. Returns a ReportRun.
+    """
+    start = time.perf_counter()
+    partitions = VisitPartitions(path)  # (re)built here, once, before any worker opens it
+    if partitions.manifest is None:  # no pyarrow or a read-only folder: months come from the in-memory frame
+        stats = {f"{month:%Y-%m}": {} for month in partitions.read(columns=["Month"])["Month"].dropna().unique()}
+    else:
+        stats = {month: month_stats for month, month_stats in partitions.manifest["partitions"].items()
+                 if month != UNDATED}
+    wanted = sorted(stats) if months is None else sorted(set(months) & set(stats))
+    state = {} if force else _read_state(out)
+
+    todo, unchanged = {}, 0
+    for month in wanted:
+        # digest of each partition read; "" for a month without visits, None when unknown
+        inputs = [stats[month].get("digest"), stats[previous_month(month)].get("digest")
+                  if previous_month(month) in stats else ""]
+        seen = state.get(month, {})
+        if None not in inputs and seen.get("inputs") == inputs:
+            unchanged += len(seen["doctors"])
+            continue
+        todo[month] = (inputs, seen.get("doctors", {}))
+
+    os.makedirs(out, exist_ok=True)
+    rendered = 0
+    if todo:
+        if partitions.manifest is None:
+            global _partitions
+            _partitions = partitions
+            results = {month: render_month(month, known, out) for month, (_, known) in todo.items()}
+        else:
+            with ProcessPoolExecutor(workers, initializer=_open_partitions, initargs=(path, partitions.folder)) as pool:
+                futures = {pool.submit(render_month, month, known, out): month for month, (_, known) in todo.items()}
+                results = {futures[future]: future.result() for future in as_completed(futures)}
+        for month, (digests, written) in results.items():
+            state[month] = {"inputs": todo[month][0], "doctors": digests}
+            rendered += written
+            unchanged += len(digests) - written
+    if months is None:
+        for month in set(state) - set(stats):  # a month that no longer has visits
+            for doctor in state.pop(month)["doctors"]:
+                try:
+                    os.remove(os.path.join(out, month, report_file(doctor)))
+                except FileNotFoundError:
+                    pass
+    _write_state(out, state)
+    return ReportRun(rendered, unchanged, len(todo), len(wanted), time.perf_counter() - start)
+
+
+# ----------------- CLI -----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", nargs="?", default=DATA_FILE, help="the cleaned visits CSV (default: %(default)s)")
+    parser.add_argument("folder", nargs="?", default=OUTPUT_FOLDER, help="where the packets go (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--months", nargs="+", metavar="YYYY-MM", help="only these months")
+    parser.add_argument("--force", action="store_true", help="render every packet, changed or not")
+    args = parser.parse_args(argv)
+
+    run = build_reports(args.source, args.folder, args.workers, args.months, args.force)
+    print(f"{run.rendered} reports rendered, {run.unchanged} unchanged "
+          f"({run.months_read} of {run.months} months read) in {run.seconds:.1f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Monte Carlo simulation of a clinic day, for staffing what-ifs.
+
+The dashboard names the stage with the longest average; it cannot say what
+a fifth exam room or a second triage nurse would do to the waits.
+simulate() replays thousands of clinic days under a Scenario (rooms, triage
+nurses, doctors, demand) and reports wait percentiles per stage.
+
+A simulated patient:
+  1. arrives (Registration Start) and registers;
+  2. is triaged, as often as triage is recorded, by the first free nurse;
+  3. waits for the first free exam room (Arrival to Room);
+  4. has the exam that ends at Exam End, then waits in the room for the
+     first free doctor, who sees patients in the order they were roomed;
+  5. leaves the room when the doctor is done, goes to lab and social work
+     as often as those are recorded, and leaves (Total Visit Duration).
+
+Visits per day, arrival times and every stage duration are drawn from the
+empirical distributions of the cleaned dataset (fit_profile(); flagged
+times left out, as for the dashboard durations). Queues are first come,
+first served, so each resource is simulated by walking the patients in
+queue order and giving each the server that frees up first: the same start
+times an event-driven simulation would give. The walk is one step per
+patient of the busiest day, each step a NumPy operation over every
+replicated day at once. Scenarios of a grid run in a process pool.
+
+    profile = fit_profile(load_visits())
+    grid = scenario_grid(rooms=(4, 5), triage_nurses=(1, 2), doctors=(profile.doctors,))
+    run_scenarios(profile, grid, days=2000)     # one row of percentiles per scenario
+"""
+import itertools
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from validation import CLINIC_HOURS, duration_mask
+from visit_schema import TIME_UNITS
+
+# Stage -> (start, end) time columns its duration is measured between
+STAGE_TIMES = {
+    "Registration": ("Registration Start", "Registration End"),
+    "Triage": ("Triage Start", "Triage End"),
+    "Exam": ("Time Roomed", "Exam End"),
+    "Doctor": ("Doctor In", "Doctor Out"),
+    "Lab": ("Lab Start", "Lab End"),
+    "SW": ("SW Start", "SW End"),
+}
+# Stages a visit may skip; the others happen on every visit.
+OPTIONAL_STAGES = ["Triage", "Lab", "SW"]
+WAITS = ["Wait for Triage", "Arrival to Room", "Wait for Doctor", "Total Visit Duration"]
+PERCENTILES = (50, 90, 95)
+# Durations kept per stage; a sample of that size already pins down the distribution.
+PROFILE_SAMPLES = 20_000
+
+# Resources on duty and demand (1.0: visits per day as in the data, 1.2: 20% more).
+Scenario = namedtuple("Scenario", ["rooms", "triage_nurses", "doctors", "demand"], defaults=(1.0,))
+SCENARIO_LABELS = ["Rooms", "Triage Nurses", "Doctors", "Demand"]
+
+# The empirical distributions a simulation samples from, in seconds.
+# presence: how often each OPTIONAL_STAGES stage is recorded; rooms, doctors:
+# the numbered exam rooms in the data and the median doctors working a day.
+FlowProfile = namedtuple("FlowProfile", ["daily_visits", "arrivals", "durations", "presence", "rooms", "doctors"])
+
+_profile = None  # a worker's FlowProfile, sent once per process
+
+
+# ----------------- Profile -----------------
+def _seconds(frame, start, end, unit):
+    """Seconds between two time columns, NaN where either is missing or flagged (see validation)."""
+    per_unit = TIME_UNITS[unit][1]
+    seconds = (frame[end] - frame[start]).to_numpy(dtype="float64", na_value=np.nan) * per_unit
+    if "Violations" in frame.columns:
+        seconds[(frame["Violations"].to_numpy() & duration_mask(start, end)) != 0] = np.nan
+    return seconds
+
+
+def _sample(values, rng):
+    return values if len(values) <= PROFILE_SAMPLES else rng.choice(values, PROFILE_SAMPLES, replace=False)
+
+
+def fit_profile(frame, unit="second", hours=CLINIC_HOURS, seed=0):
+    """The FlowProfile of a typed visit frame (see dashboard_data.load_visits)."""
+    rng = np.random.default_rng(seed)
+    arrivals = frame["Registration Start"].to_numpy(dtype="float64", na_value=np.nan) * TIME_UNITS[unit][1]
+    arrivals = arrivals[(arrivals >= hours[0]) & (arrivals <= hours[1])]
+    days = frame["Day"] if "Day" in frame.columns else frame["Date"].dt.normalize()
+
+    durations, presence = {}, {}
+    for stage, (start, end) in STAGE_TIMES.items():
+        seconds = _seconds(frame, start, end, unit)
+        recorded = ~np.isnan(seconds) & (seconds >= 0)
+        durations[stage] = _sample(seconds[recorded], rng)
+        if stage in OPTIONAL_STAGES:
+            presence[stage] = float(recorded.mean()) if len(frame) else 0.0
+
+    rooms = pd.Series(frame["Room"].dropna().astype(str).unique())
+    staff_per_day = frame.groupby(days, observed=True)["Staff"].nunique()
+    return FlowProfile(
+        daily_visits=days.value_counts().to_numpy(),
+        arrivals=_sample(arrivals, rng),
+        durations=durations,
+        presence=presence,
+        rooms=max(1, int(rooms.str.isdigit().sum())),
+        doctors=max(1, int(round(staff_per_day.median()))) if len(staff_per_day) else 1,
+    )
+
+
+def baseline(profile):
+    """The Scenario the data was recorded under: its rooms and doctors, one triage nurse."""
+    return Scenario(profile.rooms, 1, profile.doctors)
+
+
+def scenario_grid(rooms, triage_nurses, doctors, demand=(1.0,)):
+    """Every combination of the given resource counts and demand levels."""
+    return [Scenario(*values) for values in itertools.product(rooms, triage_nurses, doctors, demand)]
+
+
+# ----------------- Simulation -----------------
+def _serve(ready, service, needs, servers):
+    """
+    First come, first served at `servers` identical servers, for every day
+    (row) at once: the start time of each patient (column) ready at
+    `ready`, or `ready` itself where it does not `needs` the servers.
+    """
+    days, patients = ready.shape
+    rows = np.arange(days)
+    order = np.argsort(ready, axis=1, kind="stable")
+    free = np.zeros((days, servers))  # when each server is next free
+    start = ready.copy()
+    for k in range(patients):
+        patient = order[:, k]
+        waiting = needs[rows, patient]
+        server = free.argmin(axis=1)
+        begin = np.maximum(ready[rows, patient], free[rows, server])
+        start[rows[waiting], patient[waiting]] = begin[waiting]
+        free[rows[waiting], server[waiting]] = begin[waiting] + service[rows[waiting], patient[waiting]]
+    return start
+
+
+def _rooms_and_doctors(ready, exam, doctor, active, rooms, doctors):
+    """
+    Rooming, doctor start and doctor end per patient. A room is held from
+    rooming until the doctor is done, so both resources are walked together,
+    in rooming order.
+    """
+    days, patients = ready.shape
+    rows = np.arange(days)
+    order = np.argsort(ready, axis=1, kind="stable")
+    room_free, doctor_free = np.zeros((days, rooms)), np.zeros((days, doctors))
+    roomed, doctor_in, doctor_out = (np.full(ready.shape, np.nan) for _ in range(3))
+    for k in range(patients):
+        patient = order[:, k]
+        here = active[rows, patient]
+        room = room_free.argmin(axis=1)
+        room_at = np.maximum(ready[rows, patient], room_free[rows, room])
+        seen = doctor_free.argmin(axis=1)
+        seen_at = np.maximum(room_at + exam[rows, patient], doctor_free[rows, seen])
+        done = seen_at + doctor[rows, patient]
+        rows_here, patient_here = rows[here], patient[here]
+        roomed[rows_here, patient_here] = room_at[here]
+        doctor_in[rows_here, patient_here] = seen_at[here]
+        doctor_out[rows_here, patient_here] = done[here]
+        room_free[rows_here, room[here]] = done[here]
+        doctor_free[rows_here, seen[here]] = done[here]
+    return roomed, doctor_in, doctor_out
+
+
+def simulate(profile, scenario, days=2000, seed=0):
+    """
+    Runs `days` replicated clinic days of `scenario`. Returns the mean visits
+    per day and the PERCENTILES of each of the WAITS in minutes, as a dict.
+    The same seed replays the same days, so scenarios compare like for like.
+    """
+    rng = np.random.default_rng(seed)
+    expected = rng.choice(profile.daily_visits, days) * scenario.demand
+    visits = np.floor(expected + rng.random(days)).astype(np.int64)  # rounded up with the fractional part's odds
+    shape = (days, max(1, int(visits.max())))
+    active = np.arange(shape[1]) < visits[:, None]
+
+    def draw(stage):
+        values = profile.durations[stage]
+        return rng.choice(values, shape) if len(values) else np.zeros(shape)
+
+    def happens(stage):
+        return active & (rng.random(shape) < profile.presence[stage])
+
+    arrival = np.where(active, rng.choice(profile.arrivals, shape), np.inf)
+    registered = arrival + draw("Registration")
+    triaged = happens("Triage")
+    triage = draw("Triage")
+    triage_in = _serve(registered, triage, triaged, scenario.triage_nurses)
+    ready = np.where(triaged, triage_in + triage, registered)
+    exam = draw("Exam")
+    roomed, doctor_in, doctor_out = _rooms_and_doctors(ready, exam, draw("Doctor"), active,
+                                                       scenario.rooms, scenario.doctors)
+    leave = doctor_out + np.where(happens("Lab"), draw("Lab"), 0) + np.where(happens("SW"), draw("SW"), 0)
+
+    with np.errstate(invalid="ignore"):  # inf - inf in the padding of quieter days
+        waits = {
+            "Wait for Triage": np.where(triaged, triage_in - registered, np.nan),
+            "Arrival to Room": roomed - arrival,
+            "Wait for Doctor": doctor_in - (roomed + exam),
+            "Total Visit Duration": leave - arrival,
+        }
+    summary = {"Visits per Day": visits.mean()}
+    for name, seconds in waits.items():
+        minutes = seconds[active & ~np.isnan(seconds)] / 60
+        values = np.percentile(minutes, PERCENTILES) if minutes.size else [np.nan] * len(PERCENTILES)
+        summary.update({f"{name} p{p}": value for p, value in zip(PERCENTILES, values)})
+    return summary
+
+
+def _use_profile(profile):
+    global _profile
+    _profile = profile
+
+
+def _simulate_with_profile(scenario, days, seed):
+    return simulate(_profile, scenario, days, seed)
+
+
+def run_scenarios(profile, scenarios, days=2000, seed=0, workers=None):
+    """
+    simulate() for every scenario, in a pool of `workers` processes (default:
+    one per CPU, inline with one). A DataFrame indexed by the scenario.
+    """
+    scenarios = [Scenario(*scenario) for scenario in scenarios]
+    workers = min(workers or os.cpu_count() or 1, len(scenarios))
+    if workers <= 1:
+        rows = [simulate(profile, scenario, days, seed) for scenario in scenarios]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_use_profile, initargs=(profile,)) as pool:
+            rows = list(pool.map(_simulate_with_profile, scenarios, [days] * len(scenarios), [seed] * len(scenarios),
+                                 chunksize=-(-len(scenarios) // workers)))
+    return pd.DataFrame(rows, index=pd.MultiIndex.from_tuples(scenarios, names=SCENARIO_LABELS))
@@ -0,0 +1,1015 @@
+"""
+Local replica of the clinic visit sheet, and the storage backends behind it.
+
+The intake app used to call conn.read(ttl=0) on every rerun, which downloads
+the whole Google Sheet for each widget click. SheetReplica keeps the last
+known frame in memory (shared across sessions through st.cache_resource) and
+only asks the store for the rows that were added since the last sync.
+
+New visits are appended as rows instead of rewriting the whole sheet, so an
+insert sends only the new rows over the wire. The replica also maintains a
+VisitIndex, a typed copy of the frame (see visit_schema), the newest-first
+RecentVisits ordering and the ClinicMetrics counters, all updated as rows
+arrive or change rather than rebuilt.
+
+The store itself is a StorageBackend: the Google Sheet (GSheetsSource), a
+local SQLite file (SQLiteBackend), SQLite mirrored to the sheet
+(MirroredBackend) or the in-memory LocalSheetConnection used offline.
+open_backend() picks one from the [storage] config.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time as _time
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+
+from clinic_metrics import ClinicMetrics
+from visit_index import RecentVisits, VisitIndex, date_key, id_key
+from visit_schema import concat_typed, parse_dates, to_typed
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------- Storage Backends -----------------
+class StorageBackend:
+    """
+    What SheetReplica needs from a store of visit rows. Rows keep their sheet
+    order and are addressed by position (0-based, header excluded).
+
+        modified_marker()                 cheap change marker, None if unknown
+        row_count()                       number of rows, None if unknown
+        read_all()                        every row as a DataFrame
+        read_rows(start, columns)         rows from position `start` on (read-since)
+        edited_since(marker)              positions of rows edited in place since the
+                                          store was at `marker`, None if unknown
+        tracks_edits()                    whether edited_since() can answer at all
+        read_positions(positions, columns) the rows at those positions, in that order
+        read_day(day, columns)            the rows dated `day`, indexed by position
+        append_rows(rows)                 adds rows below the last one
+        update(data)                      replaces every row with `data`
+        update_by_key(id, date, values)   edits the first visit with that (ID, Date);
+                                          returns False if there is none
+        batch()                           groups several writes into one unit
+
+    A backend that cannot append or update by key says so through
+    can_append() / returning False, and the replica falls back to update().
+    """
+
+    def modified_marker(self):
+        return None
+
+    def row_count(self):
+        return None
+
+    def read_all(self):
+        raise NotImplementedError
+
+    def read_rows(self, start, columns):
+        return self.read_all().iloc[start:].reset_index(drop=True)
+
+    def edited_since(self, marker):
+        return None
+
+    def tracks_edits(self):
+        return False
+
+    def read_positions(self, positions, columns):
+        return self.read_all().iloc[list(positions)].reset_index(drop=True)
+
+    def read_day(self, day, columns):
+        rows = self.read_all()
+        if "Date" in rows.columns:
+            rows = rows[(parse_dates(rows["Date"]) == pd.Timestamp(day)).to_numpy()]
+        else:
+            rows = rows.iloc[:0]
+        return rows if columns is None else rows.reindex(columns=list(columns))
+
+    def append_rows(self, rows):
+        raise NotImplementedError
+
+    def update(self, data):
+        raise NotImplementedError
+
+    def update_by_key(self, patient_id, date, values):
+        return False
+
+    def can_append(self):
+        return True
+
+    @contextmanager
+    def batch(self):
+        yield self
+
+
+class GSheetsSource(StorageBackend):
+    """
+    Adapts a GSheetsConnection to the StorageBackend interface.
+    Only service account connections expose the worksheet; public URL
+    connections return None for the marker and fall back to full reads and
+    rewrites. `spreadsheet` and `worksheet` pick the sheet holding the visits
+    (default: the connection's own).
+    """
+
+    def __init__(self, conn, worksheet=None, spreadsheet=None):
+        self.conn = conn
+        self.worksheet = worksheet
+        self.spreadsheet = spreadsheet
+
+    def _worksheet(self):
+        client = self.conn.client
+        if getattr(client, "_optional_client", None) is None:
+            return None
+        return client._select_worksheet(spreadsheet=self.spreadsheet, worksheet=self.worksheet)
+
+    def modified_marker(self):
+        """Drive's modifiedTime for the spreadsheet, or None if unavailable."""
+        worksheet = self._worksheet()
+        if worksheet is None:
+            return None
+        return worksheet.spreadsheet.get_lastUpdateTime()
+
+    def row_count(self):
+        """Number of data rows (header excluded), or None if unavailable."""
+        worksheet = self._worksheet()
+        if worksheet is None:
+            return None
+        # Column A (Date) is filled in for every visit.
+        return max(len(worksheet.col_values(1)) - 1, 0)
+
+    def read_all(self):
+        return self.conn.read(ttl=0, spreadsheet=self.spreadsheet, worksheet=self.worksheet)
+
+    def read_rows(self, start, columns):
+        """Reads data rows from position `start` (0-based, header excluded) to the end."""
+        worksheet = self._worksheet()
+        values = worksheet.get_values(f"A{start + 2}:{_column_letter(len(columns))}")
+        values = [row + [""] * (len(columns) - len(row)) for row in values if any(row)]
+        return pd.DataFrame(values, columns=list(columns)).replace("", None)
+
+    def read_positions(self, positions, columns):
+        """Reads the data rows at `positions` (0-based, header excluded) in one batch_get call."""
+        worksheet = self._worksheet()
+        if worksheet is None:
+            return super().read_positions(positions, columns)
+        last = _column_letter(len(columns))
+        ranges = worksheet.batch_get([f"A{position + 2}:{last}{position + 2}" for position in positions])
+        values = [list(cells[0]) if cells else [] for cells in ranges]
+        values = [row + [""] * (len(columns) - len(row)) for row in values]
+        return pd.DataFrame(values, columns=list(columns)).replace("", None)
+
+    def append_rows(self, rows):
+        """Appends the rows of a frame (already in sheet column order) below the last row."""
+        worksheet = self._worksheet()
+        if worksheet is None:
+            raise ValueError("Appending rows needs a service account connection")
+        values = [[_cell_value(v) for v in row] for row in rows.to_numpy(dtype=object)]
+        # USER_ENTERED matches how conn.update() writes cells, so "08:30" stays a time.
+        worksheet.append_rows(values, value_input_option="USER_ENTERED", table_range="A1")
+
+    def update(self, data):
+        self.conn.update(spreadsheet=self.spreadsheet, worksheet=self.worksheet, data=data)
+
+    def update_by_key(self, patient_id, date, values):
+        """Finds the row from the ID and Date columns and rewrites only the edited cells."""
+        worksheet = self._worksheet()
+        if worksheet is None:
+            return False
+        header = worksheet.row_values(1)
+        if "ID" not in header or "Date" not in header or any(col not in header for col in values):
+            return False
+        ids = worksheet.col_values(header.index("ID") + 1)[1:]
+        dates = worksheet.col_values(header.index("Date") + 1)[1:]
+        key = (id_key(patient_id), date_key(date))
+        for position, cells in enumerate(zip(ids, dates)):
+            if (id_key(cells[0]), date_key(cells[1])) == key:
+                row = position + 2
+                worksheet.batch_update(
+                    [{"range": f"{_column_letter(header.index(col) + 1)}{row}", "values": [[_cell_value(value)]]}
+                     for col, value in values.items()],
+                    value_input_option="USER_ENTERED",
+                )
+                return True
+        return False
+
+    def can_append(self):
+        return self._worksheet() is not None
+
+
+def _cell_value(value):
+    """Converts a frame value into something the Sheets API accepts."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _column_letter(n):
+    """1-based column number to A1 column letters."""
+    letters = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class LocalSheetConnection(StorageBackend):
+    """
+    In-memory stand-in for GSheetsConnection.
+    Implements read()/update() like the real connection plus the
+    StorageBackend interface, and counts every call and every row that
+    would have gone over the wire so sync behavior can be checked offline.
+    """
+
+    def __init__(self, data=None, latency=0.0, row_latency=0.0):
+        self._base = pd.DataFrame() if data is None else data.reset_index(drop=True).copy()
+        # Appended rows are kept as chunks so an append costs O(new rows), like the API.
+        self._chunks = []
+        self.latency = latency
+        self.row_latency = row_latency
+        self.version = 0
+        self._edited = {}  # position -> version of its last update_by_key()
+        self._rewritten = 0  # version of the last update()
+        self.calls = Counter()
+        self.rows_read = 0
+        self.rows_written = 0
+        self._lock = threading.RLock()
+
+    @property
+    def _data(self):
+        if self._chunks:
+            self._base = pd.concat([self._base] + self._chunks, ignore_index=True)
+            self._chunks = []
+        return self._base
+
+    @_data.setter
+    def _data(self, data):
+        self._base = data
+        self._chunks = []
+
+    def _wait(self, rows=0):
+        # Round-trip latency plus a per-row transfer cost, like the real API.
+        delay = self.latency + self.row_latency * rows
+        if delay:
+            _time.sleep(delay)
+
+    def read(self, ttl=None, **options):
+        self._wait(len(self._data))
+        self.calls["read"] += 1
+        self.rows_read += len(self._data)
+        return self._data.copy()
+
+    def update(self, data=None, **options):
+        self._wait(len(data))
+        self.calls["update"] += 1
+        self.rows_written += len(data)
+        self._data = data.reset_index(drop=True).copy()
+        self.version += 1
+        self._edited = {}
+        self._rewritten = self.version
+        return data
+
+    def modified_marker(self):
+        self.calls["modified_marker"] += 1
+        return self.version
+
+    def row_count(self):
+        self.calls["row_count"] += 1
+        return len(self._base) + sum(len(chunk) for chunk in self._chunks)
+
+    def read_all(self):
+        return self.read()
+
+    def read_rows(self, start, columns=None):
+        tail = self._data.iloc[start:].reset_index(drop=True).copy()
+        self._wait(len(tail))
+        self.calls["read_rows"] += 1
+        self.rows_read += len(tail)
+        return tail
+
+    def edited_since(self, marker):
+        self.calls["edited_since"] += 1
+        if marker is None or self._rewritten > marker:
+            return None
+        return sorted(position for position, version in self._edited.items() if version > marker)
+
+    def tracks_edits(self):
+        return True
+
+    def read_positions(self, positions, columns=None):
+        rows = self._data.iloc[list(positions)].reset_index(drop=True).copy()
+        self._wait(len(rows))
+        self.calls["read_positions"] += 1
+        self.rows_read += len(rows)
+        return rows
+
+    def append_rows(self, rows):
+        self._wait(len(rows))
+        self.calls["append_rows"] += 1
+        self.rows_written += len(rows)
+        self._chunks.append(rows.reset_index(drop=True).copy())
+        self.version += 1
+
+    def update_by_key(self, patient_id, date, values):
+        data = self._data
+        if "ID" not in data.columns or "Date" not in data.columns or any(col not in data.columns for col in values):
+            return False
+        matches = (pd.to_numeric(data["ID"], errors="coerce") == id_key(patient_id)) & (data["Date"] == date_key(date))
+        if not matches.any():
+            return False
+        self._wait(1)
+        self.calls["update_by_key"] += 1
+        self.rows_written += 1
+        data = data.copy()
+        position = matches.to_numpy().argmax()
+        for col, value in values.items():
+            try:
+                data.at[position, col] = value
+            except (TypeError, ValueError):
+                data[col] = data[col].astype(object)
+                data.at[position, col] = value
+        self._data = data
+        self.version += 1
+        self._edited[position] = self.version
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Holds off every other batch until the block ends, like a transaction of a real store."""
+        with self._lock:
+            yield self
+
+
+# ----------------- SQLite Backend -----------------
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Visits in a local SQLite file, for a low-latency primary store and for
+    running the apps offline.
+
+    Rows live in one table whose INTEGER PRIMARY KEY `_row` is position + 1,
+    so read_rows(start) is a range scan. Columns are created from the first
+    frame written (and added when new ones show up); values are stored as
+    given, except ID which has integer affinity. (ID, Date), Date and Staff
+    are indexed. Every write bumps a version number in the meta table in the
+    same transaction, which is the modified marker, so other processes using
+    the same file are noticed too. A write or batch() takes the write lock
+    when it starts, so other processes' writes wait until it commits and a
+    check read inside a batch stays true until then. An edited row records the version it was
+    edited at in `_edited`, and a rewrite records its version as
+    'rewritten', which is how edited_since() answers.
+    """
+
+    TABLE = "visits"
+
+    def __init__(self, path="clinic.db"):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        with self._lock:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} (_row INTEGER PRIMARY KEY)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            self._db.execute("INSERT OR IGNORE INTO meta VALUES ('rewritten', 0)")
+            if "_edited" not in (row[1] for row in self._db.execute(f"PRAGMA table_info({self.TABLE})")):
+                # a file from before edits were tracked: nothing since now is known to be edited
+                self._db.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN _edited INTEGER")
+                self._db.execute("UPDATE meta SET value = (SELECT value FROM meta WHERE key = 'version') "
+                                 "WHERE key = 'rewritten'")
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS visits_edited ON {self.TABLE} (_edited)")
+            self._db.commit()
+            self._create_indexes()
+
+    def _columns(self):
+        rows = self._db.execute(f"PRAGMA table_info({self.TABLE})").fetchall()
+        return [row[1] for row in rows if row[1] not in ("_row", "_edited")]
+
+    def _create_indexes(self):
+        columns = self._columns()
+        for name, cols in (("visits_id_date", ("ID", "Date")), ("visits_date", ("Date",)), ("visits_staff", ("Staff",))):
+            if all(col in columns for col in cols):
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {self.TABLE} ({', '.join(_quote(col) for col in cols)})"
+                )
+
+    def _ensure_columns(self, columns):
+        existing = self._columns()
+        added = [col for col in columns if col not in existing]
+        for col in added:
+            affinity = " INTEGER" if col == "ID" else ""
+            self._db.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN {_quote(col)}{affinity}")
+        if added:
+            self._create_indexes()
+
+    @contextmanager
+    def _write(self):
+        """One transaction that also bumps the version; nested inside batch() it joins the batch."""
+        with self._lock:
+            if self._batch_depth == 0:
+                self._db.execute("BEGIN IMMEDIATE")
+                # Bumped first, so markers read inside the transaction are the one it commits.
+                self._db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self._batch_depth += 1
+            try:
+                yield self._db
+            except BaseException:
+                if self._batch_depth == 1:
+                    self._db.rollback()
+                raise
+            finally:
+                self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._db.commit()
+
+    def batch(self):
+        """
+        Writes inside the block commit together and change the marker once;
+        no other process writes to the file until the block ends.
+        """
+        return self._write()
+
+    def _frame(self, cursor, columns):
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+    def _insert(self, rows):
+        rows = rows.astype(object).where(rows.notna(), None)
+        columns = ", ".join(_quote(col) for col in rows.columns)
+        marks = ", ".join("?" for _ in rows.columns)
+        self._db.executemany(
+            f"INSERT INTO {self.TABLE} ({columns}) VALUES ({marks})",
+            ([_cell_value(v) if v is not None else None for v in row] for row in rows.to_numpy(dtype=object)),
+        )
+
+    def modified_marker(self):
+        with self._lock:
+            return self._meta("version")
+
+    def row_count(self):
+        with self._lock:
+            return self._db.execute(f"SELECT COALESCE(MAX(_row), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def read_all(self):
+        return self.read_rows(0, None)
+
+    def read_rows(self, start, columns=None):
+        with self._lock:
+            stored = self._columns()
+            select = ", ".join(_quote(col) for col in stored) or "_row"
+            cursor = self._db.execute(f"SELECT {select} FROM {self.TABLE} WHERE _row > ? ORDER BY _row", (start,))
+            tail = self._frame(cursor, stored) if stored else pd.DataFrame()
+        if columns is not None:
+            tail = tail.reindex(columns=list(columns))
+        return tail
+
+    def _meta(self, key):
+        return self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def edited_since(self, marker):
+        with self._lock:
+            if marker is None or self._meta("rewritten") > marker:
+                return None
+            cursor = self._db.execute(f"SELECT _row - 1 FROM {self.TABLE} WHERE _edited > ? ORDER BY _row", (marker,))
+            return [row[0] for row in cursor]
+
+    def tracks_edits(self):
+        return True
+
+    def read_positions(self, positions, columns=None):
+        positions = [int(position) for position in positions]
+        with self._lock:
+            stored = self._columns()
+            select = ", ".join(_quote(col) for col in ["_row"] + stored)
+            cursor = self._db.execute(f"SELECT {select} FROM {self.TABLE} WHERE _row IN "
+                                      f"(SELECT value + 1 FROM json_each(?))", (json.dumps(positions),))
+            rows = self._frame(cursor, ["_row"] + stored)
+        rows = rows.set_index("_row").reindex([position + 1 for position in positions]).reset_index(drop=True)
+        if columns is not None:
+            rows = rows.reindex(columns=list(columns))
+        return rows
+
+    def read_day(self, day, columns=None):
+        """
+        Only the rows of `day`, through the Date index: its "MM/DD/YYYY"
+        spellings with and without leading zeros, and ISO dates.
+        """
+        day = pd.Timestamp(day)
+        months, days = {f"{day.month:02d}", str(day.month)}, {f"{day.day:02d}", str(day.day)}
+        spellings = [f"{month}/{number}/{day.year}" for month in months for number in days]
+        with self._lock:
+            stored = self._columns()
+            if "Date" not in stored:
+                rows = pd.DataFrame(columns=stored)
+            else:
+                select = ", ".join(_quote(col) for col in ["_row"] + stored)
+                cursor = self._db.execute(
+                    f"SELECT {select} FROM {self.TABLE} WHERE Date IN (SELECT value FROM json_each(?)) "
+                    f"OR (Date >= ? AND Date < ?) ORDER BY _row",
+                    (json.dumps(spellings), f"{day:%Y-%m-%d}", f"{day + pd.Timedelta(days=1):%Y-%m-%d}"),
+                )
+                rows = self._frame(cursor, ["_row"] + stored)
+                rows.index = pd.Index(rows.pop("_row") - 1)
+                rows = rows[(parse_dates(rows["Date"]) == day).to_numpy()]
+        return rows if columns is None else rows.reindex(columns=list(columns))
+
+    def read(self, ttl=None, **options):
+        return self.read_all()
+
+    def append_rows(self, rows):
+        with self._write():
+            self._ensure_columns(rows.columns)
+            self._insert(rows)
+
+    def update(self, data):
+        with self._write():
+            self._db.execute(f"DELETE FROM {self.TABLE}")
+            self._ensure_columns(data.columns)
+            self._insert(data)
+            self._db.execute("UPDATE meta SET value = (SELECT value FROM meta WHERE key = 'version') "
+                             "WHERE key = 'rewritten'")
+
+    def update_by_key(self, patient_id, date, values):
+        with self._write():
+            self._ensure_columns(values)
+            assignments = ", ".join(f"{_quote(col)} = ?" for col in values)
+            params = [None if v is None or (not isinstance(v, str) and pd.isna(v)) else _cell_value(v)
+                      for v in values.values()]
+            cursor = self._db.execute(
+                f"UPDATE {self.TABLE} SET {assignments}, _edited = "
+                f"(SELECT value FROM meta WHERE key = 'version') WHERE _row = "
+                f"(SELECT MIN(_row) FROM {self.TABLE} WHERE \"ID\" = ? AND \"Date\" = ?)",
+                params + [id_key(patient_id), date_key(date)],
+            )
+            return cursor.rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MirroredBackend(StorageBackend):
+    """
+    Reads from and writes to `primary` (e.g. SQLite) and repeats every write
+    on `mirror` (the Google Sheet) so the sheet stays usable as a copy.
+    A failed mirror write is logged and leaves the mirror marked stale; the
+    next write then pushes the whole primary to it instead of the change.
+    """
+
+    def __init__(self, primary, mirror):
+        self.primary = primary
+        self.mirror = mirror
+        self.mirror_stale = False
+        self.mirror_errors = 0
+
+    def _mirror(self, write):
+        try:
+            if self.mirror_stale:
+                self.mirror.update(self.primary.read_all())
+            else:
+                write()
+            self.mirror_stale = False
+        except Exception:
+            self.mirror_stale = True
+            self.mirror_errors += 1
+            logger.exception("Mirroring a write to the sheet failed; it will be resent in full")
+
+    def modified_marker(self):
+        return self.primary.modified_marker()
+
+    def row_count(self):
+        return self.primary.row_count()
+
+    def read_all(self):
+        return self.primary.read_all()
+
+    def read_rows(self, start, columns):
+        return self.primary.read_rows(start, columns)
+
+    def edited_since(self, marker):
+        return self.primary.edited_since(marker)
+
+    def tracks_edits(self):
+        return self.primary.tracks_edits()
+
+    def read_positions(self, positions, columns):
+        return self.primary.read_positions(positions, columns)
+
+    def read_day(self, day, columns):
+        return self.primary.read_day(day, columns)
+
+    def append_rows(self, rows):
+        self.primary.append_rows(rows)
+        if self.mirror.can_append():
+            self._mirror(lambda: self.mirror.append_rows(rows))
+        else:
+            self._mirror(lambda: self.mirror.update(self.primary.read_all()))
+
+    def update(self, data):
+        self.primary.update(data)
+        self._mirror(lambda: self.mirror.update(data))
+
+    def update_by_key(self, patient_id, date, values):
+        if not self.primary.update_by_key(patient_id, date, values):
+            return False
+        self._mirror(lambda: self.mirror.update_by_key(patient_id, date, values)
+                     or self.mirror.update(self.primary.read_all()))
+        return True
+
+    def can_append(self):
+        return self.primary.can_append()
+
+    def batch(self):
+        return self.primary.batch()
+
+
+def make_source(conn, worksheet=None, spreadsheet=None):
+    """Returns conn itself if it is already a StorageBackend, otherwise wraps the GSheetsConnection."""
+    if isinstance(conn, StorageBackend):
+        return conn
+    return GSheetsSource(conn, worksheet, spreadsheet)
+
+
+def open_backend(config, connect_sheet):
+    """
+    Builds the backend described by the [storage] config section:
+
+        backend = "gsheets"   # default: the Google Sheet only
+        backend = "sqlite"    # local SQLite file at `path` (default clinic.db)
+        mirror = true         # with sqlite: also write every change to the sheet
+        spreadsheet = "..."   # the sheet to use (default: the connection's)
+        worksheet = "North"   # and its tab
+
+    `connect_sheet` returns the GSheetsConnection and is only called when the
+    sheet is needed. A new SQLite file with mirror on starts from the sheet.
+    """
+    kind = config.get("backend", "gsheets")
+    sheet_options = (config.get("worksheet"), config.get("spreadsheet"))
+    if kind == "gsheets":
+        return make_source(connect_sheet(), *sheet_options)
+    if kind != "sqlite":
+        raise ValueError(f"Unknown storage backend: {kind!r}")
+
+    backend = SQLiteBackend(config.get("path", "clinic.db"))
+    if config.get("mirror", False):
+        sheet = make_source(connect_sheet(), *sheet_options)
+        if backend.row_count() == 0:
+            backend.update(sheet.read_all())
+        backend = MirroredBackend(backend, sheet)
+    return backend
+
+
+# ----------------- Replica -----------------
+def _coerce_like(tail, base):
+    """Casts freshly fetched rows to the numeric dtypes the cached frame already uses."""
+    for col in tail.columns:
+        if col in base.columns and pd.api.types.is_numeric_dtype(base[col]):
+            tail[col] = pd.to_numeric(tail[col], errors="coerce")
+    return tail
+
+
+def _set_row(data, position, values):
+    for col, value in values.items():
+        try:
+            data.at[position, col] = value
+        except (TypeError, ValueError):
+            # e.g. a text value going into a numeric column
+            data[col] = data[col].astype(object)
+            data.at[position, col] = value
+
+
+def _keys(rows):
+    ids = rows["ID"] if "ID" in rows.columns else [None] * len(rows)
+    dates = rows["Date"] if "Date" in rows.columns else [None] * len(rows)
+    return [(id_key(patient_id), date_key(date)) for patient_id, date in zip(ids, dates)]
+
+
+class SheetReplica:
+    """
+    Last-known copy of the visit sheet.
+
+    sync() checks the cheap modified marker first and returns the cached frame
+    if nothing changed. Otherwise it asks the store which existing rows were
+    edited since its marker (edited_since) and re-reads those, then fetches
+    only the appended tail. A Google Sheet cannot list its edits: when it
+    grew, the new rows are read together with the last `recheck_rows` known
+    ones, and changes among those are adopted; an edit further up shows
+    after the next full read. When the sheet did not grow, rows were
+    deleted, the store was rewritten or there is no marker, it reads
+    everything. A full read is also forced every `full_sync_every` seconds
+    as a backstop.
+
+    The returned frame is shared between sessions and must not be mutated in
+    place; write() replaces it after our own writes without re-reading.
+    Appended rows (and their typed copy) wait in chunks until a reader needs
+    the frame, so an append costs the same however many rows are stored.
+    """
+
+    def __init__(self, conn, full_sync_every=300, recheck_rows=200):
+        self.conn = conn
+        self.source = make_source(conn)
+        self.full_sync_every = full_sync_every
+        self.recheck_rows = recheck_rows
+        self.fetches = Counter()
+        self._frame = None
+        self._index = None
+        self._typed = None
+        self._recent = None
+        self._metrics = None
+        self._marker = None
+        self._last_full_sync = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def _frame(self):
+        if self._chunks:
+            self._base = pd.concat([self._base] + self._chunks, ignore_index=True)
+            self._chunks = []
+        return self._base
+
+    @_frame.setter
+    def _frame(self, data):
+        self._base = data
+        self._chunks = []
+
+    @property
+    def _typed(self):
+        if self._typed_chunks:
+            self._typed_base = concat_typed([self._typed_base] + self._typed_chunks)
+            self._typed_chunks = []
+        return self._typed_base
+
+    @_typed.setter
+    def _typed(self, typed):
+        self._typed_base = typed
+        self._typed_chunks = []
+
+    def _length(self):
+        """Rows in the frame, without joining the appended chunks."""
+        return len(self._base) + sum(len(chunk) for chunk in self._chunks)
+
+    @property
+    def index(self):
+        """VisitIndex over the current frame, built on first use."""
+        with self._lock:
+            if self._index is None:
+                self._index = VisitIndex.build(self._frame if self._frame is not None else self.sync())
+            return self._index
+
+    @property
+    def typed(self):
+        """The frame converted with visit_schema.to_typed(), built on first use."""
+        with self._lock:
+            if self._typed is None:
+                self._typed = to_typed(self._frame if self._frame is not None else self.sync())
+            return self._typed
+
+    @property
+    def recent(self):
+        """RecentVisits ordering over the current frame, built on first use."""
+        with self._lock:
+            if self._recent is None:
+                self._recent = RecentVisits.build(self.typed)
+            return self._recent
+
+    @property
+    def metrics(self):
+        """ClinicMetrics aggregates over the current frame, built on first use."""
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = ClinicMetrics.build(self.typed)
+            return self._metrics
+
+    def snapshot(self):
+        """
+        (frame, index, typed) as of one moment, for a reader that uses them
+        together while other sessions sync. The index is shared and only
+        ever extended, so it may list positions past the frame's end.
+        """
+        with self._lock:
+            frame = self._frame if self._frame is not None else self.sync()
+            return frame, self.index, self.typed
+
+    def _reset_derived(self):
+        self._index = None
+        self._typed = None
+        self._recent = None
+        self._metrics = None
+
+    def _extend(self, rows):
+        start = self._length()
+        self._chunks.append(rows)
+        if self._index is not None:
+            self._index.extend(rows, start)
+        if self._typed_base is not None or self._recent is not None or self._metrics is not None:
+            typed_rows = to_typed(rows)
+            if self._typed_base is not None:
+                self._typed_chunks.append(typed_rows)
+            if self._recent is not None:
+                self._recent.extend(typed_rows, start)
+            if self._metrics is not None:
+                self._metrics.add_rows(typed_rows)
+
+    def _adopt(self, data, positions):
+        """Makes `data`, the frame with the rows at `positions` changed, the replica state."""
+        before, after = self._frame.iloc[positions], data.iloc[positions]
+        if self._metrics is not None:
+            self._metrics.remove_rows(to_typed(before))
+            self._metrics.add_rows(to_typed(after))
+        if self._index is not None and _keys(before) != _keys(after):
+            self._index = None
+        self._frame = data
+        self._typed = None
+        self._recent = None
+
+    def _refresh(self, positions):
+        """Re-reads the rows at `positions`, edited by someone else."""
+        rows = _coerce_like(self.source.read_positions(positions, self._frame.columns), self._frame)
+        data = self._frame.copy()
+        for position, (_, values) in zip(positions, rows.iterrows()):
+            _set_row(data, position, values)
+        self._adopt(data, positions)
+
+    def refresh_rows(self, positions):
+        """
+        Re-reads the rows at `positions` from the source whatever the marker
+        says, e.g. to check them just before writing over them.
+        """
+        with self._lock:
+            frame = self._frame if self._frame is not None else self.sync()
+            positions = [position for position in positions if position < len(frame)]
+            if positions:
+                self._refresh(positions)
+                self.fetches["reread"] += 1
+            return self._frame
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the replica and one backend batch() for a check-then-write.
+        On SQLite no other process writes until the block ends, so rows read
+        inside it are still current when its writes land. If the block fails
+        the backend rolls back and the replica is dropped.
+        """
+        with self._lock:
+            try:
+                with self.source.batch():
+                    yield self
+            except BaseException:
+                self.invalidate()
+                raise
+
+    def _recheck_and_extend(self, marker):
+        """sync() of a grown store that cannot list its edits: one read from `recheck_rows` before the end."""
+        known = len(self._frame)
+        start = max(0, known - self.recheck_rows)
+        rows = _coerce_like(self.source.read_rows(start, self._frame.columns), self._frame)
+        if len(rows) < known - start:
+            return self._full_sync()  # rows were deleted after all
+        rows.index = pd.RangeIndex(start, start + len(rows))
+        before, after = self._frame.iloc[start:known], rows.iloc[:known - start]
+        same = (after.eq(before) | (after.isna() & before.isna())).all(axis=1)
+        edited = [int(position) for position in same.index[~same.to_numpy()]]
+        if edited:
+            data = self._frame.copy()
+            for position in edited:
+                _set_row(data, position, rows.loc[position])
+            self._adopt(data, edited)
+            self.fetches["edited"] += 1
+        self._extend(rows.iloc[known - start:].reset_index(drop=True))
+        self.fetches["tail"] += 1
+        self._marker = marker
+        return self._frame
+
+    def _full_sync(self):
+        self._marker = self.source.modified_marker()
+        self._frame = self.source.read_all().reset_index(drop=True)
+        self._reset_derived()
+        self._last_full_sync = _time.monotonic()
+        self.fetches["full"] += 1
+        return self._frame
+
+    def sync(self):
+        """Returns the up-to-date frame, fetching as little as possible."""
+        with self._lock:
+            if self._frame is None or _time.monotonic() - self._last_full_sync >= self.full_sync_every:
+                return self._full_sync()
+
+            marker = self.source.modified_marker()
+            if marker is None:
+                return self._full_sync()
+            if marker == self._marker:
+                self.fetches["cached"] += 1
+                return self._frame
+
+            known = self._length()
+            count = self.source.row_count()
+            if count is None or count < known:
+                return self._full_sync()  # rows were deleted
+            edited = self.source.edited_since(self._marker)
+            if edited is None:
+                if self.source.tracks_edits() or count == known:
+                    return self._full_sync()  # rewritten, or edited where the store cannot say
+                return self._recheck_and_extend(marker)
+
+            edited = [position for position in edited if position < known]
+            if edited:
+                self._refresh(edited)
+                self.fetches["edited"] += 1
+            if count > known:
+                self._extend(_coerce_like(self.source.read_rows(known, self._base.columns), self._base))
+                self.fetches["tail"] += 1
+            self._marker = marker
+            return self._frame
+
+    def write(self, data):
+        """
+        Rewrites the sheet with `data` and adopts it as the replica state,
+        so the next sync() does not download what we just uploaded.
+        """
+        with self._lock:
+            self.source.update(data)
+            self._frame = data.reset_index(drop=True)
+            self._reset_derived()
+            self._marker = self.source.modified_marker()
+            return self._frame
+
+    def update_row(self, position, values):
+        """
+        Edits the visit at row `position` with a {column: value} dict. The
+        backend updates that one visit by its (ID, Date) key; if it cannot,
+        the whole sheet is rewritten. The metrics are adjusted by the one
+        row and the index is kept unless the key columns changed; the typed
+        copy and the recent ordering are rebuilt on next use.
+        """
+        return self.update_rows({position: values})
+
+    def update_rows(self, changes):
+        """update_row() for several visits at once: {position: {column: value}}, one backend batch."""
+        with self._lock:
+            data = self._frame.copy()
+            keyed = []
+            for position, values in changes.items():
+                values = _coerce_like(pd.DataFrame([values]), data).iloc[0]
+                _set_row(data, position, values)
+                key = self._frame.iloc[position]
+                keyed.append((key.get("ID"), key.get("Date"), dict(values.items())))
+
+            before = self.source.modified_marker()
+            with self.source.batch():
+                updated = [self.source.update_by_key(*change) for change in keyed]
+            if not all(updated):
+                self.source.update(data)
+
+            self._adopt(data, list(changes))
+            if before == self._marker or not all(updated):
+                self._marker = self.source.modified_marker()
+            # Otherwise someone else wrote since our last sync; the stale marker makes the next sync() catch up.
+            return self._frame
+
+    def append(self, rows):
+        """
+        Appends one visit (dict) or a batch of visits (DataFrame) to the sheet.
+        Only the new rows go over the wire. Falls back to a full rewrite
+        through write() when the sheet is empty, the rows bring columns the
+        sheet does not have yet, or the connection cannot append.
+        """
+        if isinstance(rows, dict):
+            rows = pd.DataFrame([rows])
+        with self._lock:
+            if self._base is None:
+                self.sync()
+            frame = self._base  # columns and dtypes only: the appended chunks stay unjoined
+            if self._length() == 0:
+                self.write(rows)
+                return
+            new_columns = [col for col in rows.columns if col not in frame.columns]
+            if new_columns or not self.source.can_append():
+                self.write(pd.concat([self._frame, rows], ignore_index=True))
+                return
+
+            rows = rows.reindex(columns=frame.columns)
+            before = self.source.modified_marker()
+            self.source.append_rows(rows)
+            if before == self._marker:
+                # Nobody else wrote since our last sync, so our copy plus the new rows is exact.
+                self._extend(_coerce_like(rows.copy(), frame))
+                self._marker = self.source.modified_marker()
+            # Otherwise the marker stays stale and the next sync() fetches the tail, our rows included.
+
+    def invalidate(self):
+        """Drops the cached frame; the next sync() does a full read."""
+        with self._lock:
+            self._frame = None
+            self._reset_derived()
+            self._marker = None
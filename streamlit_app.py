@@ -1,59 +1,114 @@
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-from datetime import datetime, time
+from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from batch_writer import BatchWriter, ConflictError
+from clinics import ClinicShards, clinics_from, intake_clinics
+from profiler import PROFILER, render_panel
+from validation import BLOCKING, MISSING_BITS, check_rows, describe
+from visit_import import check_import, read_upload
+from visit_schema import SHEET_COLUMNS, minutes_to_time
+
 # Use America/Denver for Mountain Time with DST support
 today_local = datetime.now(ZoneInfo("America/Denver")).date()
 
 
-# Establish Google Sheets connection
-conn = st.connection("gsheets", type=GSheetsConnection)
-existing_data = conn.read(ttl=0)
+def app_config():
+    """secrets.toml as a dict: [storage], [clinics], [intake]; empty if there is none (the Google Sheet alone)."""
+    try:
+        return st.secrets.to_dict()
+    except FileNotFoundError:
+        return {}
+
+
+def connect_sheet():
+    # Imported on first use: streamlit_gsheets and the Google client libraries
+    # take about a second to import, and a SQLite-only store never needs them.
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+
+CONFIG = app_config()
+
+# Open every clinic's stores (Google Sheets by default), shared by every session in this process
+@st.cache_resource
+def get_shards():
+    return ClinicShards.open(CLINICS, connect_sheet, today_local)
+
+# All sessions of this process hand their writes to one background writer per store
+@st.cache_resource
+def get_writer(shard):
+    return BatchWriter(get_shards().replicas[shard])
+
+# Optional timing spans per rerun (see profiler.py); off unless [profiler] is configured
+PROFILER.configure_from(st.secrets)
+PROFILER.start_run("intake")
+
+# Each clinic's staff, rooms and store (see clinics.py); one clinic on [storage] by default.
+# The clinic this terminal enters visits for: pinned by [intake] clinic, else picked when there are several.
+# Stores split by month are only read here.
+try:
+    CLINICS = clinics_from(CONFIG)
+    INTAKE_CLINICS = intake_clinics(CLINICS, CONFIG.get("intake", {}).get("clinic"))
+except ValueError as exc:  # two clinics with one name, an unknown or a monthly [intake] clinic
+    st.error(str(exc))
+    st.stop()
+if not INTAKE_CLINICS:
+    st.error("Every configured clinic stores its visits by month, which this app only reads. "
+             "Configure a clinic with a single store to enter visits.")
+    st.stop()
+elif len(INTAKE_CLINICS) > 1:
+    clinic = st.sidebar.selectbox("Clinic", INTAKE_CLINICS, format_func=lambda clinic: clinic.name)
+else:
+    clinic = INTAKE_CLINICS[0]
+
+shard = get_shards().shard_for(clinic.key, today_local)
+replica = get_shards().replicas[shard]
+writer = get_writer(shard)
+# Shared frames: never modify them in place, copy before editing.
+with PROFILER.span("fetch"):
+    existing_data = replica.sync()
+# Same rows with parsed dates, minute-of-day times and categoricals (see visit_schema),
+# built here once per change rather than in a fragment rerun.
+with PROFILER.span("parse"):
+    replica.typed
 
 # ----------------- Helper Functions -----------------
-def safe_to_datetime(value, fmt=None):
-    """
-    Safely converts a value to a datetime object.
-    Returns None if the value is missing, empty, or invalid.
-    """
-    if pd.isna(value) or value in ["", None]:
-        return None
-    try:
-        if fmt:
-            return pd.to_datetime(value, format=fmt, errors="coerce")
-        else:
-            return pd.to_datetime(value, errors="coerce")
-    except Exception:
-        return None
+def default_time(patient_data, column):
+    """Stored minute-of-day for a time field as a time object, None (an empty field) if missing."""
+    return minutes_to_time(patient_data.get(column))
 
-def safe_to_time(value, fmt="%H:%M"):
+def timeline_problems(entry):
     """
-    Converts a value (assumed to be a string in a given format) to a time object.
-    Returns time(0, 0) as a default if conversion fails.
+    Checks one visit about to be saved (see validation). Returns the
+    violations that keep it from being saved and the start/end pairs that
+    are still open, each as a list of readable strings.
     """
-    dt = safe_to_datetime(value, fmt=fmt)
-    if dt is not None:
-        return dt.time()
-    return time(0, 0)
+    violations = check_rows([entry])[0]
+    return describe(violations & BLOCKING), describe(violations & MISSING_BITS)
+
+def save_if_valid(entry, submit, message):
+    """Hands the visit to submit() unless its times are out of order or out of hours."""
+    with PROFILER.span("validate"):
+        errors, still_open = timeline_problems(entry)
+    if errors:
+        st.error(f"Not saved: {'; '.join(errors)}.")
+        return
+    if still_open:
+        message = f"{message} Still open: {'; '.join(still_open)}."
+    finish_write(submit(), message)
 
 # ----------------- App UI -----------------
 # Display Title
 st.title("Client Tracker")
 
 # Selection for New Patient or Edit Patient
-option = st.radio("Select an option:", ["New Patient", "Edit Patient"])
+option = st.radio("Select an option:", ["New Patient", "Edit Patient", "Bulk Import"])
 
-# Updated Staff list
-DOCTORS = [
-    "Dr. Jon Pierson", "Dr. Javier De La Torre", "Dr. John Borrego", "Dr. Omer Usman",
-    "Dr. Abhinav Vulisha", "Dr. Muhammad Tahir", "Dr. Richard McCallum",
-    "Dr. Eric Cox", "Dr. Sandra Vexler", "Dr. Abdel Vexler"
-]
-
-# Room options
-ROOMS = ["100", "101", "102", "103"]
+# Staff list and room options of this clinic
+DOCTORS = clinic.staff
+ROOMS = clinic.rooms
 
 # Updated Appointment Types
 APPT_TYPES = [
@@ -61,40 +116,74 @@ APPT_TYPES = [
     "Lab Draw", "Lab Results", "Rx Refill", "Specialist", "Specialist Follow Up", "Other"
 ]
 
-# Function to get existing patient data by ID
-def get_patient_data(patient_id):
-    """Retrieve existing patient data based on ID."""
-    if patient_id in existing_data["ID"].values:
-        return existing_data.loc[existing_data["ID"] == patient_id].to_dict(orient="records")[0]
-    return None
+# Functions to get existing patient data through the replica's ID index
+def get_patient_visits(index, patient_id, rows):
+    """
+    Row positions of every visit for a patient ID, newest first. The index
+    is only ever extended, so positions past the `rows` of the frame it was
+    taken with (visits added since) are left out.
+    """
+    return [pos for pos in index.visits(patient_id) if pos < rows][::-1]
+
+def get_patient_data(typed_data, position):
+    """Retrieve one stored visit, already typed, as a dict."""
+    return typed_data.iloc[position].to_dict()
+
+def show_recent_entries(existing_data, page_size=20):
+    """
+    Shows the newest visits first, one page at a time, from the replica's
+    maintained recency ordering instead of sorting the whole history.
+    """
+    page = st.number_input("Page (1 = newest)", min_value=1, value=1, step=1)
+    with PROFILER.span("recent"):
+        # Skip rows another session appended after this frame was taken.
+        positions = [pos for pos in replica.recent.page(page - 1, page_size) if pos < len(existing_data)]
+    st.dataframe(existing_data.iloc[positions])
+
+
 
 
 
+# ----------------- Fragments -----------------
+# Each section below is an st.fragment: a widget change inside one section
+# reruns only that section, with the frame from the last full run. After a
+# write we rerun the whole app so metrics and charts pick up the new row.
+def finish_write(pending, message):
+    """
+    Waits until the writer has stored the row, then keeps the confirmation
+    for the next run and reruns the full app. A refused write is shown
+    instead and nothing is rerun.
+    """
+    try:
+        with PROFILER.span("write"):
+            pending.result(timeout=60)
+    except ConflictError as error:
+        st.error(f"Not saved: {error}.")
+        st.session_state.pop("edit_loaded", None)
+        return
+    st.session_state.pop("edit_loaded", None)
+    st.session_state["saved_message"] = message
+    st.rerun(scope="app")
+
+def show_saved_message():
+    """Shows the confirmation left by finish_write(), once."""
+    message = st.session_state.pop("saved_message", None)
+    if message:
+        st.success(message)
 
 
 # ----------------- NEW PATIENT FORM -----------------
-if option == "New Patient":
+@st.fragment
+@PROFILER.traced("section.new_patient")
+def new_patient_section(existing_data):
     st.subheader("New Patient Entry")
+    show_saved_message()
 
     # Toggle to view existing data
     if not existing_data.empty:
         show_table = st.checkbox("Show Existing Patient Data (Last 20 Entries)", value=False)
         if show_table:
-            # Convert "Date" to a datetime object.
-            existing_data["Date_dt"] = pd.to_datetime(existing_data["Date"], format="%m/%d/%Y", errors="coerce")
-            
-            # Convert "Registration Start" into a timedelta (assuming it's in HH:MM format)
-            # We append ":00" to represent seconds.
-            existing_data["Registration_Start_td"] = pd.to_timedelta(existing_data["Registration Start"] + ":00")
-            
-            # Sort by ascending date and descending registration start time.
-            sorted_data = existing_data.sort_values(by=["Date_dt", "Registration_Start_td"], ascending=[True, False])
-            
-            # Optionally drop the helper columns.
-            sorted_data = sorted_data.drop(columns=["Date_dt", "Registration_Start_td"])
-            
-            # Display the top 20 entries.
-            st.dataframe(sorted_data.head(20))
+            show_recent_entries(existing_data)
     else:
         st.warning("No data available yet.")
 
@@ -123,61 +212,61 @@ if option == "New Patient":
         appointment_type_other = st.text_input("Describe Appointment Type if Applicable")
 
         # Time fields
-        registration_start = st.time_input("Registration Start", value=time(0,0), step=60)
-        registration_end = st.time_input("Registration End", value=time(0,0), step=60)
-        triage_start = st.time_input("Triage Start", value=time(0,0), step=60)
-        triage_end = st.time_input("Triage End", value=time(0,0), step=60)
-        time_roomed = st.time_input("Time Roomed", value=time(0,0), step=60)
-        exam_end = st.time_input("Exam End", value=time(0,0), step=60)
-        doctor_in = st.time_input("Doctor In", value=time(0,0),step=60)
-        doctor_out = st.time_input("Doctor Out", value=time(0,0), step=60)
-        lab_start = st.time_input("Lab Start", value=time(0,0), step=60)
-        lab_end = st.time_input("Lab End", value=time(0,0), step=60)
-        sw_start = st.time_input("SW Start", value=time(0,0), step=60)
-        sw_end = st.time_input("SW End", value=time(0,0), step=60)
-        time_out = st.time_input("Time Out", value=time(0,0), step=60)
+        registration_start = st.time_input("Registration Start", value=None, step=60)
+        registration_end = st.time_input("Registration End", value=None, step=60)
+        triage_start = st.time_input("Triage Start", value=None, step=60)
+        triage_end = st.time_input("Triage End", value=None, step=60)
+        time_roomed = st.time_input("Time Roomed", value=None, step=60)
+        exam_end = st.time_input("Exam End", value=None, step=60)
+        doctor_in = st.time_input("Doctor In", value=None, step=60)
+        doctor_out = st.time_input("Doctor Out", value=None, step=60)
+        lab_start = st.time_input("Lab Start", value=None, step=60)
+        lab_end = st.time_input("Lab End", value=None, step=60)
+        sw_start = st.time_input("SW Start", value=None, step=60)
+        sw_end = st.time_input("SW End", value=None, step=60)
+        time_out = st.time_input("Time Out", value=None, step=60)
 
         submit_button = st.form_submit_button(label="Add Patient")
 
         if submit_button:
-            new_entry = pd.DataFrame({
-                "Date": [date.strftime("%m/%d/%Y")],
-                "Staff": [final_staff],
-                "Room": [room],
-                "ID": [id_],
-                "Appointment Type": [appointment_type],
-                "Describe Appointment Type If Applicable": [appointment_type_other],
-                "Registration Start": [registration_start.strftime('%H:%M')],
-                "Registration End": [registration_end.strftime("%H:%M")],
-                "Triage Start": [triage_start.strftime('%H:%M')],
-                "Triage End": [triage_end.strftime('%H:%M')],
-                "Time Roomed": [time_roomed.strftime('%H:%M')],
-                "Exam End": [exam_end.strftime('%H:%M')],
-                "Doctor In": [doctor_in.strftime('%H:%M')],
-                "Doctor Out": [doctor_out.strftime('%H:%M')],
-                "Lab Start": [lab_start.strftime('%H:%M')],
-                "Lab End": [lab_end.strftime('%H:%M')],
-                "SW Start": [sw_start.strftime('%H:%M')],
-                "SW End": [sw_end.strftime('%H:%M')],
-                "Time Out": [time_out.strftime('%H:%M')]
-            })
-
-            if existing_data.empty:
-                updated_data = new_entry
-            else:
-                updated_data = pd.concat([existing_data, new_entry], ignore_index=True)
-            
-            conn.update(data=updated_data)
-
-            st.success("Patient added successfully!")
+            new_entry = {
+                "Date": date.strftime("%m/%d/%Y"),
+                "Staff": final_staff,
+                "Room": room,
+                "ID": id_,
+                "Appointment Type": appointment_type,
+                "Describe Appointment Type If Applicable": appointment_type_other,
+                "Registration Start": registration_start.strftime('%H:%M') if registration_start else None,
+                "Registration End": registration_end.strftime('%H:%M') if registration_end else None,
+                "Triage Start": triage_start.strftime('%H:%M') if triage_start else None,
+                "Triage End": triage_end.strftime('%H:%M') if triage_end else None,
+                "Time Roomed": time_roomed.strftime('%H:%M') if time_roomed else None,
+                "Exam End": exam_end.strftime('%H:%M') if exam_end else None,
+                "Doctor In": doctor_in.strftime('%H:%M') if doctor_in else None,
+                "Doctor Out": doctor_out.strftime('%H:%M') if doctor_out else None,
+                "Lab Start": lab_start.strftime('%H:%M') if lab_start else None,
+                "Lab End": lab_end.strftime('%H:%M') if lab_end else None,
+                "SW Start": sw_start.strftime('%H:%M') if sw_start else None,
+                "SW End": sw_end.strftime('%H:%M') if sw_end else None,
+                "Time Out": time_out.strftime('%H:%M') if time_out else None
+            }
+
+            # Queued with the other terminals' writes and appended as rows;
+            # refused if this patient already has a visit on that date.
+            save_if_valid(new_entry, lambda: writer.insert(new_entry), "Patient added successfully!")
 
 
 
 
 # ----------------- EDIT EXISTING PATIENT FORM -----------------
 
-elif option == "Edit Patient":
+@st.fragment
+@PROFILER.traced("section.edit_patient")
+def edit_patient_section():
     st.subheader("Edit Existing Patient")
+    show_saved_message()
+    # Frame, index and typed rows of one moment: other sessions keep syncing the replica between reruns.
+    existing_data, index, typed_data = replica.snapshot()
 
     selected_id = st.number_input("Enter Patient ID to Edit", min_value=0, max_value=1000000, step=1)
     
@@ -185,22 +274,39 @@ elif option == "Edit Patient":
     if not existing_data.empty:
         show_table = st.checkbox("Show Existing Patient Data (Last 20 Entries)", value=False)
         if show_table:
-            st.dataframe(existing_data)
+            show_recent_entries(existing_data)
     else:
         st.warning("No data available yet.")
 
     if selected_id:
-        patient_data = get_patient_data(selected_id)
-        if patient_data:
+        with PROFILER.span("lookup"):
+            visit_positions = get_patient_visits(index, selected_id, len(existing_data))
+        if visit_positions:
             st.success("Patient found! Modify the details below and click 'Update'.")
+            # Returning patients have several visits; let staff pick which one to edit.
+            visit_position = st.selectbox(
+                "Visit to Edit", options=visit_positions,
+                format_func=lambda pos: f"{existing_data.at[pos, 'Date']} ({existing_data.at[pos, 'Staff']})"
+            )
+            with PROFILER.span("lookup"):
+                patient_data = get_patient_data(typed_data, visit_position)
+            # Remember the visit as first loaded, so an edit made meanwhile
+            # at another terminal is detected instead of overwritten.
+            if st.session_state.get("edit_loaded") != (selected_id, visit_position):
+                st.session_state["edit_loaded"] = (selected_id, visit_position)
+                st.session_state["edit_snapshot"] = existing_data.iloc[visit_position].to_dict()
+        elif selected_id in index:
+            patient_data = None
+            st.info("This patient's visit was just added at another terminal. Reload the page to edit it.")
         else:
+            patient_data = None
             st.warning("No matching patient ID found.")
      
     
     if selected_id and patient_data:
-            # Safely prepopulate fields using helper functions
-            stored_date = safe_to_datetime(patient_data.get("Date"), fmt="%m/%d/%Y")
-            default_date = stored_date.date() if stored_date is not None else today_local
+            # Prepopulate fields from the typed visit
+            stored_date = patient_data.get("Date")
+            default_date = stored_date.date() if not pd.isna(stored_date) else today_local
 
             # Prepopulate doctor info
             stored_staff = str(patient_data.get("Staff", "")).strip()
@@ -237,58 +343,20 @@ elif option == "Edit Patient":
                 existing_appt_desc = ""
             appointment_type_other = st.text_input("Describe Appointment Type if Applicable", value=existing_appt_desc)
             
-            # Safely prepopulate time fields
-            stored_reg_start = safe_to_datetime(patient_data.get("Registration Start"), fmt="%H:%M")
-            default_reg_start = stored_reg_start.time() if stored_reg_start is not None else time(0, 0)
-            registration_start = st.time_input("Registration Start", value=default_reg_start, step=60)
-            
-            stored_reg_end = safe_to_datetime(patient_data.get("Registration End"), fmt="%H:%M")
-            default_reg_end = stored_reg_end.time() if stored_reg_end is not None else time(0, 0)
-            registration_end = st.time_input("Registration End", value=default_reg_end, step=60)
-            
-            stored_triage_start = safe_to_datetime(patient_data.get("Triage Start"), fmt="%H:%M")
-            default_triage_start = stored_triage_start.time() if stored_triage_start is not None else time(0, 0)
-            triage_start = st.time_input("Triage Start", value=default_triage_start, step=60)
-            
-            stored_triage_end = safe_to_datetime(patient_data.get("Triage End"), fmt="%H:%M")
-            default_triage_end = stored_triage_end.time() if stored_triage_end is not None else time(0, 0)
-            triage_end = st.time_input("Triage End", value=default_triage_end, step=60)
-            
-            stored_time_roomed = safe_to_datetime(patient_data.get("Time Roomed"), fmt="%H:%M")
-            default_time_roomed = stored_time_roomed.time() if stored_time_roomed is not None else time(0, 0)
-            time_roomed = st.time_input("Time Roomed", value=default_time_roomed, step=60)
-            
-            stored_exam_end = safe_to_datetime(patient_data.get("Exam End"), fmt="%H:%M")
-            default_exam_end = stored_exam_end.time() if stored_exam_end is not None else time(0, 0)
-            exam_end = st.time_input("Exam End", value=default_exam_end, step=60)
-            
-            stored_doc_in = safe_to_datetime(patient_data.get("Doctor In"), fmt="%H:%M")
-            default_doc_in = stored_doc_in.time() if stored_doc_in is not None else time(0, 0)
-            doctor_in = st.time_input("Doctor In", value=default_doc_in, step=60)
-            
-            stored_doc_out = safe_to_datetime(patient_data.get("Doctor Out"), fmt="%H:%M")
-            default_doc_out = stored_doc_out.time() if stored_doc_out is not None else time(0, 0)
-            doctor_out = st.time_input("Doctor Out", value=default_doc_out, step=60)
-            
-            stored_lab_start = safe_to_datetime(patient_data.get("Lab Start"), fmt="%H:%M")
-            default_lab_start = stored_lab_start.time() if stored_lab_start is not None else time(0, 0)
-            lab_start = st.time_input("Lab Start", value=default_lab_start, step=60)
-            
-            stored_lab_end = safe_to_datetime(patient_data.get("Lab End"), fmt="%H:%M")
-            default_lab_end = stored_lab_end.time() if stored_lab_end is not None else time(0, 0)
-            lab_end = st.time_input("Lab End", value=default_lab_end, step=60)
-            
-            stored_sw_start = safe_to_datetime(patient_data.get("SW Start"), fmt="%H:%M")
-            default_sw_start = stored_sw_start.time() if stored_sw_start is not None else time(0, 0)
-            sw_start = st.time_input("SW Start", value=default_sw_start, step=60)
-            
-            stored_sw_end = safe_to_datetime(patient_data.get("SW End"), fmt="%H:%M")
-            default_sw_end = stored_sw_end.time() if stored_sw_end is not None else time(0, 0)
-            sw_end = st.time_input("SW End", value=default_sw_end, step=60)
-            
-            stored_time_out = safe_to_datetime(patient_data.get("Time Out"), fmt="%H:%M")
-            default_time_out = stored_time_out.time() if stored_time_out is not None else time(0, 0)
-            time_out = st.time_input("Time Out", value=default_time_out, step=60)
+            # Prepopulate time fields from the stored minute-of-day values
+            registration_start = st.time_input("Registration Start", value=default_time(patient_data, "Registration Start"), step=60)
+            registration_end = st.time_input("Registration End", value=default_time(patient_data, "Registration End"), step=60)
+            triage_start = st.time_input("Triage Start", value=default_time(patient_data, "Triage Start"), step=60)
+            triage_end = st.time_input("Triage End", value=default_time(patient_data, "Triage End"), step=60)
+            time_roomed = st.time_input("Time Roomed", value=default_time(patient_data, "Time Roomed"), step=60)
+            exam_end = st.time_input("Exam End", value=default_time(patient_data, "Exam End"), step=60)
+            doctor_in = st.time_input("Doctor In", value=default_time(patient_data, "Doctor In"), step=60)
+            doctor_out = st.time_input("Doctor Out", value=default_time(patient_data, "Doctor Out"), step=60)
+            lab_start = st.time_input("Lab Start", value=default_time(patient_data, "Lab Start"), step=60)
+            lab_end = st.time_input("Lab End", value=default_time(patient_data, "Lab End"), step=60)
+            sw_start = st.time_input("SW Start", value=default_time(patient_data, "SW Start"), step=60)
+            sw_end = st.time_input("SW End", value=default_time(patient_data, "SW End"), step=60)
+            time_out = st.time_input("Time Out", value=default_time(patient_data, "Time Out"), step=60)
             
             with st.form("edit_patient_form"):
                 date = st.date_input("Date", value=default_date)
@@ -298,109 +366,166 @@ elif option == "Edit Patient":
                 update_button = st.form_submit_button(label="Update Patient")
                 if update_button:
                     # Identify the existing entry by matching ID and Date
-                    existing_entry = existing_data[
-                        (existing_data["ID"] == selected_id) &
-                        (existing_data["Date"] == date.strftime("%m/%d/%Y"))
-                    ]
-                    if not existing_entry.empty:
-                        existing_data.loc[
-                            (existing_data["ID"] == selected_id) &
-                            (existing_data["Date"] == date.strftime("%m/%d/%Y")),
-                            ["Staff", "Room", "Appointment Type", "Describe Appointment Type If Applicable",
-                            "Registration Start", "Registration End", "Triage Start", "Triage End", "Time Roomed",
-                            "Exam End", "Doctor In", "Doctor Out", "Lab Start", "Lab End", "SW Start", "SW End", "Time Out"]
-                        ] = [
-                            final_staff, room, appointment_type, appointment_type_other,
-                            registration_start.strftime('%H:%M') if registration_start else None,
-                            registration_end.strftime('%H:%M') if registration_end else None,
-                            triage_start.strftime('%H:%M') if triage_start else None,
-                            triage_end.strftime('%H:%M') if triage_end else None,
-                            time_roomed.strftime('%H:%M') if time_roomed else None,
-                            exam_end.strftime('%H:%M') if exam_end else None,
-                            doctor_in.strftime('%H:%M') if doctor_in else None,
-                            doctor_out.strftime('%H:%M') if doctor_out else None,
-                            lab_start.strftime('%H:%M') if lab_start else None,
-                            lab_end.strftime('%H:%M') if lab_end else None,
-                            sw_start.strftime('%H:%M') if sw_start else None,
-                            sw_end.strftime('%H:%M') if sw_end else None,
-                            time_out.strftime('%H:%M') if time_out else None
-                        ]
-                        conn.update(data=existing_data)
-                        st.success("Patient information updated successfully!")
+                    existing_position = index.position(selected_id, date)
+                    if existing_position is not None and existing_position != visit_position:
+                        # The new Date points at another visit, which may have been edited since it was
+                        # last loaded anywhere; only a form loaded from that visit may overwrite it.
+                        st.error(f"Patient {selected_id} already has a visit on {date:%m/%d/%Y}. "
+                                 f"Pick it under 'Visit to Edit' to change it.")
+                    elif existing_position is not None:
+                        changes = {
+                            "Staff": final_staff,
+                            "Room": room,
+                            "Appointment Type": appointment_type,
+                            "Describe Appointment Type If Applicable": appointment_type_other,
+                            "Registration Start": registration_start.strftime('%H:%M') if registration_start else None,
+                            "Registration End": registration_end.strftime('%H:%M') if registration_end else None,
+                            "Triage Start": triage_start.strftime('%H:%M') if triage_start else None,
+                            "Triage End": triage_end.strftime('%H:%M') if triage_end else None,
+                            "Time Roomed": time_roomed.strftime('%H:%M') if time_roomed else None,
+                            "Exam End": exam_end.strftime('%H:%M') if exam_end else None,
+                            "Doctor In": doctor_in.strftime('%H:%M') if doctor_in else None,
+                            "Doctor Out": doctor_out.strftime('%H:%M') if doctor_out else None,
+                            "Lab Start": lab_start.strftime('%H:%M') if lab_start else None,
+                            "Lab End": lab_end.strftime('%H:%M') if lab_end else None,
+                            "SW Start": sw_start.strftime('%H:%M') if sw_start else None,
+                            "SW End": sw_end.strftime('%H:%M') if sw_end else None,
+                            "Time Out": time_out.strftime('%H:%M') if time_out else None
+                        }
+                        snapshot = st.session_state.get("edit_snapshot", {})
+                        expected = {col: snapshot.get(col) for col in changes}
+                        save_if_valid(changes, lambda: writer.edit(selected_id, date, changes, expected),
+                                      "Patient information updated successfully!")
                     else:
-                        new_entry = pd.DataFrame({
-                            "Date": [date.strftime("%m/%d/%Y")],
-                            "ID": [selected_id],
-                            "Staff": [final_staff],
-                            "Room": [room],
-                            "Appointment Type": [appointment_type],
-                            "Describe Appointment Type If Applicable": [appointment_type_other],
-                            "Registration Start": [registration_start.strftime('%H:%M') if registration_start else None],
-                            "Registration End": [registration_end.strftime('%H:%M') if registration_end else None],
-                            "Triage Start": [triage_start.strftime('%H:%M') if triage_start else None],
-                            "Triage End": [triage_end.strftime('%H:%M') if triage_end else None],
-                            "Time Roomed": [time_roomed.strftime('%H:%M') if time_roomed else None],
-                            "Exam End": [exam_end.strftime('%H:%M') if exam_end else None],
-                            "Doctor In": [doctor_in.strftime('%H:%M') if doctor_in else None],
-                            "Doctor Out": [doctor_out.strftime('%H:%M') if doctor_out else None],
-                            "Lab Start": [lab_start.strftime('%H:%M') if lab_start else None],
-                            "Lab End": [lab_end.strftime('%H:%M') if lab_end else None],
-                            "SW Start": [sw_start.strftime('%H:%M') if sw_start else None],
-                            "SW End": [sw_end.strftime('%H:%M') if sw_end else None],
-                            "Time Out": [time_out.strftime('%H:%M') if time_out else None]
-                        })
-                        if existing_data.empty:
-                            updated_data = new_entry
-                        else:
-                            updated_data = pd.concat([existing_data, new_entry], ignore_index=True)
-                        conn.update(data=updated_data)
-                        st.success("Patient information updated successfully!")
-
-
-
-st.subheader("Clinic Metrics")
-
-if not existing_data.empty:
-    total_patients = len(existing_data)
-    today_str = today_local.strftime("%m/%d/%Y")
-    patients_today = len(existing_data[existing_data["Date"] == today_str])
-    common_appt = existing_data["Appointment Type"].mode()[0] if not existing_data["Appointment Type"].isna().all() else "N/A"
-
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        st.markdown(f'<p style="font-size:16px; font-weight:bold;">Total Patients</p>', unsafe_allow_html=True)
-        st.markdown(f'<p style="font-size:14px;">{total_patients}</p>', unsafe_allow_html=True)
-
-    with col2:
-        st.markdown(f'<p style="font-size:16px; font-weight:bold;">Patients Seen Today</p>', unsafe_allow_html=True)
-        st.markdown(f'<p style="font-size:14px;">{patients_today}</p>', unsafe_allow_html=True)
-
-    with col3:
-        st.markdown(f'<p style="font-size:16px; font-weight:bold;">Most Common Appointment</p>', unsafe_allow_html=True)
-        st.markdown(f'<p style="font-size:14px;">{common_appt}</p>', unsafe_allow_html=True)
-else:
-    st.warning("No data available for metrics.")
+                        new_entry = {
+                            "Date": date.strftime("%m/%d/%Y"),
+                            "ID": selected_id,
+                            "Staff": final_staff,
+                            "Room": room,
+                            "Appointment Type": appointment_type,
+                            "Describe Appointment Type If Applicable": appointment_type_other,
+                            "Registration Start": registration_start.strftime('%H:%M') if registration_start else None,
+                            "Registration End": registration_end.strftime('%H:%M') if registration_end else None,
+                            "Triage Start": triage_start.strftime('%H:%M') if triage_start else None,
+                            "Triage End": triage_end.strftime('%H:%M') if triage_end else None,
+                            "Time Roomed": time_roomed.strftime('%H:%M') if time_roomed else None,
+                            "Exam End": exam_end.strftime('%H:%M') if exam_end else None,
+                            "Doctor In": doctor_in.strftime('%H:%M') if doctor_in else None,
+                            "Doctor Out": doctor_out.strftime('%H:%M') if doctor_out else None,
+                            "Lab Start": lab_start.strftime('%H:%M') if lab_start else None,
+                            "Lab End": lab_end.strftime('%H:%M') if lab_end else None,
+                            "SW Start": sw_start.strftime('%H:%M') if sw_start else None,
+                            "SW End": sw_end.strftime('%H:%M') if sw_end else None,
+                            "Time Out": time_out.strftime('%H:%M') if time_out else None
+                        }
+                        save_if_valid(new_entry, lambda: writer.insert(new_entry), "Patient information updated successfully!")
+
+
+
+# ----------------- BULK IMPORT -----------------
+@st.fragment
+@PROFILER.traced("section.bulk_import")
+def bulk_import_section():
+    st.subheader("Import Visits from a File")
+    show_saved_message()
+    st.caption("A CSV or Excel file with the sheet's columns and one visit per row, e.g. a paper log typed up.")
+    st.download_button("Column template (CSV)", ",".join(SHEET_COLUMNS) + "\n", file_name="visits_template.csv")
+
+    upload = st.file_uploader("Visits file", type=["csv", "xlsx"])
+    if upload is None:
+        return
+    try:
+        # Checked as whole columns (see visit_import); nothing is stored yet.
+        with PROFILER.span("import.check"):
+            accepted, rejects = check_import(read_upload(upload.getvalue(), upload.name), replica.index,
+                                             DOCTORS, ROOMS, APPT_TYPES)
+    except ValueError as error:
+        st.error(f"Cannot read {upload.name}: {error}.")
+        return
+
+    st.write(f"{len(accepted)} visits ready to import, {len(rejects)} rejected.")
+    if not rejects.empty:
+        st.warning("Rejected rows are not imported. Fix them in the file and upload it again; "
+                   "visits already imported are then reported as existing.")
+        st.dataframe(rejects, hide_index=True)
+        st.download_button("Rejected rows (CSV)", rejects.to_csv(index=False), file_name=f"rejected_{upload.name.rsplit('.', 1)[0]}.csv")
+    if not accepted.empty and st.button(f"Import {len(accepted)} visits"):
+        # One queued write: the writer appends every row in a single backend call.
+        finish_write(writer.insert_many(accepted), f"Imported {len(accepted)} visits.")
+
+
+# ----------------- CLINIC METRICS -----------------
+@st.fragment
+@PROFILER.traced("section.metrics")
+def clinic_metrics_section(metrics):
+    st.subheader("Clinic Metrics")
+
+    # Read straight from the replica's maintained counters (see clinic_metrics).
+    if metrics.total:
+        with PROFILER.span("metrics"):
+            total_patients = metrics.total
+            patients_today = metrics.patients_on(today_local)
+            common_appt = metrics.most_common_appointment()
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.markdown(f'<p style="font-size:16px; font-weight:bold;">Total Patients</p>', unsafe_allow_html=True)
+            st.markdown(f'<p style="font-size:14px;">{total_patients}</p>', unsafe_allow_html=True)
+
+        with col2:
+            st.markdown(f'<p style="font-size:16px; font-weight:bold;">Patients Seen Today</p>', unsafe_allow_html=True)
+            st.markdown(f'<p style="font-size:14px;">{patients_today}</p>', unsafe_allow_html=True)
+
+        with col3:
+            st.markdown(f'<p style="font-size:16px; font-weight:bold;">Most Common Appointment</p>', unsafe_allow_html=True)
+            st.markdown(f'<p style="font-size:14px;">{common_appt}</p>', unsafe_allow_html=True)
+    else:
+        st.warning("No data available for metrics.")
 
-import matplotlib.pyplot as plt
+# ----------------- CLINIC DATA INSIGHTS -----------------
+@st.fragment
+@PROFILER.traced("section.insights")
+def clinic_insights_section(metrics):
+    st.divider()
+    st.subheader("📊 Clinic Data Insights")
 
-st.divider()
-st.subheader("📊 Clinic Data Insights")
+    # Number of patients seen per doctor today, from the per-day counters
+    with PROFILER.span("metrics.per_doctor"):
+        patients_per_doctor = metrics.patients_per_doctor(today_local)
 
-today_str = today_local.strftime("%m/%d/%Y")  # Format it as MM/DD/YYYY
+    st.subheader("Patients Seen per Doctor Today")
 
-# Filter data for today's appointments
-patients_today_df = existing_data[existing_data["Date"] == today_str]
+    if not patients_per_doctor.empty:
+        # Option 1: Simple Bar Chart using Streamlit
+        st.bar_chart(patients_per_doctor)
+
+  
+    else:
+        st.warning("No patients seen today.")
+
+    # Across sites: every clinic's stores, fetched concurrently and merged
+    if len(CLINICS) > 1:
+        st.subheader("Patients Seen per Clinic Today")
+        with PROFILER.span("fetch.clinics"):
+            visits = get_shards().sync()
+        today_visits = visits[visits["Date"] == pd.Timestamp(today_local)]
+        if not today_visits.empty:
+            st.bar_chart(today_visits.groupby(["Staff", "Clinic"], observed=True).size().unstack(fill_value=0))
+        else:
+            st.warning("No patients seen today at any clinic.")
 
-# Count the number of patients seen per doctor
-patients_per_doctor = patients_today_df["Staff"].value_counts()
 
-st.subheader("Patients Seen per Doctor Today")
+# ----------------- Layout -----------------
+if option == "New Patient":
+    new_patient_section(existing_data)
+elif option == "Edit Patient":
+    edit_patient_section()
+elif option == "Bulk Import":
+    bulk_import_section()
 
-if not patients_today_df.empty and not patients_per_doctor.empty:
-    # Option 1: Simple Bar Chart using Streamlit
-    st.bar_chart(patients_per_doctor)
+clinic_metrics_section(replica.metrics)
+clinic_insights_section(replica.metrics)
 
-  
-else:
-    st.warning("No patients seen today.")
\ No newline at end of file
+render_panel()
+PROFILER.finish_run()
@@ -0,0 +1,167 @@
+"""
+Seeded generator of realistic visits, for trying the apps at real volumes.
+
+The shape follows the bundled 330-row CSV: the staff, room and appointment
+mix, how often each stage is recorded (triage for two visits in three, a
+doctor for fewer than half, lab and social work for a quarter or less),
+stage gaps drawn from log-normals matching the observed median and 90th
+percentile, and a share of entry errors (unset 00:00 times, swapped
+stages) like the rows validation flags. Visits are spread over open clinic
+days with busier and quieter days, sorted by date as the sheet is.
+
+    sheet_visits(100_000)                         # intake sheet layout
+    write_cleaned_csv("visits.csv", 1_000_000)    # dashboard CSV layout
+
+Rows are produced in chunks of CHUNK_ROWS, so 10M visits never need more
+than one chunk of Python strings at a time. For a given CHUNK_ROWS the
+output depends only on (n, seed, years, error_rate, start).
+"""
+import numpy as np
+import pandas as pd
+
+from visit_schema import TIME_COLUMNS, format_clock, format_dates
+
+CHUNK_ROWS = 1_000_000
+
+# value -> weight, as counted in the bundled CSV (None = left empty)
+STAFF = {
+    "Dr. Jon Pierson": 106, "Dr. Richard McCallum": 38, "Dr. John Borrego": 35, None: 34,
+    "Dr. Javier De La Torre": 24, "Dr. Omer Usman": 19, "Dr. Sandra Vexler": 18, "Dr. Muhammad Tahir": 17,
+    "Dr. Abdel Vexler": 12, "Dr. Abhinav Vulisha": 7, "Dr. Eric Cox": 5,
+}
+ROOMS = {"100": 87, "101": 78, "102": 60, "103": 55, "LEFT": 28, "-": 9, "TRIAGE": 7, "LAB": 4, "SW": 1}
+# (appointment type, description) -> weight
+APPOINTMENTS = {
+    ("FP", "Lab results follow-up"): 40, ("FP", "Rx refill CMP/UA"): 25, ("FP", "Clinic (follow-up)"): 30,
+    ("FP", "Psychiatrist"): 17, ("FP", "Back pain"): 12, ("FP", "Gynecologist"): 10,
+    ("NEW", "Opthalmologist"): 35, ("NEW", "Physical"): 20, ("NEW", "Lab draw CMP/A1C"): 30,
+    ("NEW", "Cough, sore throat"): 15, ("NEW", "Rash"): 11, ("NEW", "Abdominal pain"): 12, ("NEW", "Check-up"): 8,
+    ("New Patient", ""): 14, ("New Encounter (existing pt.)", ""): 13, ("Specialist", ""): 9,
+    ("Lab Results", ""): 7, ("Lab Draw", ""): 4, ("Follow-up", ""): 4, ("Rx Refill", ""): 3,
+}
+# Share of visits with each stage recorded (Registration Start and Time Out always are).
+RECORDED = {"registration": 0.95, "triage": 0.67, "roomed": 0.71, "exam": 0.52, "doctor": 0.42, "lab": 0.28, "sw": 0.21}
+# Gap in minutes -> (median, 90th percentile)
+GAPS = {
+    "registration": (12, 66), "to triage": (17, 67), "triage": (7, 16), "to room": (4.5, 86),
+    "to doctor": (54, 101), "doctor": (16, 50), "exam": (29, 68), "to lab": (45, 118), "lab": (8, 14),
+    "to sw": (45, 118), "sw": (18, 29), "to out": (12.5, 43),
+}
+# First registration of the day and the last arrival, minutes since midnight.
+ARRIVALS = (7 * 60 + 30, 14 * 60)
+OPEN_WEEKDAYS = [0, 1, 2, 3, 4, 5]
+
+
+def _pick(rng, weights, n):
+    """n draws from {value: weight} as an object array."""
+    values = np.empty(len(weights), dtype=object)
+    values[:] = list(weights)
+    p = np.array(list(weights.values()), dtype=float)
+    return values[rng.choice(len(values), n, p=p / p.sum())]
+
+
+def _gap(rng, name, n):
+    median, p90 = GAPS[name]
+    return rng.lognormal(np.log(median), np.log(p90 / median) / 1.2816, n)
+
+
+def _open_days(n_days, start, rng):
+    """The first n_days clinic days from `start`, each with a relative busyness."""
+    days = pd.bdate_range(start, periods=n_days * 2, freq="C", weekmask=[d in OPEN_WEEKDAYS for d in range(7)])
+    return days[:n_days], rng.gamma(8.0, 1 / 8.0, n_days)
+
+
+def _day_of_rows(n, seed, years, start):
+    """Clinic day of every visit (sorted), from a multinomial over busyness-weighted open days."""
+    rng = np.random.default_rng([seed, 0])
+    n_days = max(1, int(years * 52 * len(OPEN_WEEKDAYS)))
+    days, busyness = _open_days(n_days, start, rng)
+    counts = rng.multinomial(n, busyness / busyness.sum())
+    return days, np.repeat(np.arange(n_days), counts)
+
+
+def _times(rng, n, error_rate):
+    """Minutes since midnight per time column (float, NaN where not recorded)."""
+    def recorded(stage):
+        return rng.random(n) < RECORDED[stage]
+
+    times = {}
+    start = rng.uniform(*ARRIVALS, n)
+    times["Registration Start"] = start
+    times["Registration End"] = np.where(recorded("registration"), start + _gap(rng, "registration", n), np.nan)
+    last = np.fmax(start, times["Registration End"])
+
+    triage = recorded("triage")
+    triage_start = last + _gap(rng, "to triage", n)
+    times["Triage Start"] = np.where(triage, triage_start, np.nan)
+    times["Triage End"] = np.where(triage, triage_start + _gap(rng, "triage", n), np.nan)
+    last = np.fmax(last, times["Triage End"])
+
+    roomed = recorded("roomed")
+    room = last + _gap(rng, "to room", n)
+    times["Time Roomed"] = np.where(roomed, room, np.nan)
+    times["Exam End"] = np.where(roomed & recorded("exam"), room + _gap(rng, "exam", n), np.nan)
+    doctor = recorded("doctor")
+    doctor_in = room + _gap(rng, "to doctor", n)
+    times["Doctor In"] = np.where(doctor, doctor_in, np.nan)
+    times["Doctor Out"] = np.where(doctor, doctor_in + _gap(rng, "doctor", n), np.nan)
+    for stage, first, second in [("lab", "Lab Start", "Lab End"), ("sw", "SW Start", "SW End")]:
+        done = recorded(stage)
+        begin = room + _gap(rng, f"to {stage}", n)
+        times[first] = np.where(done, begin, np.nan)
+        times[second] = np.where(done, begin + _gap(rng, stage, n), np.nan)
+
+    latest = np.nanmax(np.column_stack([times[col] for col in TIME_COLUMNS if col in times]), axis=1)
+    times["Time Out"] = latest + _gap(rng, "to out", n)
+    minutes = np.column_stack([np.minimum(np.floor(times[col]), 23 * 60 + 59) for col in TIME_COLUMNS])
+
+    # Entry errors: a field left at the form's 00:00 default, or two stages swapped.
+    unset = rng.random(n) < error_rate / 2
+    minutes[unset, rng.integers(1, len(TIME_COLUMNS), unset.sum())] = 0
+    swapped = np.flatnonzero(rng.random(n) < error_rate / 2)
+    first = rng.integers(0, len(TIME_COLUMNS) - 1, len(swapped))
+    minutes[swapped, first], minutes[swapped, first + 1] = minutes[swapped, first + 1], minutes[swapped, first]
+    return minutes
+
+
+# ----------------- Generators -----------------
+def sheet_chunks(n, seed=0, years=3, error_rate=0.05, start="2024-01-01"):
+    """Yields the n visits as intake-sheet frames ("MM/DD/YYYY", "HH:MM") of at most CHUNK_ROWS rows."""
+    days, day_of_row = _day_of_rows(n, seed, years, start)
+    patients = max(1, int(n * 0.6))  # returning patients: about 1.7 visits per ID
+    for chunk, begin in enumerate(range(0, n, CHUNK_ROWS)):
+        rng = np.random.default_rng([seed, chunk + 1])
+        size = min(CHUNK_ROWS, n - begin)
+        appointments = _pick(rng, APPOINTMENTS, size)
+        data = {
+            "Date": format_dates(pd.Series(days[day_of_row[begin:begin + size]])).to_numpy(),
+            "Staff": _pick(rng, STAFF, size),
+            "Room": _pick(rng, ROOMS, size),
+            "ID": rng.integers(1, patients + 1, size),
+            "Appointment Type": [appointment for appointment, _ in appointments],
+            "Describe Appointment Type If Applicable": [description for _, description in appointments],
+        }
+        minutes = _times(rng, size, error_rate)
+        labels = format_clock(pd.Series(minutes.ravel()).astype("Int32"), unit="minute").to_numpy()
+        labels = labels.reshape(size, len(TIME_COLUMNS))
+        for i, col in enumerate(TIME_COLUMNS):
+            data[col] = labels[:, i]
+        yield pd.DataFrame(data, index=pd.RangeIndex(begin, begin + size))
+
+
+def sheet_visits(n, seed=0, **options):
+    """n visits in the intake sheet layout, as one frame (see sheet_chunks() for the options)."""
+    return pd.concat(sheet_chunks(n, seed, **options))
+
+
+def write_cleaned_csv(path, n, seed=0, **options):
+    """
+    Writes n visits as the cleaned analytics CSV the dashboard reads, via
+    etl.clean() (Visit Type / Category, timestamps, durations), chunk by chunk.
+    """
+    from etl import clean
+
+    for chunk in sheet_chunks(n, seed, **options):
+        cleaned = clean(chunk, hashes=np.zeros(len(chunk), dtype=np.uint64))
+        cleaned.drop(columns=["Source Row", "Source Hash"]).to_csv(path, mode="w" if chunk.index[0] == 0 else "a",
+                                                                   header=chunk.index[0] == 0, index=False)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_cleaned_csv  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def cleaned_csv(tmp_path_factory):
+    """A cleaned visits CSV of 20,000 generated visits over two years, in its own folder."""
+    path = tmp_path_factory.mktemp("visits") / "visits.csv"
+    write_cleaned_csv(str(path), 20_000, seed=0, years=2)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def dashboard_frame(cleaned_csv):
+    from dashboard_data import build_dashboard_frame
+
+    return build_dashboard_frame(cleaned_csv)
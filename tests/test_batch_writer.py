@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from batch_writer import BatchWriter, ConflictError
+from storage import LocalSheetConnection, SheetReplica, SQLiteBackend
+from synthetic import sheet_visits
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def open_source(request, tmp_path):
+    """Returns a function opening another connection to one shared store, like another process would."""
+    data = sheet_visits(200, seed=3)
+    if request.param == "memory":
+        shared = LocalSheetConnection(data)
+        yield lambda: shared
+        return
+    path = str(tmp_path / "clinic.db")
+    SQLiteBackend(path).update(data)
+    backends = []
+
+    def connect():
+        backends.append(SQLiteBackend(path))
+        return backends[-1]
+
+    yield connect
+    for backend in backends:
+        backend.close()
+
+
+def _shared_visit(replica):
+    row = replica.sync().iloc[0]
+    return row["ID"], row["Date"], row["Room"]
+
+
+def test_edit_made_elsewhere_is_a_conflict_even_when_the_sheet_grew(open_source):
+    first, second = SheetReplica(open_source()), SheetReplica(open_source())
+    patient_id, date, room = _shared_visit(second)
+    second.index  # the second terminal loaded the visit and built its index
+
+    first.sync()
+    first.update_row(0, {"Room": int(room) + 1})
+    first.append(sheet_visits(3, seed=4))
+
+    with pytest.raises(ConflictError):
+        BatchWriter(second).edit(patient_id, date, {"Room": int(room) + 5}, expected={"Room": room}).result(10)
+    assert int(second.sync().iloc[0]["Room"]) == int(room) + 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_concurrent_increments_are_not_lost(open_source, processes):
+    replicas = [SheetReplica(open_source()) for _ in range(processes)]
+    writers = [BatchWriter(replica) for replica in replicas]
+    patient_id, date, start = _shared_visit(replicas[0])
+    sessions, increments = 6, 5
+
+    def increment(session):
+        replica, writer = replicas[session % processes], writers[session % processes]
+        for _ in range(increments):
+            while True:
+                frame = replica.sync()
+                room = frame.at[replica.index.position(patient_id, date), "Room"]
+                try:
+                    writer.edit(patient_id, date, {"Room": int(room) + 1}, expected={"Room": room}).result(30)
+                    break
+                except ConflictError:
+                    pass
+
+    threads = [threading.Thread(target=increment, args=(session,)) for session in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stored = open_source().read_all()
+    assert int(stored.iloc[0]["Room"]) == int(start) + sessions * increments
+
+
+def test_inserts_from_two_replicas_are_stored_once(open_source):
+    replicas = [SheetReplica(open_source()) for _ in range(2)]
+    writers = [BatchWriter(replica) for replica in replicas]
+    visits = sheet_visits(20, seed=5)
+    visits["ID"] = range(5_000_000, 5_000_020)
+
+    pending = [writers[i % 2].insert(row) for i, row in enumerate(visits.to_dict("records"))]
+    for write in pending:
+        write.result(30)
+
+    stored = open_source().read_all()["ID"].astype(int).value_counts()
+    assert all(stored.get(visit_id) == 1 for visit_id in visits["ID"])
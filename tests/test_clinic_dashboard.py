@@ -0,0 +1,46 @@
+import os
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import warmup
+from dashboard_data import DATA_FILE
+from synthetic import write_cleaned_csv
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clinic_dashboard.py")
+
+
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    """clinic_dashboard.py on 2,000 generated visits in DATA_FILE of a fresh folder."""
+    monkeypatch.chdir(tmp_path)
+    write_cleaned_csv(DATA_FILE, 2_000, seed=0)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield AppTest.from_file(APP, default_timeout=120)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+
+def _labelled(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def test_what_ifs_only_run_on_the_button(dashboard):
+    dashboard.run()
+    _labelled(dashboard.slider, "Triage nurses").set_value((1, 1)).run()
+    assert not dashboard.exception, dashboard.exception
+    assert "what_if" not in dashboard.session_state
+
+    _labelled(dashboard.select_slider, "Simulated days per scenario").set_value(500)
+    _labelled(dashboard.button, "Run simulation").click().run()
+    assert not dashboard.exception, dashboard.exception
+    (_, grid, days), what_if = dashboard.session_state.what_if
+    assert days == 500 and len(what_if) == len(grid) == 4
+
+
+def test_a_prewarmed_process_still_renders_the_dashboard(dashboard):
+    assert warmup.prewarm(APP) is not None
+    dashboard.run()
+    assert not dashboard.exception, dashboard.exception
@@ -0,0 +1,59 @@
+from collections import Counter
+
+import pytest
+
+from clinics import Clinic, ClinicShards, clinics_from, intake_clinics
+from storage import LocalSheetConnection, SheetReplica
+from synthetic import sheet_visits
+
+SINGLE = Clinic("north", "North Clinic", [], [], {"backend": "sqlite", "path": "north.db"})
+MONTHLY = Clinic("south", "South Clinic", [], [], {"backend": "sqlite", "path": "south-{month}.db"})
+
+
+def test_intake_lists_only_clinics_with_a_single_store():
+    assert intake_clinics([SINGLE, MONTHLY]) == [SINGLE]
+
+
+def test_unknown_pinned_clinic_names_the_configured_keys():
+    with pytest.raises(ValueError, match="use one of: north, south"):
+        intake_clinics([SINGLE, MONTHLY], pinned="nort")
+
+
+def test_pinned_monthly_clinic_is_refused():
+    with pytest.raises(ValueError, match="split by month"):
+        intake_clinics([SINGLE, MONTHLY], pinned="south")
+
+
+def _shards(count=3, rows=500):
+    sites = [Clinic(f"site{i}", f"Clinic {i}", [], [], {}) for i in range(count)]
+    replicas = {(site.key, None): SheetReplica(LocalSheetConnection(sheet_visits(rows, seed=i)))
+                for i, site in enumerate(sites)}
+    return sites, ClinicShards(sites, replicas)
+
+
+def test_shards_merge_every_clinic_with_a_clinic_column():
+    sites, shards = _shards()
+    merged = shards.sync()
+    assert len(merged) == 3 * 500
+    assert (merged["Clinic"].value_counts() == 500).all()
+
+
+def test_only_the_changed_shard_is_fetched_and_an_unchanged_merge_is_reused():
+    sites, shards = _shards()
+    merged = shards.sync()
+    changed = shards.replicas[(sites[1].key, None)]
+    changed.source.append_rows(sheet_visits(1, seed=99))
+    before = {shard: Counter(replica.fetches) for shard, replica in shards.replicas.items()}
+
+    grown = shards.sync()
+    assert len(grown) == len(merged) + 1
+    fetched = {shard: replica.fetches - before[shard] for shard, replica in shards.replicas.items()}
+    assert fetched[(sites[1].key, None)] == Counter(tail=1)
+    assert all(counts == Counter(cached=1) for shard, counts in fetched.items() if shard[0] != sites[1].key)
+    assert shards.sync() is grown
+
+
+def test_clinics_sharing_a_name_are_refused():
+    config = {"clinics": {"north": {"name": "Clinic"}, "south": {"name": "Clinic"}, "east": {}}}
+    with pytest.raises(ValueError, match="north, south are all named 'Clinic'"):
+        clinics_from(config)
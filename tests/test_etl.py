@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from etl import CleanedStore, main
+from storage import LocalSheetConnection, SQLiteBackend
+from synthetic import sheet_visits
+from visit_schema import format_dates
+
+
+def test_reprocess_rewrites_only_the_edited_visit(tmp_path):
+    days, per_day = 30, 20
+    raw = sheet_visits(days * per_day)
+    day_numbers = np.repeat(np.arange(days), per_day)
+    raw["Date"] = format_dates(pd.Series(pd.Timestamp("2025-01-01") + pd.to_timedelta(day_numbers, unit="D"))).to_numpy()
+    store = CleanedStore(str(tmp_path))
+    store.sync(LocalSheetConnection(raw))
+    last_day = raw.iloc[-per_day:]
+
+    assert store.reprocess(last_day) == 0
+    edited = last_day.copy()
+    edited.iloc[0, edited.columns.get_loc("Time Out")] = "16:45"
+    assert store.reprocess(edited) == 1
+    assert store.read()["Time Out"].iloc[-per_day] == "2025-01-30 16:45:00"
+
+
+def test_read_day_finds_every_spelling_of_the_day(tmp_path):
+    raw = sheet_visits(8)
+    raw["Date"] = ["08/05/2024", "8/5/2024", "2024-08-05", "08/5/2024", "08/06/2024", "2024-08-06", "bad", None]
+    sqlite = SQLiteBackend(str(tmp_path / "clinic.db"))
+    sqlite.update(raw)
+
+    for source in (sqlite, LocalSheetConnection(raw)):
+        day = source.read_day(pd.Timestamp("2024-08-05"), ["ID", "Date"])
+        assert list(day.index) == [0, 1, 2, 3]
+        assert list(day["ID"].astype(int)) == list(raw["ID"].iloc[:4].astype(int))
+
+
+def test_cli_day_reprocesses_that_day_from_the_store(tmp_path, capsys):
+    raw = sheet_visits(200)
+    raw["Date"] = ["01/01/2025"] * 100 + ["01/02/2025"] * 100
+    path = str(tmp_path / "clinic.db")
+    source = SQLiteBackend(path)
+    source.update(raw)
+    folder = str(tmp_path / "cleaned")
+    main([path, folder])
+    source.update_by_key(raw["ID"].iloc[150], "01/02/2025", {"Time Out": "16:45"})
+
+    main([path, folder, "--day", "2025-01-02"])
+    assert capsys.readouterr().out.splitlines()[-1] == "2025-01-02: 1 of 100 rows rewritten"
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from dashboard_data import DURATIONS, PANEL_COLUMNS
+from metrics_cube import MetricsCube
+from validation import BLOCKING
+from visit_partitions import VisitFilter, VisitPartitions, _mask
+
+
+def rollup_mismatches(cube, df):
+    """
+    Recomputes each dashboard number from the raw rows and compares it with
+    the cube rollup. Returns a list of mismatches (empty when all agree).
+    """
+    problems = []
+
+    def same(name, rolled, raw):
+        if isinstance(raw, pd.Series):
+            ok = rolled.index.equals(raw.index) and np.allclose(
+                rolled.to_numpy(dtype=float), raw.to_numpy(dtype=float), rtol=1e-12, equal_nan=True
+            )
+        else:
+            ok = np.isclose(rolled, raw, rtol=1e-12, equal_nan=True)
+        if not ok:
+            problems.append(f"{name}: cube {rolled!r} vs rows {raw!r}")
+
+    same("total", cube.total(), len(df))
+    same("flagged", cube.total("Flagged"), ((df["Violations"].to_numpy() & BLOCKING) != 0).sum())
+    for duration in DURATIONS:
+        same(f"mean {duration}", cube.mean(duration), df[duration].mean())
+    same("patients per staff", cube.rollup("Staff", "IDs"), df[df["Staff"].notna()].groupby("Staff")["ID"].count())
+    same("doctor time per staff", cube.mean("Doctor Time", by="Staff").dropna(),
+         df[df["Doctor Time"].notna() & df["Staff"].notna()].groupby("Staff")["Doctor Time"].mean())
+    same("triage coverage", cube.total("Triage Recorded"), df[["Triage Start", "Triage End"]].dropna().shape[0])
+    same("visit mix", cube.value_counts("Visit Type", normalize=True), df["Visit Type"].value_counts(normalize=True))
+    same("duration by category", cube.mean("Total Visit Duration", by="Visit Category"),
+         df.groupby("Visit Category")["Total Visit Duration"].mean())
+    same("category distribution", cube.value_counts("Visit Category", where=~cube.cells["Is Excluded Category"]),
+         df["Visit Category"].loc[~df["Is Excluded Category"]].value_counts())
+    rolled_mix = cube.monthly_mix()
+    raw_mix = df[~df["Is Excluded Category"]].groupby(["Month", "Visit Category"]).size().unstack().fillna(0)
+    if not rolled_mix.equals(raw_mix):
+        problems.append("monthly mix differs")
+    same("first day", cube.date_range()[0].value, df["Date"].min().value)
+    same("last day", cube.date_range()[1].value, df["Date"].max().value)
+    return problems
+
+
+def test_rollups_match_the_raw_rows(dashboard_frame):
+    assert rollup_mismatches(MetricsCube.build(dashboard_frame), dashboard_frame) == []
+
+
+def test_cube_of_a_partition_view_matches_its_rows(cleaned_csv, dashboard_frame):
+    doctor = dashboard_frame["Staff"].value_counts().index[0]
+    middle = dashboard_frame["Day"].iloc[len(dashboard_frame) // 2]
+    week = VisitFilter(first=middle, last=middle + pd.Timedelta(days=6), staff=(doctor,))
+
+    view = VisitPartitions(cleaned_csv).read(week, PANEL_COLUMNS)
+    rows = dashboard_frame[_mask(dashboard_frame, week)].reset_index(drop=True)
+    assert len(view) == len(rows) > 0
+    assert rollup_mismatches(MetricsCube.build(view), rows) == []
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from occupancy import STAGES, Occupancy, _intervals
+
+BUILDS = [(stage, None) for stage in STAGES] + [("Exam", "Room"), ("Doctor", "Staff")]
+
+
+@pytest.mark.parametrize("stage, by", BUILDS)
+def test_littles_law_gives_the_mean_recorded_duration(dashboard_frame, stage, by):
+    result = Occupancy.build(dashboard_frame, stage, by=by)
+    begins, ends, usable = _intervals(dashboard_frame, stage, "second")
+    if by is not None:
+        usable &= dashboard_frame[by].notna().to_numpy()  # rows without a Room / Staff are in no group
+    recorded = np.ceil(ends[usable] / 60) - np.ceil(begins[usable] / 60)
+    assert np.isclose(result.average_minutes(), recorded.mean())
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_minute_grid_matches_a_direct_count(dashboard_frame, stage):
+    result = Occupancy.build(dashboard_frame, stage)
+    day = dashboard_frame["Day"].iloc[len(dashboard_frame) // 2]
+    begins, ends, usable = _intervals(dashboard_frame[dashboard_frame["Day"] == day], stage, "second")
+    instants = result.minutes() * 60
+    covering = ((begins[usable, None] <= instants) & (instants < ends[usable, None])).sum(axis=0)
+    assert np.array_equal(covering, result.timeline(day)["All"].to_numpy())
@@ -0,0 +1,17 @@
+import logging
+
+from profiler import Profiler
+
+
+def test_unknown_profiler_settings_warn_and_the_rest_apply(caplog):
+    profiler = Profiler()
+    with caplog.at_level(logging.WARNING, logger="profiler"):
+        profiler.configure_from({"profiler": {"enabled": True, "window": 50, "panle": False, "sample_rate": 0.1}})
+    assert profiler.enabled and profiler.window == 50 and profiler.panel
+    assert "panle, sample_rate" in caplog.text
+
+
+def test_no_profiler_section_leaves_it_disabled():
+    profiler = Profiler()
+    profiler.configure_from({})
+    assert not profiler.enabled
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from dashboard_data import DURATIONS, duration_seconds
+from quantiles import ALPHA, QUANTILES, DurationSketches
+
+
+def quantile_mismatches(sketches, df, qs=QUANTILES):
+    """
+    Compares every sketch quantile, overall and per staff member, with the
+    exact quantile of the raw rows at the same rank. Returns a list of the
+    ones off by more than ALPHA (empty when all are within it).
+    """
+    problems = []
+
+    def within(name, estimate, seconds):
+        exact = np.quantile(seconds, qs, method="lower")
+        off = np.abs(estimate * 60 - exact) > ALPHA * np.abs(exact) + 1e-6
+        for q, bad, value, truth in zip(qs, off, estimate, exact / 60):
+            if bad:
+                problems.append(f"{name} p{q * 100:g}: sketch {value:.3f} vs rows {truth:.3f} min")
+
+    for duration in DURATIONS:
+        seconds = duration_seconds(df, duration)
+        recorded = seconds.notna()
+        if sketches.count(duration) != recorded.sum():
+            problems.append(f"{duration}: {sketches.count(duration)} sketched vs {recorded.sum()} recorded")
+        if not recorded.any():
+            continue
+        within(duration, sketches.quantiles(duration, qs).to_numpy(), seconds[recorded].to_numpy(dtype="float64"))
+        per_staff = sketches.quantiles(duration, qs, by="Staff")
+        for staff, group in seconds[recorded & df["Staff"].notna()].groupby(df["Staff"], observed=True):
+            within(f"{duration} / {staff}", per_staff.loc[staff].to_numpy(), group.to_numpy(dtype="float64"))
+    return problems
+
+
+@pytest.fixture(scope="module")
+def sketches(dashboard_frame):
+    return DurationSketches.build(dashboard_frame)
+
+
+def test_every_quantile_is_within_alpha_of_the_exact_one(sketches, dashboard_frame):
+    assert quantile_mismatches(sketches, dashboard_frame) == []
+
+
+def test_a_selection_is_within_alpha_of_its_rows(sketches, dashboard_frame):
+    staff = dashboard_frame["Staff"].value_counts().index[0]
+    first = dashboard_frame["Day"].min()
+    days = (first, first + np.timedelta64(90, "D"))
+    rows = (dashboard_frame["Staff"] == staff) & dashboard_frame["Day"].between(*days)
+    for duration in DURATIONS:
+        seconds = duration_seconds(dashboard_frame[rows], duration).dropna().to_numpy(dtype="float64")
+        if not len(seconds):
+            continue
+        exact = np.quantile(seconds, QUANTILES, method="lower")
+        estimate = sketches.quantiles(duration, days=days, staff=[staff]).to_numpy() * 60
+        assert (np.abs(estimate - exact) <= ALPHA * np.abs(exact) + 1e-6).all(), duration
@@ -0,0 +1,71 @@
+import os
+from datetime import date, time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from fragment_reruns import rerun_fragment, span_counts
+from storage import SQLiteBackend
+from synthetic import sheet_visits
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+@pytest.fixture
+def intake_app(tmp_path):
+    """streamlit_app.py on a SQLite store of 500 generated visits, with the store and its visits."""
+    visits = sheet_visits(500)
+    path = str(tmp_path / "clinic.db")
+    SQLiteBackend(path).update(visits)
+    st.cache_resource.clear()  # the shards of another test's store
+    app_test = AppTest.from_file(APP, default_timeout=60)
+    app_test.secrets["storage"] = {"backend": "sqlite", "path": path}
+    app_test.secrets["profiler"] = {"enabled": True, "panel": False}
+    yield app_test, SQLiteBackend(path), visits
+    st.cache_resource.clear()
+
+
+def test_editing_a_time_field_reruns_only_the_edit_form(intake_app):
+    app_test, store, visits = intake_app
+    app_test.run()
+    app_test.radio[0].set_value("Edit Patient").run()
+    app_test.number_input[0].set_value(int(visits["ID"].iloc[0])).run()
+    marker = store.modified_marker()
+    before = span_counts("intake")
+
+    for minute in range(3):
+        app_test.time_input[0].set_value(time(9, minute))
+        rerun_fragment(app_test, "edit_patient_section")
+        assert not app_test.exception, app_test.exception
+        assert app_test.time_input[0].value == time(9, minute)
+    ran = span_counts("intake") - before
+    assert ran["section.edit_patient"] == 3
+    assert ran["section.metrics"] == 0 and ran["section.insights"] == 0 and ran["fetch"] == 0
+    assert store.modified_marker() == marker
+
+
+def test_a_mistyped_intake_clinic_is_shown_as_an_error(intake_app):
+    app_test, _, _ = intake_app
+    app_test.secrets["intake"] = {"clinic": "nort"}
+    app_test.run()
+    assert not app_test.exception, app_test.exception
+    assert "is not a configured clinic" in app_test.error[0].value
+
+
+def test_moving_an_edit_onto_another_visit_of_the_patient_is_refused(intake_app):
+    app_test, store, visits = intake_app
+    visits = visits.copy()
+    visits.loc[1, "ID"] = visits.loc[0, "ID"]
+    visits.loc[0, "Date"], visits.loc[1, "Date"] = "03/02/2025", "03/09/2025"
+    store.update(visits)
+    app_test.run()
+    app_test.radio[0].set_value("Edit Patient").run()
+    app_test.number_input[0].set_value(int(visits["ID"].iloc[0])).run()
+    marker = store.modified_marker()
+
+    next(widget for widget in app_test.date_input if widget.label == "Date").set_value(date(2025, 3, 9))
+    next(widget for widget in app_test.button if widget.label == "Update Patient").click().run()
+    assert not app_test.exception, app_test.exception
+    assert "already has a visit on 03/09/2025" in app_test.error[0].value
+    assert store.modified_marker() == marker
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from storage import LocalSheetConnection, SheetReplica
+from synthetic import sheet_visits
+
+
+class SheetLike(LocalSheetConnection):
+    """The in-memory stand-in without edit tracking, as a Google Sheet behaves (see GSheetsSource)."""
+
+    def edited_since(self, marker):
+        return None
+
+    def tracks_edits(self):
+        return False
+
+
+def _replicas(rows=1_000, recheck_rows=50):
+    sheet = SheetLike(sheet_visits(rows))
+    return sheet, SheetReplica(sheet, recheck_rows=recheck_rows), SheetReplica(sheet, recheck_rows=recheck_rows)
+
+
+def test_rows_appended_to_a_sheet_are_read_without_a_full_read():
+    sheet, ours, theirs = _replicas()
+    ours.sync()
+    theirs.sync()
+    theirs.append(sheet_visits(3, seed=1))
+    read_before = sheet.rows_read
+
+    assert len(ours.sync()) == 1_003
+    assert ours.fetches["full"] == 1 and ours.fetches["tail"] == 1
+    assert sheet.rows_read - read_before == 50 + 3
+    assert ours.sync().equals(sheet.read_all())
+
+
+def test_recent_edits_on_a_sheet_that_grew_are_picked_up():
+    sheet, ours, theirs = _replicas()
+    ours.sync()
+    theirs.sync()
+    theirs.update_row(990, {"Room": "42"})
+    theirs.append(sheet_visits(2, seed=1))
+
+    frame = ours.sync()
+    assert frame.at[990, "Room"] == "42"
+    assert ours.fetches["full"] == 1 and ours.fetches["edited"] == 1
+    assert frame.equals(sheet.read_all())
+
+
+def test_an_edit_without_new_rows_reads_the_whole_sheet():
+    sheet, ours, theirs = _replicas()
+    ours.sync()
+    theirs.sync()
+    theirs.update_row(10, {"Room": "42"})
+
+    assert ours.sync().at[10, "Room"] == "42"
+    assert ours.fetches["full"] == 2
+
+
+def test_appended_chunks_are_joined_for_readers():
+    sheet = LocalSheetConnection(sheet_visits(100))
+    replica = SheetReplica(sheet)
+    replica.sync()
+    replica.typed
+    for seed in range(3):
+        replica.append(sheet_visits(2, seed=seed + 1))
+
+    frame, index, typed = replica.snapshot()
+    assert frame.equals(sheet.read_all())
+    assert len(typed) == 106 and list(typed.index) == list(range(106))
+    assert typed["Date"].iloc[-1] == pd.Timestamp(frame["Date"].iloc[-1])
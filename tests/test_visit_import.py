@@ -0,0 +1,29 @@
+from batch_writer import BatchWriter
+from storage import LocalSheetConnection, SheetReplica
+from synthetic import APPOINTMENTS, ROOMS, STAFF, sheet_visits
+from visit_import import check_import, read_upload
+
+STAFF_NAMES = [name for name in STAFF if name]
+APPOINTMENT_TYPES = sorted({appointment for appointment, _ in APPOINTMENTS})
+
+
+def test_an_import_stores_every_accepted_row_in_one_append():
+    conn = LocalSheetConnection(sheet_visits(1_000, seed=1))
+    replica = SheetReplica(conn)
+    replica.sync()
+    upload = sheet_visits(300, seed=2, error_rate=0).astype(object)
+    upload["Staff"] = upload["Staff"].fillna(STAFF_NAMES[0])
+    upload["ID"] = range(900_000, 900_300)
+    upload.loc[::100, "Staff"] = "Dr. Nobody"
+    upload.loc[1] = replica.sync().iloc[0]  # a visit the sheet already has
+
+    accepted, rejects = check_import(read_upload(upload.to_csv(index=False).encode(), "log.csv"), replica.index,
+                                     STAFF_NAMES, list(ROOMS), APPOINTMENT_TYPES)
+    problems = rejects["Problems"].str.cat(sep="; ")
+    assert "Staff not on this clinic's list" in problems and "already has a visit" in problems
+    assert len(accepted) + len(rejects) == len(upload)
+
+    appends = conn.calls["append_rows"]
+    BatchWriter(replica).insert_many(accepted).result(timeout=30)
+    assert conn.calls["append_rows"] == appends + 1
+    assert len(replica.sync()) == 1_000 + len(accepted)
@@ -0,0 +1,163 @@
+"""
+Timeline checks for visits, evaluated as array operations over a whole frame.
+
+check() takes a typed frame (see visit_schema.to_typed; minutes or seconds
+since midnight) and returns one uint64 violation mask per row. Each bit
+names a rule and the time column it concerns:
+  - ORDER:   the time is earlier than a stage recorded before it in one of
+             the CHAINS (or is that stage). Missing stages are skipped, so
+             "Time Roomed" is still compared with "Registration Start"
+             when triage was not recorded.
+  - HOURS:   the time lies outside CLINIC_HOURS; this catches the "00:00"
+             the intake form used to save for fields nobody filled in.
+  - MISSING: one end of a start/end pair (see PAIRS) was recorded without
+             the other. Normal while a visit is still in progress.
+
+The intake forms refuse rows with BLOCKING bits and mention the missing
+ones; the dashboard drops durations whose end points are flagged
+(duration_mask()).
+"""
+import numpy as np
+import pandas as pd
+
+from visit_schema import TIME_COLUMNS, TIME_UNITS, parse_clock
+
+# Stages in the order they happen; recorded (non-missing) times in each chain must not decrease.
+CHAINS = [
+    ["Registration Start", "Triage Start", "Triage End", "Time Roomed", "Doctor In", "Doctor Out", "Time Out"],
+    ["Registration Start", "Registration End", "Time Out"],
+    ["Time Roomed", "Exam End", "Time Out"],
+    ["Registration Start", "Lab Start", "Lab End", "Time Out"],
+    ["Registration Start", "SW Start", "SW End", "Time Out"],
+]
+# Start/end pairs that are recorded together.
+PAIRS = [
+    ("Registration Start", "Registration End"),
+    ("Triage Start", "Triage End"),
+    ("Time Roomed", "Exam End"),
+    ("Doctor In", "Doctor Out"),
+    ("Lab Start", "Lab End"),
+    ("SW Start", "SW End"),
+    ("Registration Start", "Time Out"),
+]
+# Opening and closing time in seconds since midnight (inclusive).
+CLINIC_HOURS = (6 * 3600, 22 * 3600)
+
+ORDER, HOURS, MISSING = "order", "hours", "missing"
+
+_COLUMN_SLOT = {col: i for i, col in enumerate(TIME_COLUMNS)}
+_HOURS_SHIFT = len(TIME_COLUMNS)
+_MISSING_SHIFT = 2 * len(TIME_COLUMNS)
+
+
+def bit(kind, column):
+    """The mask bit of one rule: (ORDER | HOURS, time column) or (MISSING, pair)."""
+    if kind == ORDER:
+        return np.uint64(1) << np.uint64(_COLUMN_SLOT[column])
+    if kind == HOURS:
+        return np.uint64(1) << np.uint64(_HOURS_SHIFT + _COLUMN_SLOT[column])
+    return np.uint64(1) << np.uint64(_MISSING_SHIFT + PAIRS.index(column))
+
+
+def _combine(bits):
+    mask = np.uint64(0)
+    for value in bits:
+        mask |= value
+    return mask
+
+
+ORDER_BITS = _combine(bit(ORDER, col) for col in TIME_COLUMNS)
+HOURS_BITS = _combine(bit(HOURS, col) for col in TIME_COLUMNS)
+MISSING_BITS = _combine(bit(MISSING, pair) for pair in PAIRS)
+# Violations a form refuses to save; MISSING is allowed (the visit is still going on).
+BLOCKING = ORDER_BITS | HOURS_BITS
+
+
+def duration_mask(start, end):
+    """Bits that make the duration end - start meaningless: either end point out of order or out of hours."""
+    return _combine(bit(kind, col) for kind in (ORDER, HOURS) for col in (start, end))
+
+
+# ----------------- Checks -----------------
+def _time_matrix(frame, unit):
+    """(13, n) int32 array of seconds since midnight, one contiguous row per time column; -1 where missing."""
+    per_unit = TIME_UNITS[unit][1]
+    times = np.full((len(TIME_COLUMNS), len(frame)), -1, dtype=np.int32)
+    for i, col in enumerate(TIME_COLUMNS):
+        if col in frame.columns:
+            times[i] = frame[col].to_numpy(dtype="int32", na_value=-1)
+            if per_unit != 1:
+                np.multiply(times[i], per_unit, out=times[i], where=times[i] >= 0)
+    return times
+
+
+def _set(violations, hit, value):
+    np.bitwise_or(violations, value, out=violations, where=hit)
+
+
+def _order_violations(times, chain, violations):
+    """
+    ORs ORDER bits into `violations` where a recorded stage is earlier than
+    the latest stage recorded before it in `chain`, for both stages.
+    """
+    latest = times[_COLUMN_SLOT[chain[0]]].copy()  # -1 until a stage is recorded
+    holder = np.zeros(len(latest), dtype=np.int8)  # position in the chain of that latest stage
+    for step in range(1, len(chain)):
+        values = times[_COLUMN_SLOT[chain[step]]]
+        hit = (values >= 0) & (values < latest)
+        if hit.any():
+            _set(violations, hit, bit(ORDER, chain[step]))
+            for earlier in range(step):
+                _set(violations, hit & (holder == earlier), bit(ORDER, chain[earlier]))
+        later = values >= latest
+        np.copyto(holder, step, where=later & (values >= 0))
+        np.maximum(latest, values, out=latest)
+
+
+def check(frame, unit="minute", hours=CLINIC_HOURS):
+    """
+    Violation mask (uint64 array, one per row) for a typed frame whose time
+    columns count `unit`s since midnight. 0 means the row passed every rule.
+    """
+    times = _time_matrix(frame, unit)
+    violations = np.zeros(len(frame), dtype=np.uint64)
+
+    for chain in CHAINS:
+        _order_violations(times, chain, violations)
+
+    present = times >= 0
+    outside = present & ((times < hours[0]) | (times > hours[1]))
+    for i, col in enumerate(TIME_COLUMNS):
+        _set(violations, outside[i], bit(HOURS, col))
+
+    for pair in PAIRS:
+        start, end = present[_COLUMN_SLOT[pair[0]]], present[_COLUMN_SLOT[pair[1]]]
+        _set(violations, start != end, bit(MISSING, pair))
+    return violations
+
+
+def check_rows(rows, hours=CLINIC_HOURS):
+    """check() for rows in the sheet layout ("HH:MM" strings), e.g. a form submission or an import batch."""
+    raw = pd.DataFrame(rows).reindex(columns=TIME_COLUMNS)
+    # One parse over all time cells: a single form row would otherwise pay
+    # pandas' per-column overhead 13 times.
+    seconds = parse_clock(raw.to_numpy(dtype=object).ravel(), unit="second")
+    seconds = seconds.to_numpy(dtype="float64", na_value=np.nan).reshape(len(raw), len(TIME_COLUMNS))
+    return check(pd.DataFrame(seconds, columns=TIME_COLUMNS), "second", hours)
+
+
+def describe(mask, hours=CLINIC_HOURS):
+    """Readable list of the violations in one row's mask."""
+    mask = np.uint64(mask)
+    problems = []
+    out_of_order = [col for col in TIME_COLUMNS if mask & bit(ORDER, col)]
+    if out_of_order:
+        problems.append(f"{', '.join(out_of_order)} out of order")
+    outside = [col for col in TIME_COLUMNS if mask & bit(HOURS, col)]
+    if outside:
+        opening, closing = (f"{t // 3600:02d}:{t // 60 % 60:02d}" for t in hours)
+        problems.append(f"{', '.join(outside)} outside clinic hours ({opening}-{closing})")
+    for start, end in PAIRS:
+        if mask & bit(MISSING, (start, end)):
+            problems.append(f"{start} / {end} only half recorded")
+    return problems
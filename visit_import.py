@@ -0,0 +1,151 @@
+"""
+Bulk import of visits from a CSV or Excel file in the sheet's column layout.
+
+On busy days visits are logged on paper and typed into the New Patient form
+later, one submit each. check_import() takes a whole file instead and checks
+it column by column: dates, IDs and the 13 time columns are parsed in one
+pass each (see visit_schema), Staff / Room / Appointment Type are matched
+against the clinic's lists, the timelines go through validation.check(),
+and every (ID, Date) key is looked up in the replica's VisitIndex and among
+the file's own rows. It returns the accepted rows, in the formats the form
+saves ("MM/DD/YYYY", "HH:MM"), and a report of the rejected ones with their
+line in the file and every reason. BatchWriter.insert_many() then stores
+the accepted rows in one append.
+
+    upload = read_upload(data, "monday.csv")
+    accepted, rejects = check_import(upload, replica.index, staff, rooms, appointment_types)
+    writer.insert_many(accepted).result()
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+from validation import BLOCKING, CLINIC_HOURS, check, describe
+from visit_schema import SHEET_COLUMNS, TIME_COLUMNS, format_clock, format_dates, parse_clock, parse_dates
+
+REQUIRED_COLUMNS = ["Date", "Staff", "ID"]
+MAX_ID = 1_000_000  # the largest ID the forms accept
+
+
+def read_upload(data, name):
+    """The rows of an uploaded CSV or Excel (.xlsx) file, blank cells as None."""
+    if name.lower().endswith((".xlsx", ".xls")):
+        try:
+            frame = pd.read_excel(io.BytesIO(data), dtype=object)
+        except ImportError as error:  # openpyxl is optional
+            raise ValueError("reading Excel files needs openpyxl installed, save the sheet as CSV instead") from error
+    else:
+        frame = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    frame.columns = [str(col).strip() for col in frame.columns]
+    return frame.astype(object).where(frame.notna() & (frame != ""), None)
+
+
+def _text(values):
+    """Cells as stripped strings, None where blank."""
+    values = values.astype(object)
+    text = values.where(values.isna(), values.astype(str).str.strip())
+    return text.where(text.notna() & (text != ""), None)
+
+
+def _room_text(values):
+    """Room cells as the form's labels: 101 and 101.0 (spreadsheets store numbers) become "101"."""
+    text = _text(values)
+    numbers = pd.to_numeric(text, errors="coerce")
+    whole = (numbers.notna() & (numbers % 1 == 0)).to_numpy()
+    text[whole] = numbers[whole].astype("int64").astype(str)
+    return text
+
+
+def check_import(upload, index, staff, rooms, appointment_types, hours=CLINIC_HOURS):
+    """
+    Splits the rows of an upload into (accepted, rejects).
+
+    accepted: the rows to store, in SHEET_COLUMNS order and the form's formats.
+    rejects: the rejected rows as uploaded, after their file Line and Problems.
+
+    A row is rejected for a missing or unparseable Date or ID, a missing
+    Staff, a Staff / Room / Appointment Type not on the given lists, a time
+    that is not a time, times out of order or outside clinic hours, or an
+    (ID, Date) that `index` already has or that an earlier row of the file
+    uses. Raises ValueError when a required column is missing.
+    """
+    missing = [col for col in REQUIRED_COLUMNS if col not in upload.columns]
+    if missing:
+        raise ValueError(f"the file has no {', '.join(missing)} column")
+    upload = upload.reset_index(drop=True)
+    raw = upload.reindex(columns=SHEET_COLUMNS)
+    problems = {}  # reason -> rows it applies to
+
+    dates = parse_dates(raw["Date"])
+    problems["Date missing or not a date"] = dates.isna().to_numpy()
+    ids = pd.to_numeric(raw["ID"], errors="coerce")
+    problems[f"ID missing or not a whole number from 0 to {MAX_ID}"] = (
+        ids.isna() | (ids % 1 != 0) | (ids < 0) | (ids > MAX_ID)
+    ).to_numpy()
+
+    staff_text = _text(raw["Staff"])
+    problems["Staff missing"] = staff_text.isna().to_numpy()
+    problems["Staff not on this clinic's list"] = (staff_text.notna() & ~staff_text.isin(staff)).to_numpy()
+    room_text = _room_text(raw["Room"])
+    problems["Room not on this clinic's list"] = (room_text.notna() & ~room_text.isin(rooms)).to_numpy()
+    appointment_text = _text(raw["Appointment Type"])
+    problems["unknown Appointment Type"] = (
+        appointment_text.notna() & ~appointment_text.isin(appointment_types)
+    ).to_numpy()
+
+    # All time cells parsed in one pass, as in validation.check_rows().
+    cells = raw[TIME_COLUMNS].to_numpy(dtype=object)
+    seconds = parse_clock(cells.ravel(), unit="second").to_numpy(dtype="float64", na_value=np.nan)
+    seconds = seconds.reshape(cells.shape)
+    unreadable = np.isnan(seconds) & pd.notna(cells) & (cells != "")
+    for i, col in enumerate(TIME_COLUMNS):
+        problems[f"{col} is not a time"] = unreadable[:, i]
+    violations = check(pd.DataFrame(seconds, columns=TIME_COLUMNS), "second", hours) & BLOCKING
+
+    rejected = np.logical_or.reduce(list(problems.values())) | (violations != 0)
+    # Duplicates last, so the first usable row of a repeated visit is the one kept.
+    date_labels = format_dates(dates)
+    keys = pd.DataFrame({"ID": ids, "Date": date_labels})
+    in_file = np.zeros(len(raw), dtype=bool)
+    in_file[~rejected] = keys[~rejected].duplicated(keep="first").to_numpy()
+    problems["(ID, Date) repeats an earlier row of the file"] = in_file
+    stored = np.zeros(len(raw), dtype=bool)
+    stored[~rejected] = [
+        (int(patient_id), date) in index.by_visit for patient_id, date in zip(ids[~rejected], date_labels[~rejected])
+    ]
+    problems["this patient already has a visit on that Date, use Edit Patient"] = stored
+    rejected |= in_file | stored
+
+    accepted = pd.DataFrame({
+        "Date": date_labels,
+        "Staff": staff_text,
+        "Room": room_text,
+        "ID": ids.astype("Int64"),
+        "Appointment Type": appointment_text,
+        "Describe Appointment Type If Applicable": _text(raw["Describe Appointment Type If Applicable"]).fillna(""),
+    })
+    minutes = np.floor(seconds / 60)
+    for i, col in enumerate(TIME_COLUMNS):
+        accepted[col] = format_clock(pd.Series(minutes[:, i]).astype("Int16"))
+    accepted = accepted[~rejected].reset_index(drop=True)
+    accepted["ID"] = accepted["ID"].astype("int64")
+
+    return accepted, _report(upload, rejected, problems, violations, hours)
+
+
+def _report(upload, rejected, problems, violations, hours):
+    """The rejected rows of the upload with their file line (the header is line 1) and the reasons."""
+    reasons = np.full(rejected.sum(), "", dtype=object)
+    for reason, rows in problems.items():
+        hit = rows[rejected]
+        reasons[hit] = reasons[hit] + reason + "; "
+    # Timeline problems: one describe() per distinct violation mask, not per row.
+    masks, inverse = np.unique(violations[rejected], return_inverse=True)
+    timeline = np.array(["".join(f"{text}; " for text in describe(mask, hours)) for mask in masks], dtype=object)
+    reasons = reasons + timeline[inverse]
+
+    report = upload[rejected].copy()
+    report.insert(0, "Problems", [text.rstrip("; ") for text in reasons])
+    report.insert(0, "Line", np.flatnonzero(rejected) + 2)
+    return report.reset_index(drop=True)
@@ -0,0 +1,165 @@
+"""
+Hash index over the visit sheet.
+
+Looking a patient up used to scan the whole ID column (and the update path
+built the (ID, Date) mask twice more), and only the first visit ever came
+back. VisitIndex maps each patient ID to the row positions of all their
+visits and each (ID, Date) pair to its row, and is extended in place as rows
+are appended instead of being rebuilt.
+
+RecentVisits keeps the rows ordered newest first for the "Last 20 Entries"
+panel, so a page of recent visits no longer sorts the whole history.
+"""
+import bisect
+
+import numpy as np
+import pandas as pd
+
+
+def id_key(value):
+    """Normalizes an ID cell (int, float like 675.0, or string) to an int key, or None."""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def date_key(value):
+    """Normalizes a Date cell to the "MM/DD/YYYY" string the sheet stores."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%m/%d/%Y")
+    return str(value).strip()
+
+
+def _date_keys(dates):
+    """Vectorized date_key() over a column."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.strftime("%m/%d/%Y").astype(object).where(dates.notna(), None).to_numpy()
+    text = dates.astype(str).str.strip().astype(object)
+    return text.where(dates.notna(), None).to_numpy()
+
+
+class VisitIndex:
+    """
+    by_id:    patient ID -> list of row positions, oldest first
+    by_visit: (patient ID, "MM/DD/YYYY") -> row position of that visit
+
+    Positions are row numbers in the replica frame (which always has a
+    RangeIndex). If the same (ID, Date) appears twice, the first row wins,
+    matching what the edit form updates.
+    """
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_visit = {}
+        self.size = 0
+
+    @classmethod
+    def build(cls, frame):
+        index = cls()
+        index.extend(frame, start=0)
+        return index
+
+    def extend(self, rows, start=None):
+        """Indexes `rows`, which occupy positions start, start + 1, ... in the frame."""
+        if start is None:
+            start = self.size
+        if rows.empty or "ID" not in rows.columns:
+            self.size = start + len(rows)
+            return self
+
+        ids = pd.to_numeric(rows["ID"], errors="coerce")
+        valid = ids.notna().to_numpy()
+        keys = ids[valid].astype("int64").tolist()
+        positions = (start + np.flatnonzero(valid)).tolist()
+        dates = _date_keys(rows["Date"])[valid].tolist() if "Date" in rows.columns else [None] * len(keys)
+
+        by_id, by_visit = self.by_id, self.by_visit
+        for key, date, position in zip(keys, dates, positions):
+            by_id.setdefault(key, []).append(position)
+            by_visit.setdefault((key, date), position)
+        self.size = start + len(rows)
+        return self
+
+    def visits(self, patient_id):
+        """Row positions of every visit for a patient (empty list if unknown)."""
+        return self.by_id.get(id_key(patient_id), [])
+
+    def position(self, patient_id, date):
+        """Row position of one visit, or None."""
+        return self.by_visit.get((id_key(patient_id), date_key(date)))
+
+    def __contains__(self, patient_id):
+        return id_key(patient_id) in self.by_id
+
+
+def recency_keys(typed):
+    """
+    Sort key per row of a typed frame: day number * 1441 + Registration Start
+    minute + 1, so a later date always wins and, within a day, a later
+    registration wins. Missing dates sort oldest, missing times first in the day.
+    """
+    dates = typed["Date"]
+    days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    days[dates.isna().to_numpy()] = np.iinfo(np.int64).min // 2048
+    minutes = typed["Registration Start"].fillna(-1).to_numpy(dtype=np.int64) + 1
+    return days * 1441 + minutes
+
+
+class RecentVisits:
+    """
+    Row positions ordered from newest to oldest visit.
+
+    The bulk of the rows live in sorted NumPy arrays built once; rows added
+    afterwards go to a small sorted buffer (bisect insert). A page merges the
+    tail of the arrays with the buffer, so it costs O(page size + buffer),
+    not O(n log n). The buffer is folded into the arrays once it reaches
+    `buffer_limit` rows.
+    """
+
+    def __init__(self, buffer_limit=1024):
+        self.buffer_limit = buffer_limit
+        self._keys = np.empty(0, dtype=np.int64)
+        self._positions = np.empty(0, dtype=np.int64)
+        self._buffer = []
+
+    @classmethod
+    def build(cls, typed, **kwargs):
+        recent = cls(**kwargs)
+        keys = recency_keys(typed)
+        positions = np.arange(len(typed), dtype=np.int64)
+        # Ties (same day and minute) keep sheet order, so later rows count as newer.
+        order = np.lexsort((positions, keys))
+        recent._keys, recent._positions = keys[order], positions[order]
+        return recent
+
+    def __len__(self):
+        return len(self._keys) + len(self._buffer)
+
+    def extend(self, typed_rows, start):
+        """Adds typed rows occupying positions start, start + 1, ... in the frame."""
+        keys = recency_keys(typed_rows).tolist()
+        for offset, key in enumerate(keys):
+            bisect.insort(self._buffer, (key, start + offset))
+        if len(self._buffer) >= self.buffer_limit:
+            self._fold()
+        return self
+
+    def _fold(self):
+        keys, positions = zip(*self._buffer)
+        keys = np.concatenate([self._keys, np.asarray(keys, dtype=np.int64)])
+        positions = np.concatenate([self._positions, np.asarray(positions, dtype=np.int64)])
+        order = np.lexsort((positions, keys))
+        self._keys, self._positions = keys[order], positions[order]
+        self._buffer = []
+
+    def page(self, page=0, size=20):
+        """Row positions for page `page` (0 = newest), newest first."""
+        wanted = (page + 1) * size
+        tail = slice(max(len(self._keys) - wanted, 0), len(self._keys))
+        candidates = list(zip(self._keys[tail].tolist(), self._positions[tail].tolist()))
+        candidates += self._buffer[-wanted:]
+        candidates.sort(reverse=True)
+        return [position for _, position in candidates[page * size:wanted]]
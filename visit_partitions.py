@@ -0,0 +1,215 @@
+"""
+Month-partitioned copy of the dashboard frame, for filtered views.
+
+The full-history dashboard maps the whole Arrow cache. A filtered view (a
+week, one doctor) only needs a sliver of it, so VisitPartitions keeps the
+derived frame (see dashboard_data) as one Arrow IPC file per month in a
+folder next to the CSV, plus a manifest recording each month's row count,
+first and last Day, distinct Staff, Visit Type and Visit Category, and a
+digest of its rows (unchanged months keep theirs across rebuilds, see reports.py).
+read() pushes a VisitFilter down to that store:
+  - months outside the date range, or holding none of the selected Staff /
+    Visit Types / Visit Categories, are never opened;
+  - in the others, only the filtered columns are converted to test the
+    rows, and only the requested columns of the matching rows after that.
+
+    partitions = VisitPartitions("visits.csv")
+    week = VisitFilter(first="2025-03-03", last="2025-03-09", staff=("Jon Pierson",))
+    partitions.read(week, columns=PANEL_COLUMNS)
+
+The folder is rebuilt when the CSV or the pipeline version changes (the
+same key as columnar_cache). Without pyarrow, or where the folder cannot be
+written, read() filters the full frame in memory instead.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from columnar_cache import file_digest, source_stat
+from dashboard_data import DATA_FILE, PIPELINE_VERSION, load_visits
+
+try:
+    import pyarrow as pa
+except ImportError:  # partitions are an optimization; filter the whole frame instead
+    pa = None
+
+MANIFEST = "_manifest.json"
+# Bump when the manifest layout changes so existing folders are rebuilt.
+LAYOUT_VERSION = "2"
+UNDATED = "undated"
+# VisitFilter field -> the column it selects on
+FILTER_COLUMNS = {"staff": "Staff", "visit_types": "Visit Type", "categories": "Visit Category"}
+
+# Visits with first <= Day <= last (None: open-ended) and, for every non-empty
+# tuple, a Staff / Visit Type / Visit Category in it. Hashable, so it can key a cache.
+VisitFilter = namedtuple("VisitFilter", ["first", "last", "staff", "visit_types", "categories"],
+                         defaults=(None, None, (), (), ()))
+
+
+def partition_folder_for(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.parts")
+
+
+def rows_digest(rows):
+    """
+    SHA-256 (hex) of a frame's values in row order. It hashes values, not
+    the stored codes, so a category added elsewhere in the CSV leaves it as it was.
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def _mask(frame, filters):
+    """Rows of `frame` that pass `filters` (undated rows fail any date bound)."""
+    keep = np.ones(len(frame), dtype=bool)
+    if filters.first is not None:
+        keep &= (frame["Day"] >= pd.Timestamp(filters.first)).to_numpy()
+    if filters.last is not None:
+        keep &= (frame["Day"] <= pd.Timestamp(filters.last)).to_numpy()
+    for field, column in FILTER_COLUMNS.items():
+        values = getattr(filters, field)
+        if values:
+            keep &= frame[column].isin(values).to_numpy()
+    return keep
+
+
+class VisitPartitions:
+    """The dashboard frame of the CSV at `path`, one Arrow file per month in `folder`."""
+
+    def __init__(self, path=DATA_FILE, folder=None):
+        self.path = path
+        self.folder = folder or partition_folder_for(path)
+        self._frame = None  # the whole frame, when there are no partition files to read
+        self.manifest = self._open() if pa is not None else None
+
+    # ----------------- Store -----------------
+    def _file(self, month):
+        return os.path.join(self.folder, f"{month}.arrow")
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.folder, MANIFEST)) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        partial = os.path.join(self.folder, f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(partial, "w") as handle:
+            json.dump(manifest, handle)
+        os.replace(partial, os.path.join(self.folder, MANIFEST))  # written last: readers never see half a store
+
+    def _open(self):
+        """The manifest of an up-to-date folder, rebuilding the partitions if the CSV changed."""
+        key = {"tag": f"dashboard-{PIPELINE_VERSION}/{LAYOUT_VERSION}"}
+        key["size"], key["mtime"] = source_stat(self.path)
+        manifest = self._read_manifest()
+        fresh = manifest is not None and manifest.get("tag") == key["tag"]
+        if fresh and (manifest["size"], manifest["mtime"]) == (key["size"], key["mtime"]):
+            return manifest
+
+        key["digest"] = file_digest(self.path)
+        try:
+            if fresh and manifest["digest"] == key["digest"]:  # touched, not changed
+                manifest.update(key)
+                self._write_manifest(manifest)
+                return manifest
+            return self._write(load_visits(self.path), key)
+        except OSError:  # read-only deployment: filter in memory, rebuild next time
+            self._frame = load_visits(self.path)
+            return None
+
+    def _write(self, frame, key):
+        os.makedirs(self.folder, exist_ok=True)
+        partitions = {}
+        for month, rows in frame.groupby("Month", dropna=False, sort=True):
+            name = UNDATED if pd.isna(month) else f"{month:%Y-%m}"
+            table = pa.Table.from_pandas(rows, preserve_index=False)
+            partial = f"{self._file(name)}.{os.getpid()}.tmp"
+            with pa.OSFile(partial, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(partial, self._file(name))
+            dated = name != UNDATED
+            partitions[name] = {
+                "rows": len(rows),
+                "first": f"{rows['Day'].min():%Y-%m-%d}" if dated else None,
+                "last": f"{rows['Day'].max():%Y-%m-%d}" if dated else None,
+                **{column: sorted(map(str, rows[column].dropna().unique())) for column in FILTER_COLUMNS.values()},
+                "digest": rows_digest(rows),
+            }
+        for name in os.listdir(self.folder):
+            if name.endswith(".arrow") and name[:-6] not in partitions:
+                os.remove(os.path.join(self.folder, name))  # a month that no longer has visits
+        manifest = {**key, "columns": list(frame.columns), "partitions": partitions}
+        self._write_manifest(manifest)
+        return manifest
+
+    def _full_frame(self):
+        if self._frame is None:
+            self._frame = load_visits(self.path)
+        return self._frame
+
+    # ----------------- Queries -----------------
+    def bounds(self):
+        """First and last Day with visits."""
+        if self.manifest is None:
+            days = self._full_frame()["Day"]
+            return days.min(), days.max()
+        dated = [stats for stats in self.manifest["partitions"].values() if stats["first"] is not None]
+        return pd.Timestamp(min(s["first"] for s in dated)), pd.Timestamp(max(s["last"] for s in dated))
+
+    def values(self, column):
+        """Distinct values of Staff, Visit Type or Visit Category, sorted."""
+        if self.manifest is None:
+            return sorted(map(str, self._full_frame()[column].dropna().unique()))
+        return sorted({value for stats in self.manifest["partitions"].values() for value in stats[column]})
+
+    def partitions(self, filters):
+        """Months that can hold visits passing `filters`, judged from the manifest alone."""
+        first = None if filters.first is None else pd.Timestamp(filters.first)
+        last = None if filters.last is None else pd.Timestamp(filters.last)
+        months = []
+        for month, stats in self.manifest["partitions"].items():
+            if stats["first"] is None:
+                if first is not None or last is not None:
+                    continue
+            elif (last is not None and pd.Timestamp(stats["first"]) > last) or \
+                    (first is not None and pd.Timestamp(stats["last"]) < first):
+                continue
+            if any(getattr(filters, field) and not set(map(str, getattr(filters, field))) & set(stats[column])
+                   for field, column in FILTER_COLUMNS.items()):
+                continue
+            months.append(month)
+        return months
+
+    def read(self, filters=VisitFilter(), columns=None):
+        """The visits passing `filters`, with `columns` (default: all), month by month in date order."""
+        if self.manifest is None:
+            frame = self._full_frame()
+            frame = frame[_mask(frame, filters)].reset_index(drop=True)
+            return frame if columns is None else frame[list(columns)]
+
+        wanted = list(columns or self.manifest["columns"])
+        tested = ["Day"] + [column for field, column in FILTER_COLUMNS.items() if getattr(filters, field)]
+        frames = []
+        for month in self.partitions(filters):
+            with pa.memory_map(self._file(month)) as source:
+                table = pa.ipc.open_file(source).read_all()
+                keep = _mask(table.select(tested).to_pandas(), filters)
+                if keep.any():
+                    frames.append(table.filter(pa.array(keep)).select(wanted).to_pandas())
+        if not frames:
+            return self._empty(wanted)
+        return pd.concat(frames, ignore_index=True)
+
+    def _empty(self, columns):
+        """No rows, but the stored dtypes (so categoricals and nullable integers stay what they were)."""
+        month = next(iter(self.manifest["partitions"]), None)
+        if month is None:
+            return pd.DataFrame(columns=columns)
+        with pa.memory_map(self._file(month)) as source:
+            return pa.ipc.open_file(source).schema.empty_table().select(columns).to_pandas()
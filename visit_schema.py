@@ -0,0 +1,183 @@
+"""
+Typed schema for the visit sheet.
+
+The sheet stores every stage time as an "HH:MM" string and dates as
+"MM/DD/YYYY". to_typed() converts a whole frame once, vectorized: the 13 time
+columns become minutes since midnight (Int16, <NA> when missing), Staff, Room
+and Appointment Type become categoricals and Date a datetime64 column.
+to_sheet() turns a typed frame back into the exact values the sheet holds.
+
+The cleaned analytics CSV carries seconds ("09:03:30"), so the dashboard uses
+unit="second" (Int32 seconds since midnight) to keep its durations exact.
+"""
+from datetime import time
+
+import numpy as np
+import pandas as pd
+
+TIME_COLUMNS = [
+    "Registration Start", "Registration End", "Triage Start", "Triage End", "Time Roomed",
+    "Exam End", "Doctor In", "Doctor Out", "Lab Start", "Lab End", "SW Start", "SW End", "Time Out"
+]
+CATEGORY_COLUMNS = ["Staff", "Room", "Appointment Type"]
+# Every column of the sheet, in its order.
+SHEET_COLUMNS = [
+    "Date", "Staff", "Room", "ID", "Appointment Type", "Describe Appointment Type If Applicable"
+] + TIME_COLUMNS
+DATE_FORMAT = "%m/%d/%Y"
+
+# unit -> (dtype, seconds per unit)
+TIME_UNITS = {"minute": ("Int16", 60), "second": ("Int32", 1)}
+
+_MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object)
+_MINUTE_INDEX = pd.Index(_MINUTE_LABELS)
+# Trailing clock of "HH:MM", "H:MM:SS" or "YYYY-MM-DD HH:MM:SS".
+_CLOCK_PATTERN = r"(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$"
+
+
+# ----------------- Columns -----------------
+def _parse_clock_text(text):
+    """Seconds since midnight for a Series of distinct "HH:MM" / "H:MM:SS" strings (NaN if unparseable)."""
+    seconds = _MINUTE_INDEX.get_indexer(text).astype("float64") * 60
+    seconds[seconds < 0] = np.nan
+    rest = np.isnan(seconds) & text.notna().to_numpy() & (text != "").to_numpy()
+    if rest.any():
+        parts = text[rest].str.extract(_CLOCK_PATTERN).apply(pd.to_numeric).to_numpy(dtype="float64")
+        seconds[rest] = parts[:, 0] * 3600 + parts[:, 1] * 60 + np.nan_to_num(parts[:, 2])
+    seconds[(seconds < 0) | (seconds >= 24 * 3600)] = np.nan
+    return seconds
+
+
+def _clock_seconds(text):
+    """Seconds since midnight (float, NaN if unparseable) for a Series of distinct clock strings."""
+    text = text.astype("str").str.strip()
+    # Drop the date of full timestamps: the cleaned CSV has a distinct date on
+    # almost every value, but the clock part repeats and is parsed once.
+    text = text.str.replace(r"^.*\s", "", regex=True)
+    return _per_unique(text.reset_index(drop=True), _parse_clock_text, np.nan)
+
+
+def _per_unique(values, convert, missing):
+    """
+    Applies `convert` to the distinct values only and broadcasts the result
+    back. A clinic day has at most 1440 distinct minutes and one date, so
+    this turns a per-row parse into a hash pass plus a tiny parse.
+    """
+    codes, uniques = pd.factorize(values)
+    converted = np.append(np.asarray(convert(pd.Series(uniques))), missing)
+    return converted[codes]  # code -1 (missing) picks the trailing `missing`
+
+
+def parse_clock(values, unit="minute"):
+    """
+    Converts a column of clock times to integers since midnight.
+    Accepts "HH:MM" strings, "HH:MM:SS", full timestamps or datetime64
+    columns. Missing or unparseable values become <NA>.
+    """
+    values = pd.Series(values)
+    dtype, per_unit = TIME_UNITS[unit]
+
+    if pd.api.types.is_datetime64_any_dtype(values):
+        clock = values.dt
+        seconds = (clock.hour * 3600 + clock.minute * 60 + clock.second).astype("float64")
+    else:
+        seconds = pd.Series(_per_unique(values, _clock_seconds, np.nan), index=values.index)
+
+    return (seconds // per_unit).astype(dtype)
+
+
+def format_clock(values, unit="minute"):
+    """Inverse of parse_clock(): integers since midnight back to "HH:MM" (or "HH:MM:SS") strings."""
+    values = pd.Series(values)
+    missing = values.isna().to_numpy()
+    seconds = values.fillna(0).to_numpy(dtype=np.int64) * TIME_UNITS[unit][1]
+    if unit == "minute":
+        labels = _MINUTE_LABELS[seconds // 60]
+    else:
+        # Format each distinct second of the day once (at most 86400 of them).
+        distinct, inverse = np.unique(seconds, return_inverse=True)
+        labels = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in distinct], dtype=object)[inverse]
+    labels[missing] = None
+    return pd.Series(labels, index=values.index, dtype=object)
+
+
+def _parse_date_values(values):
+    dates = pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+    rest = dates.isna() & values.notna()
+    if rest.any():
+        dates[rest] = pd.to_datetime(values[rest], format="ISO8601", errors="coerce")
+    return dates
+
+
+def parse_dates(values):
+    """Sheet dates ("MM/DD/YYYY") or ISO dates to datetime64; anything else becomes NaT."""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    dates = _per_unique(values, _parse_date_values, np.datetime64("NaT"))
+    return pd.Series(dates, index=values.index)
+
+
+def format_dates(values):
+    """datetime64 column back to "MM/DD/YYYY" strings (None for NaT)."""
+    values = pd.Series(values)
+    labels = _per_unique(values, lambda dates: dates.dt.strftime(DATE_FORMAT).astype(object), None)
+    return pd.Series(labels, index=values.index, dtype=object)
+
+
+def minutes_to_time(value):
+    """One minute-of-day value to a datetime.time for st.time_input, or None if missing."""
+    if value is None or pd.isna(value):
+        return None
+    return time(int(value) // 60, int(value) % 60)
+
+
+# ----------------- Frames -----------------
+def to_typed(frame, unit="minute"):
+    """Converts a sheet-layout frame to compact dtypes in one vectorized pass. Returns a new frame."""
+    typed = frame.copy(deep=False)
+    if "Date" in typed.columns:
+        typed["Date"] = parse_dates(frame["Date"])
+    for col in TIME_COLUMNS:
+        if col in typed.columns:
+            typed[col] = parse_clock(frame[col], unit)
+    for col in CATEGORY_COLUMNS:
+        if col in typed.columns:
+            typed[col] = frame[col].astype("category")
+    return typed
+
+
+def to_sheet(typed, unit="minute"):
+    """Serializes a typed frame back to the sheet layout (dates and times as strings)."""
+    frame = typed.copy(deep=False)
+    if "Date" in frame.columns and pd.api.types.is_datetime64_any_dtype(frame["Date"]):
+        frame["Date"] = format_dates(frame["Date"])
+    for col in TIME_COLUMNS:
+        if col in frame.columns and pd.api.types.is_integer_dtype(frame[col]):
+            frame[col] = format_clock(frame[col], unit)
+    for col in CATEGORY_COLUMNS:
+        if col in frame.columns and isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+    return frame
+
+
+def concat_typed(frames):
+    """Concatenates typed frames, keeping categoricals categorical by unioning their categories."""
+    frames = [frame.copy(deep=False) for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    for col in CATEGORY_COLUMNS:
+        present = [frame for frame in frames if col in frame.columns]
+        if not present:
+            continue
+        try:
+            categories = pd.api.types.union_categoricals([frame[col] for frame in present]).categories
+        except TypeError:
+            # e.g. int rooms in one frame and string rooms in another
+            categories = pd.Index(pd.unique(np.concatenate(
+                [frame[col].cat.categories.astype(object) for frame in present]
+            )))
+        for frame in present:
+            if not frame[col].cat.categories.equals(categories):
+                frame[col] = frame[col].cat.set_categories(categories)  # recodes, no round trip through objects
+    return pd.concat(frames, ignore_index=True)
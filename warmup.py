@@ -0,0 +1,82 @@
+"""
+Boot-time pre-warming for the Streamlit apps.
+
+Both apps keep their expensive state in process-wide st.cache_resource
+singletons shared by every session: the intake app its clinics' stores,
+their SheetReplicas (parsed frame, indexes, counters) and batch writers; the
+dashboard its frame, cube, partitions, sketches, occupancy summaries and
+what-if flow profile. Normally the first browser session after a start pays
+for building them.
+
+Started through this module instead of `streamlit run`, the app script runs
+once without a browser session before the server accepts connections, so
+those singletons, and the modules they import, are ready for the first
+session:
+
+    python warmup.py clinic_dashboard.py
+    python warmup.py streamlit_app.py --server.port 8502
+
+Arguments after the script are passed on to `streamlit run`. During the
+headless run every widget returns its default and no button is pressed, so
+nothing is written. If it fails, the server still starts and the first
+session builds the singletons as usual.
+"""
+import logging
+import os
+import runpy
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Streamlit warns on every st.* call made outside a session; expected here.
+_QUIET_LOGGERS = ["streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.runtime.caching.cache_data_api"]
+
+
+def _errors_only(record):
+    return record.levelno >= logging.ERROR
+
+
+def prewarm(script):
+    """
+    Runs the app `script` once in this process without a session, filling its
+    st.cache_resource singletons. Returns the seconds it took (None if it failed).
+    """
+    script = os.path.abspath(script)
+    folder = os.path.dirname(script)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)  # as `streamlit run` does, for the app's own modules
+
+    for name in _QUIET_LOGGERS:
+        logging.getLogger(name).addFilter(_errors_only)
+    start = time.perf_counter()
+    try:
+        # Same module name as a session's run, so the cache keys match.
+        runpy.run_path(script, run_name="__main__")
+    except Exception:
+        logger.warning("Pre-warming %s failed; the first session will build its resources", script, exc_info=True)
+        return None
+    finally:
+        for name in _QUIET_LOGGERS:
+            logging.getLogger(name).removeFilter(_errors_only)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith("-"):
+        print(__doc__.strip().split("\n\n")[2], file=sys.stderr)
+        return 2
+    script, options = argv[0], argv[1:]
+    seconds = prewarm(script)
+    if seconds is not None:
+        print(f"Pre-warmed {script} in {seconds:.1f} s", file=sys.stderr)
+
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", script, *options]
+    return cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())